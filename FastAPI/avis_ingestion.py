@@ -0,0 +1,160 @@
+"""
+Import en masse des avis (JSONL)
+Les avis reçus (un objet JSON par ligne : product_uri, note, commentaire) sont
+regroupés en lots : chaque lot est réparti entre les processus du pool, puis écrit
+dans Fuseki par un seul INSERT DATA. Le scoring du lot suivant se fait pendant
+l'écriture du lot courant. Le rapport indique le débit et les erreurs par lot.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+from collections import Counter
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional
+from uuid import uuid4
+from sparql_client import SparqlClient, sparql_client, sparql_literal
+from sentiment_pool import SentimentPool
+from dashboard_views import DashboardViews, dashboard_views, SENTIMENT_TYPES
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+# Nombre d'avis par lot (scoring et INSERT DATA)
+BULK_CHUNK_SIZE = int(os.getenv("AVIS_BULK_CHUNK_SIZE", "500"))
+# Nombre maximal de lignes en erreur détaillées dans le rapport
+MAX_REPORTED_ERRORS = 100
+
+# IRI sans caractères interdits (évite l'injection dans la requête)
+_IRI = re.compile(r'^[^\s<>"{}|\\^`]+$')
+
+
+def _parse_line(line: bytes) -> Dict:
+    """Valide une ligne JSONL et retourne l'avis normalisé (ValueError si invalide)"""
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("objet JSON attendu")
+    product_uri = str(data.get("product_uri", "")).strip().strip("<>")
+    if not product_uri or not _IRI.match(product_uri):
+        raise ValueError("product_uri invalide")
+    note = float(data.get("note"))
+    if not 0 <= note <= 5:
+        raise ValueError("note hors de l'intervalle [0, 5]")
+    commentaire = data.get("commentaire")
+    if not isinstance(commentaire, str):
+        raise ValueError("commentaire manquant")
+    return {"product_uri": product_uri, "note": note, "commentaire": commentaire}
+
+
+async def _iter_lines(body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Découpe le corps de la requête en lignes au fil de la réception"""
+    buffer = b""
+    async for chunk in body:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+    if buffer:
+        yield buffer
+
+
+class AvisIngestion:
+    def __init__(self, pool: SentimentPool, client: SparqlClient = sparql_client,
+                 views: DashboardViews = dashboard_views, chunk_size: int = BULK_CHUNK_SIZE):
+        self.pool = pool
+        self.client = client
+        self.views = views
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _insert_query(avis: List[Dict], sentiments: List[str]) -> str:
+        triples = []
+        for item, sentiment in zip(avis, sentiments):
+            avis_uri = item["avis_uri"]
+            triples.append(
+                f"<{avis_uri}> a <{SENTIMENT_TYPES[sentiment]}> ; "
+                f"ns:aNote \"{format(Decimal(str(item['note'])), 'f')}\"^^xsd:decimal ; "
+                f"ns:aCommentaire {sparql_literal(item['commentaire'])}^^xsd:string ; "
+                f"ns:aAvisProduit <{item['product_uri']}> ."
+            )
+        return f"""
+        PREFIX ns: <{NS}>
+        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+        INSERT DATA {{
+            {chr(10).join(triples)}
+        }}
+        """
+
+    async def _write_chunk(self, number: int, avis: List[Dict], scoring: asyncio.Future, report: Dict) -> None:
+        lines = [avis[0]["line"], avis[-1]["line"]]
+        try:
+            sentiments = await scoring
+            await self.client.update(self._insert_query(avis, sentiments))
+        except Exception as e:
+            report["failed"] += len(avis)
+            report["chunk_errors"].append({"chunk": number, "lines": lines, "count": len(avis), "error": str(e)})
+            return
+        for item, sentiment in zip(avis, sentiments):
+            self.views.avis_written(item["avis_uri"], sentiment=sentiment, note=item["note"])
+        report["inserted"] += len(avis)
+        report["sentiments"].update(sentiments)
+
+    async def ingest(self, body: AsyncIterator[bytes]) -> Dict:
+        """
+        Importe un flux JSONL d'avis.
+
+        Args:
+            body: Le corps de la requête, reçu par morceaux
+
+        Returns:
+            Le rapport : avis reçus, insérés, en erreur, lignes invalides, erreurs par
+            lot et débit (avis insérés par seconde)
+        """
+        start = time.perf_counter()
+        report = {
+            "received": 0, "inserted": 0, "failed": 0, "invalid": 0, "chunks": 0,
+            "sentiments": Counter(), "invalid_lines": [], "chunk_errors": []
+        }
+        pending: Optional[asyncio.Task] = None
+        chunk: List[Dict] = []
+
+        async def flush():
+            nonlocal pending, chunk
+            report["chunks"] += 1
+            # Le scoring démarre tout de suite, sur tous les processus du pool ;
+            # l'écriture attend celle du lot précédent
+            scoring = asyncio.ensure_future(self.pool.score_spread([item["commentaire"] for item in chunk]))
+            if pending is not None:
+                await pending
+            pending = asyncio.create_task(self._write_chunk(report["chunks"], chunk, scoring, report))
+            chunk = []
+
+        line_number = 0
+        async for line in _iter_lines(body):
+            line_number += 1
+            if not line.strip():
+                continue
+            report["received"] += 1
+            try:
+                item = _parse_line(line)
+            except (ValueError, TypeError) as e:
+                report["invalid"] += 1
+                if len(report["invalid_lines"]) < MAX_REPORTED_ERRORS:
+                    report["invalid_lines"].append({"line": line_number, "error": str(e)})
+                continue
+            item["line"] = line_number
+            item["avis_uri"] = f"{NS}Avis_{uuid4()}"
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                await flush()
+        if chunk:
+            await flush()
+        if pending is not None:
+            await pending
+
+        duration = time.perf_counter() - start
+        report["sentiments"] = dict(report["sentiments"])
+        report["duration_s"] = round(duration, 3)
+        report["avis_per_second"] = round(report["inserted"] / duration, 1) if duration > 0 else 0.0
+        return report
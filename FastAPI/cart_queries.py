@@ -3,29 +3,26 @@ SPARQL Queries for Cart (Panier) Operations
 This module contains all SPARQL queries related to cart management
 """
 
-from SPARQLWrapper import SPARQLWrapper, JSON
 from typing import Dict, List, Optional
+from sparql_client import SparqlClient, sparql_client
+import hashlib
 import uuid
 from datetime import datetime
 
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
 class CartQueries:
-    def __init__(self, sparql_endpoint: str = "http://localhost:3030/SmartCom"):
-        self.sparql_endpoint = sparql_endpoint
-        self.query_endpoint = f"{sparql_endpoint}/query"
-        self.update_endpoint = f"{sparql_endpoint}/update"
+    def __init__(self, client: SparqlClient = sparql_client):
+        self.client = client
         
-    def _execute_query(self, query: str, is_update: bool = False):
+    async def _execute_query(self, query: str, is_update: bool = False, touches: Optional[List[str]] = None):
         """Execute SPARQL query or update"""
         try:
-            sparql = SPARQLWrapper(self.update_endpoint if is_update else self.query_endpoint)
-            sparql.setQuery(query)
-            
             if is_update:
-                sparql.setMethod('POST')
-                return sparql.query()
+                await self.client.update(query, touches=touches)
+                return True
             else:
-                sparql.setReturnFormat(JSON)
-                results = sparql.query().convert()
+                results = await self.client.query(query)
                 
                 # Handle ASK queries differently
                 if "boolean" in results:
@@ -36,7 +33,7 @@ class CartQueries:
             print(f"SPARQL Error: {e}")
             return None
 
-    def get_cart_items(self, client_id: int = 1) -> List[Dict]:
+    async def get_cart_items(self, client_id: int = 1) -> List[Dict]:
         """Get all items in the cart for a specific client with quantities"""
         cart_uri = f"ns:Panier_Client{client_id}"  # Use single cart per client
         
@@ -47,7 +44,7 @@ class CartQueries:
         
         SELECT ?produit ?quantity
                (SAMPLE(?description) AS ?desc) 
-               (SAMPLE(?prix) AS ?price) 
+               (SAMPLE(?prixUnitaire) AS ?price) 
                (SAMPLE(?image) AS ?img) 
                (SAMPLE(?marque) AS ?brand) 
                (SAMPLE(?categorie) AS ?cat)
@@ -56,8 +53,8 @@ class CartQueries:
                      ns:refersToProduct ?produit ;
                      ns:hasQuantity ?quantity .
             
+            OPTIONAL {{ ?cartItem ns:aPrixUnitaire ?prixUnitaire }}
             OPTIONAL {{ ?produit ns:aDescription ?description }}
-            OPTIONAL {{ ?produit ns:aPrix ?prix }}
             OPTIONAL {{ ?produit ns:aImage ?image }}
             OPTIONAL {{ ?produit ns:aProduitMarque ?marque }}
             OPTIONAL {{ ?produit ns:aSousCatégorie ?categorie }}
@@ -67,7 +64,7 @@ class CartQueries:
         
         print(f"Cart items query: {query}")
         
-        results = self._execute_query(query)
+        results = await self._execute_query(query)
         print(f"Cart items results: {results}")
         
         items = []
@@ -88,38 +85,48 @@ class CartQueries:
         print(f"Total unique items found: {len(items)}")
         return items
 
-    def get_cart_summary(self, client_id: int) -> dict:
-        """Get cart summary (total items and amount)"""
+    @staticmethod
+    def summarize_items(items: List[Dict]) -> dict:
+        """Compute cart totals from already fetched cart items (no extra query)"""
+        total_items = sum(item["quantity"] for item in items)
+        total_amount = sum(item["quantity"] * item["price"] for item in items)
+        return {"totalItems": total_items, "totalAmount": float(total_amount)}
+
+    async def get_cart_summary(self, client_id: int) -> dict:
+        """Get cart summary (total items and amount) from the CartItem price snapshots"""
         cart_uri = f"ns:Panier_Client{client_id}"  # Use single cart per client
         
         print(f"Getting cart summary for client {client_id}, cart: {cart_uri}")
         
+        # Single-pattern scans over the cart items, no join against the products:
+        # items created before the price snapshot are backfilled at startup
+        # (reprice_cart_items(missing_only=True)); an unpriced item counts at 0,
+        # as in get_cart_items
         query = f"""
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT (SUM(?quantity) AS ?totalItems) (SUM(?quantity * ?prix) AS ?totalAmount) WHERE {{
+        SELECT ?cartItem ?quantity ?prixUnitaire WHERE {{
             ?cartItem ns:inCart {cart_uri} ;
-                     ns:refersToProduct ?produit ;
                      ns:hasQuantity ?quantity .
-            ?produit ns:aPrix ?prix .
+            OPTIONAL {{ ?cartItem ns:aPrixUnitaire ?prixUnitaire }}
         }}
         """
         
         print(f"Cart summary query: {query}")
         
-        results = self._execute_query(query)
-        print(f"Cart summary results: {results}")
-        
-        if results and len(results) > 0:
-            total_items = int(results[0]["totalItems"]["value"]) if results[0]["totalItems"]["value"] else 0
-            total_amount = float(results[0]["totalAmount"]["value"]) if results[0]["totalAmount"]["value"] else 0.0
-            print(f"Parsed summary - Items: {total_items}, Amount: {total_amount}")
-            return {"totalItems": total_items, "totalAmount": total_amount}
-        
-        print("No results found, returning zeros")
-        return {"totalItems": 0, "totalAmount": 0.0}
+        results = await self._execute_query(query)
+        items = [
+            {
+                "quantity": int(result["quantity"]["value"]),
+                "price": float(result["prixUnitaire"]["value"]) if result.get("prixUnitaire") else 0
+            }
+            for result in results or []
+        ]
+        summary = self.summarize_items(items)
+        print(f"Parsed summary - Items: {summary['totalItems']}, Amount: {summary['totalAmount']}")
+        return summary
 
-    def add_to_cart(self, client_id: int, product_uri: str, quantity: int = 1) -> bool:
-        """Add a product to the cart with specified quantity"""
+    async def add_to_cart(self, client_id: int, product_uri: str, quantity: int = 1) -> bool:
+        """Add a product to the cart with specified quantity (single atomic update)"""
         client_uri = f"ns:Client{client_id}"
         cart_uri = f"ns:Panier_Client{client_id}"  # Use single cart per client
         
@@ -134,107 +141,88 @@ class CartQueries:
         
         print(f"Formatted product URI: {product_uri}")
         
-        # First, get product price for cart amount calculation
-        price_query = f"""
+        # Deterministic CartItem id per (client, product): concurrent adds converge on the same item
+        full_product_uri = NS + product_uri[3:] if product_uri.startswith('ns:') else product_uri.strip('<>')
+        new_item_uri = f"ns:CartItem_{client_id}_{hashlib.md5(full_product_uri.encode('utf-8')).hexdigest()[:8]}"
+        
+        # Create the cart if needed and upsert the item quantity in one request.
+        # Fuseki runs each update request in a single write transaction, so two
+        # concurrent adds for the same product are serialized instead of racing.
+        # The product price is snapshotted on the item the first time it is added.
+        upsert_query = f"""
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?prix WHERE {{
-            {product_uri} ns:aPrix ?prix .
+        DELETE {{
+            ?cartItem ns:hasQuantity ?currentQuantity .
         }}
-        """
-        print(f"Price query: {price_query}")
-        price_results = self._execute_query(price_query)
-        print(f"Price results: {price_results}")
-        product_price = 0
-        if price_results and len(price_results) > 0:
-            product_price = float(price_results[0]["prix"]["value"])
-        print(f"Product price: {product_price}")
-
-        # Check if cart already exists, if not create it
-        cart_check_query = f"""
-        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        ASK WHERE {{
-            {client_uri} ns:aPasseCommande {cart_uri} .
+        INSERT {{
             {cart_uri} a ns:Panier .
+            {client_uri} ns:aPasseCommande {cart_uri} .
+            {cart_uri} ns:aContientProduit {product_uri} .
+            ?cartItem a ns:CartItem ;
+                     ns:refersToProduct {product_uri} ;
+                     ns:inCart {cart_uri} ;
+                     ns:hasQuantity ?newQuantity ;
+                     ns:aPrixUnitaire ?unitPrice .
         }}
-        """
-        print(f"Cart check query: {cart_check_query}")
-        cart_exists = self._execute_query(cart_check_query)
-        print(f"Cart exists result: {cart_exists}")
-        
-        if not cart_exists or not cart_exists.get('boolean', False):
-            print("Creating new cart...")
-            # Create cart if it doesn't exist
-            create_cart_query = f"""
-            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-            INSERT DATA {{
-                {cart_uri} a ns:Panier .
-                {client_uri} ns:aPasseCommande {cart_uri} .
+        WHERE {{
+            OPTIONAL {{
+                ?existingItem ns:inCart {cart_uri} ;
+                             ns:refersToProduct {product_uri} ;
+                             ns:hasQuantity ?currentQuantity .
+                OPTIONAL {{ ?existingItem ns:aPrixUnitaire ?snapshotPrice . }}
             }}
-            """
-            print(f"Create cart query: {create_cart_query}")
-            create_result = self._execute_query(create_cart_query, is_update=True)
-            print(f"Create cart result: {create_result}")
+            OPTIONAL {{ {product_uri} ns:aPrix ?productPrice . }}
+            BIND(COALESCE(?existingItem, {new_item_uri}) AS ?cartItem)
+            BIND(COALESCE(?currentQuantity, 0) + {quantity} AS ?newQuantity)
+            BIND(COALESCE(?snapshotPrice, ?productPrice) AS ?unitPrice)
+        }}
+        """
+        print(f"Add to cart query: {upsert_query}")
+        
+        result = await self._execute_query(upsert_query, is_update=True)
+        print(f"Add to cart result: {result}")
+        return result is not None
 
-        # Add product to cart with quantity as a property
-        print(f"Adding product to cart with quantity {quantity}...")
+    async def reprice_cart_items(self, product_uri: Optional[str] = None, missing_only: bool = False) -> bool:
+        """Refresh the unit price snapshot of cart items from the current product price
         
-        # Check if product already exists in cart
-        check_query = f"""
+        Args:
+            product_uri: Only reprice items of this product (all products if None)
+            missing_only: Only fill items that have no snapshot yet (backfill)
+        """
+        product_filter = ""
+        if product_uri:
+            if not product_uri.startswith('<') and not product_uri.startswith('ns:'):
+                product_uri = f"<{product_uri}>" if product_uri.startswith('http://') else f"ns:{product_uri}"
+            product_filter = f"VALUES ?produit {{ {product_uri} }}"
+        snapshot_pattern = (
+            "FILTER NOT EXISTS { ?cartItem ns:aPrixUnitaire ?anyPrice . }" if missing_only
+            else "OPTIONAL { ?cartItem ns:aPrixUnitaire ?oldPrice . }"
+        )
+        
+        reprice_query = f"""
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?cartItem ?currentQuantity WHERE {{
-            ?cartItem ns:inCart {cart_uri} ;
-                     ns:refersToProduct {product_uri} ;
-                     ns:hasQuantity ?currentQuantity .
+        DELETE {{
+            ?cartItem ns:aPrixUnitaire ?oldPrice .
+        }}
+        INSERT {{
+            ?cartItem ns:aPrixUnitaire ?prix .
+        }}
+        WHERE {{
+            {product_filter}
+            ?cartItem a ns:CartItem ;
+                     ns:refersToProduct ?produit .
+            ?produit ns:aPrix ?prix .
+            {snapshot_pattern}
         }}
         """
         
-        print(f"Check existing product query: {check_query}")
-        existing_results = self._execute_query(check_query)
-        print(f"Existing product results: {existing_results}")
+        print(f"Reprice cart items query: {reprice_query}")
         
-        if existing_results and len(existing_results) > 0:
-            # Product exists, update quantity
-            existing_item = existing_results[0]["cartItem"]["value"]
-            current_qty = int(existing_results[0]["currentQuantity"]["value"])
-            new_qty = current_qty + quantity
-            
-            update_query = f"""
-            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-            DELETE {{
-                <{existing_item}> ns:hasQuantity {current_qty} .
-            }}
-            INSERT {{
-                <{existing_item}> ns:hasQuantity {new_qty} .
-            }}
-            WHERE {{
-                <{existing_item}> ns:hasQuantity {current_qty} .
-            }}
-            """
-            print(f"Update quantity query: {update_query}")
-            result = self._execute_query(update_query, is_update=True)
-            print(f"Update result: {result}")
-            return result is not None
-        else:
-            # Product doesn't exist, create new cart item
-            item_id = f"CartItem_{uuid.uuid4().hex[:8]}"
-            
-            insert_query = f"""
-            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-            INSERT DATA {{
-                {cart_uri} ns:aContientProduit {product_uri} .
-                ns:{item_id} a ns:CartItem ;
-                           ns:refersToProduct {product_uri} ;
-                           ns:inCart {cart_uri} ;
-                           ns:hasQuantity {quantity} .
-            }}
-            """
-            print(f"Insert new product query: {insert_query}")
-            
-            result = self._execute_query(insert_query, is_update=True)
-            print(f"Insert result: {result}")
-            return result is not None
+        result = await self._execute_query(reprice_query, is_update=True)
+        return result is not None
 
-    def remove_from_cart(self, client_id: int, product_uri: str) -> bool:
+    async def remove_from_cart(self, client_id: int, product_uri: str) -> bool:
         """Remove a product from the cart"""
         client_uri = f"ns:Client{client_id}"
         cart_uri = f"ns:Panier_Client{client_id}"  # Use single cart per client
@@ -253,10 +241,10 @@ class CartQueries:
         }}
         """
         
-        result = self._execute_query(delete_query, is_update=True)
+        result = await self._execute_query(delete_query, is_update=True)
         return result is not None
 
-    def update_cart_quantity(self, client_id: int, product_uri: str, new_quantity: int) -> bool:
+    async def update_cart_quantity(self, client_id: int, product_uri: str, new_quantity: int) -> bool:
         """Update the quantity of a product in the cart"""
         if new_quantity < 1:
             return False
@@ -290,17 +278,17 @@ class CartQueries:
         
         print(f"Update quantity query: {update_query}")
         
-        result = self._execute_query(update_query, is_update=True)
+        result = await self._execute_query(update_query, is_update=True)
         print(f"Update quantity result: {result}")
         
         return result is not None
 
-    def clear_cart(self, client_id: int) -> bool:
+    async def clear_cart(self, client_id: int) -> bool:
         """Clear all items from the cart"""
         client_uri = f"ns:Client{client_id}"
         cart_uri = f"ns:Panier_Client{client_id}"  # Use single cart per client
 
-    def clear_cart(self, client_id: int) -> bool:
+    async def clear_cart(self, client_id: int) -> bool:
         """Clear all items from the cart for a specific client"""
         cart_uri = f"ns:Panier_Client{client_id}"
         
@@ -315,12 +303,12 @@ class CartQueries:
         }}
         """
         
-        return self._execute_query(query, is_update=True)
+        return await self._execute_query(query, is_update=True, touches=["ns:CartItem"])
 
-    def create_order_from_cart(self, client_id: int) -> Dict:
+    async def create_order_from_cart(self, client_id: int) -> Dict:
         """Convert cart to order (Commande)"""
         # Get cart summary first
-        cart_summary = self.get_cart_summary(client_id)
+        cart_summary = await self.get_cart_summary(client_id)
         
         if cart_summary["totalItems"] == 0:
             return {"success": False, "message": "Cart is empty"}
@@ -348,11 +336,11 @@ class CartQueries:
         """
         
         # Execute order creation
-        order_result = self._execute_query(insert_order_query, is_update=True)
+        order_result = await self._execute_query(insert_order_query, is_update=True)
         
         if order_result is not None:
             # Clear cart after successful order creation
-            self.clear_cart(client_id)
+            await self.clear_cart(client_id)
             return {
                 "success": True, 
                 "order_id": order_id,
@@ -360,4 +348,31 @@ class CartQueries:
                 "total_items": cart_summary["totalItems"]
             }
         
-        return {"success": False, "message": "Failed to create order"}
\ No newline at end of file
+        return {"success": False, "message": "Failed to create order"}
+
+
+# Concurrency check against a local Fuseki (for development)
+if __name__ == "__main__":
+    import asyncio
+
+    TEST_CLIENT_ID = 999
+    TEST_PRODUCT = f"{NS}Produit_Test_Concurrence"
+    PARALLEL_ADDS = 20
+
+    async def run_concurrency_check():
+        cart = CartQueries()
+        await cart.clear_cart(TEST_CLIENT_ID)
+        results = await asyncio.gather(*(
+            cart.add_to_cart(TEST_CLIENT_ID, TEST_PRODUCT, 1) for _ in range(PARALLEL_ADDS)
+        ))
+        items = await cart.get_cart_items(TEST_CLIENT_ID)
+        await cart.clear_cart(TEST_CLIENT_ID)
+        
+        print("=== ADD-TO-CART CONCURRENCY CHECK ===")
+        print(f"Parallel adds: {PARALLEL_ADDS}, successful: {sum(1 for r in results if r)}")
+        print(f"Cart items: {len(items)}, quantity: {items[0]['quantity'] if items else 0}")
+        assert len(items) == 1, "duplicate CartItems created"
+        assert items[0]["quantity"] == PARALLEL_ADDS, "lost quantity updates"
+        print("OK")
+
+    asyncio.run(run_concurrency_check())
@@ -1,15 +1,13 @@
-from fastapi import APIRouter
-from SPARQLWrapper import SPARQLWrapper, JSON
+from fastapi import APIRouter, Query
 from pydantic import BaseModel, Field
+from sparql_client import sparql_client
+from directory_index import client_directory
+from pagination import Keyset, page_size, MAX_PAGE_SIZE
 from typing import Optional
 
 # Créer un router pour les clients
 router = APIRouter()
 
-# Configurations de connexion à Fuseki
-sparql_query = SPARQLWrapper("http://localhost:3030/SmartCom/query")
-sparql_update = SPARQLWrapper("http://localhost:3030/SmartCom/update")
-
 # ==================== MODÈLES PYDANTIC ====================
 
 class ClientInput(BaseModel):
@@ -27,30 +25,41 @@ class ClientUpdate(BaseModel):
     email: Optional[str] = None
     pays: Optional[str] = None
 
+# Ordre de pagination de la liste des clients (un client ajouté deux fois a
+# plusieurs valeurs par propriété : une ligne par combinaison, toutes dans la clé)
+CLIENTS_KEYSET = Keyset(("client", False), ("email", False), ("telephone", False), ("adresse", False),
+                        ("pays", False))
+
 # ==================== ENDPOINTS ====================
 
 # 1. READ ALL - Lire tous les clients
 @router.get("/clients")
-async def get_clients():
-    """Récupérer la liste de tous les clients"""
-    query = """
-        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?client ?adresse ?telephone ?email ?pays
-        WHERE {
-            ?client a ns:Client .
-            OPTIONAL { ?client ns:aAdresse ?adresse . }
-            OPTIONAL { ?client ns:aTéléphone ?telephone . }
-            OPTIONAL { ?client ns:aEmail ?email . }
-            OPTIONAL { ?client ns:aPays ?pays . }
-        }
-    """
-    
-    print("Générée SPARQL Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
+async def get_clients(limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                      cursor: Optional[str] = None):
+    """Récupérer la liste de tous les clients (paginée si limit ou cursor est fourni)"""
+    size = page_size(limit, cursor)
     try:
-        results = sparql_query.query().convert()
-        return {"clients": results["results"]["bindings"]}
+        query = f"""
+            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+            SELECT ?client ?adresse ?telephone ?email ?pays
+            WHERE {{
+                ?client a ns:Client .
+                {CLIENTS_KEYSET.filter(cursor)}
+                OPTIONAL {{ ?client ns:aAdresse ?adresse . }}
+                OPTIONAL {{ ?client ns:aTéléphone ?telephone . }}
+                OPTIONAL {{ ?client ns:aEmail ?email . }}
+                OPTIONAL {{ ?client ns:aPays ?pays . }}
+            }}
+            {CLIENTS_KEYSET.modifiers(size) if size else ""}
+        """
+        
+        print("Générée SPARQL Query:", query)
+        results = await sparql_client.query(query)
+        bindings = results["results"]["bindings"]
+        if size is None:
+            return {"clients": bindings}
+        rows, next_cursor = CLIENTS_KEYSET.page(bindings, size)
+        return {"clients": rows, "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
@@ -76,10 +85,9 @@ async def add_client(client: ClientInput):
     """
     
     print("Générée SPARQL Insert Query:", insert_query)
-    sparql_update.setQuery(insert_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(insert_query)
+        client_directory.written(client_uri, create=True, adresse=client.adresse, pays=client.pays)
         return {"message": "Client ajouté avec succès", "client_uri": client_uri}
     except Exception as e:
         return {"error": str(e)}
@@ -101,10 +109,8 @@ async def get_client(client_uri: str):
     """
     
     print("Générée SPARQL Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(query)
         return {"client": results["results"]["bindings"]}
     except Exception as e:
         return {"error": str(e)}
@@ -156,10 +162,9 @@ async def update_client(client: ClientUpdate):
     """
     
     print("Générée SPARQL Update Query:", update_query)
-    sparql_update.setQuery(update_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(update_query)
+        client_directory.written(client.client_uri, adresse=client.adresse, pays=client.pays)
         return {"message": "Client modifié avec succès"}
     except Exception as e:
         return {"error": str(e)}
@@ -176,10 +181,9 @@ async def delete_client(client_uri: str):
     """
     
     print("Générée SPARQL Delete Query:", delete_query)
-    sparql_update.setQuery(delete_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(delete_query, touches=["ns:Client"])
+        client_directory.deleted(client_uri)
         return {"message": "Client supprimé avec succès"}
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,352 @@
+"""
+Vues matérialisées des tableaux de bord
+Les compteurs des tableaux de bord (avis par type, produits par catégorie et
+par marque, statistiques du stock) sont calculés une fois au démarrage, puis
+tenus à jour en mémoire par les endpoints d'écriture, qui appliquent le delta
+de chaque modification. Une réconciliation périodique recalcule les vues
+depuis Fuseki pour corriger toute dérive (écriture externe, échec partiel).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Optional
+from sparql_client import SparqlClient, sparql_client, binding_value
+
+logger = logging.getLogger(__name__)
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+# Intervalle de réconciliation avec Fuseki (secondes)
+RECONCILE_INTERVAL = float(os.getenv("DASHBOARD_RECONCILE_INTERVAL", "300"))
+
+# Classe d'avis -> clé du tableau de bord
+AVIS_TYPES = {
+    NS + "Avis_positif": "positive",
+    NS + "Avis_négatif": "negative",
+    NS + "Avis": "neutral"
+}
+SENTIMENT_TYPES = {"positive": NS + "Avis_positif", "negative": NS + "Avis_négatif", "neutral": NS + "Avis"}
+
+PRODUCTS_QUERY = """
+    PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+    SELECT ?produit ?categorie ?marque ?prix ?stock
+    WHERE {
+        ?produit a ns:Produit .
+        OPTIONAL { ?produit ns:aSousCatégorie ?categorie . }
+        OPTIONAL { ?produit ns:aProduitMarque ?marque . }
+        OPTIONAL { ?produit ns:aPrix ?prix . }
+        OPTIONAL { ?produit ns:aStockDisponible ?stock . }
+    }
+"""
+
+AVIS_QUERY = """
+    PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+    SELECT ?avis ?type ?note
+    WHERE {
+        VALUES ?type { ns:Avis_positif ns:Avis_négatif ns:Avis }
+        ?avis a ?type .
+        ?avis ns:aNote ?note .
+    }
+"""
+
+
+def _uri(value: Optional[str]) -> Optional[str]:
+    """Forme complète d'une URI (sans chevrons, préfixe ns: développé)"""
+    if value is None:
+        return None
+    value = value.strip().strip("<>")
+    return NS + value[3:] if value.startswith("ns:") else value
+
+
+def _number(value, cast, default):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class _Counters:
+    """Compteurs agrégés, mis à jour par ajout/retrait de la contribution d'une entité"""
+
+    def __init__(self):
+        self.avis = Counter()
+        self.notes = Counter()
+        self.categories = Counter()
+        self.brands = Counter()
+        self.stock = Counter()
+
+    def apply_product(self, product: Optional[Dict], sign: int) -> None:
+        if product is None:
+            return
+        # Un produit de plusieurs catégories (ou marques) compte dans chacune, comme
+        # le COUNT des requêtes d'origine ; prix et stock ne sont comptés qu'une fois
+        for categorie in product["categories"]:
+            self.categories[categorie] += sign
+        for marque in product["marques"]:
+            self.brands[marque] += sign
+        stock = product["stock"]
+        self.stock["total_produits"] += sign
+        self.stock["stock_total"] += sign * stock
+        self.stock["produits_en_stock"] += sign * (stock > 0)
+        self.stock["produits_rupture"] += sign * (stock == 0)
+        self.stock["valeur_stock"] += sign * stock * product["prix"]
+
+    def apply_avis(self, avis: Optional[Dict], sign: int) -> None:
+        if avis is None:
+            return
+        # Un avis portant plusieurs classes compte une fois par classe (comme la requête d'origine)
+        for avis_type in avis["types"]:
+            key = AVIS_TYPES[avis_type]
+            self.avis[key] += sign
+            self.notes[key] += sign * avis["note"]
+
+    def snapshot(self) -> Dict:
+        return {
+            "avis": {k: v for k, v in self.avis.items() if v},
+            "categories": {k: v for k, v in self.categories.items() if v},
+            "brands": {k: v for k, v in self.brands.items() if v},
+            "stock": {k: round(v, 2) for k, v in self.stock.items() if v}
+        }
+
+
+class DashboardViews:
+    def __init__(self, client: SparqlClient = sparql_client, reconcile_interval: float = RECONCILE_INTERVAL):
+        self.client = client
+        self.reconcile_interval = reconcile_interval
+        self.ready = False
+        self._products: Dict[str, Dict] = {}
+        self._avis: Dict[str, Dict] = {}
+        self._counters = _Counters()
+        # Entités modifiées pendant une réconciliation en cours (uri -> supprimée ?) :
+        # leur état en mémoire est plus récent que celui lu depuis Fuseki
+        self._dirty: Optional[Dict[str, bool]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.reconciliations = 0
+        self.drift_corrections = 0
+        self.last_reconcile: Optional[float] = None
+
+    # ==================== CHARGEMENT / RÉCONCILIATION ====================
+
+    async def _load(self):
+        """Lit l'état des produits et des avis depuis Fuseki, ligne par ligne"""
+        products: Dict[str, Dict] = {}
+        async for row in self.client.stream(PRODUCTS_QUERY):
+            # Une ligne par combinaison de valeurs : catégories et marques sont cumulées
+            product = products.get(row["produit"]["value"])
+            if product is None:
+                product = products[row["produit"]["value"]] = {
+                    "categories": [],
+                    "marques": [],
+                    "prix": _number(binding_value(row.get("prix")), float, 0.0),
+                    "stock": _number(binding_value(row.get("stock")), int, 0)
+                }
+            for key, var in (("categories", "categorie"), ("marques", "marque")):
+                value = row.get(var, {}).get("value")
+                if value and value not in product[key]:
+                    product[key].append(value)
+        avis: Dict[str, Dict] = {}
+        async for row in self.client.stream(AVIS_QUERY):
+            entry = avis.setdefault(row["avis"]["value"], {
+                "types": [],
+                "note": _number(binding_value(row.get("note")), float, 0.0)
+            })
+            if row["type"]["value"] not in entry["types"]:
+                entry["types"].append(row["type"]["value"])
+        return products, avis
+
+    async def reconcile(self) -> int:
+        """
+        Recalcule les vues depuis Fuseki et remplace l'état en mémoire.
+
+        Returns:
+            Le nombre de compteurs corrigés (0 si les vues n'avaient pas dérivé)
+        """
+        self._dirty = {}
+        try:
+            products, avis = await self._load()
+            # Les écritures appliquées pendant la lecture priment sur l'état lu
+            for uri, deleted in self._dirty.items():
+                for live, loaded in ((self._products, products), (self._avis, avis)):
+                    if deleted:
+                        loaded.pop(uri, None)
+                    elif uri in live:
+                        loaded[uri] = live[uri]
+        finally:
+            self._dirty = None
+
+        counters = _Counters()
+        for product in products.values():
+            counters.apply_product(product, 1)
+        for entry in avis.values():
+            counters.apply_avis(entry, 1)
+
+        corrections = 0
+        if self.ready:
+            before, after = self._counters.snapshot(), counters.snapshot()
+            for view in after:
+                keys = set(before[view]) | set(after[view])
+                corrections += sum(1 for k in keys if before[view].get(k) != after[view].get(k))
+            if corrections:
+                logger.warning(f"Vues du tableau de bord : {corrections} compteur(s) corrigé(s) par la réconciliation")
+        self._products, self._avis, self._counters = products, avis, counters
+        self.ready = True
+        self.reconciliations += 1
+        self.drift_corrections += corrections
+        self.last_reconcile = time.time()
+        return corrections
+
+    async def _reconcile_periodically(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Erreur de réconciliation des vues du tableau de bord: {e}")
+
+    async def start(self):
+        """Charge les vues (au démarrage) et lance la réconciliation périodique"""
+        try:
+            await self.reconcile()
+            logger.info(f"✅ Vues du tableau de bord: {len(self._products)} produits, {len(self._avis)} avis")
+        except Exception as e:
+            # Les endpoints interrogent Fuseki tant que les vues ne sont pas prêtes
+            logger.error(f"Chargement des vues du tableau de bord impossible: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._reconcile_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ==================== DELTAS (appelés après une écriture réussie) ====================
+
+    def _touch(self, uri: str, deleted: bool = False) -> None:
+        if self._dirty is not None:
+            self._dirty[uri] = deleted
+
+    def product_written(self, produit_uri: str, create: bool = False, categorie_uri: Optional[str] = None,
+                        marque_uri: Optional[str] = None, prix: Optional[float] = None,
+                        stock: Optional[int] = None) -> None:
+        """
+        Applique l'ajout ou la modification d'un produit.
+
+        Args:
+            produit_uri: L'URI du produit
+            create: True pour un nouveau produit ; sinon un produit inconnu est ignoré
+                    (la mise à jour ne crée pas le triplet "a ns:Produit")
+            categorie_uri, marque_uri, prix, stock: Les valeurs écrites (None : inchangée) ;
+                une catégorie ou une marque écrite remplace toutes les précédentes
+        """
+        uri = _uri(produit_uri)
+        self._touch(uri)
+        old = self._products.get(uri)
+        if old is None and not create:
+            return
+        new = dict(old) if old else {"categories": [], "marques": [], "prix": 0.0, "stock": 0}
+        if categorie_uri is not None:
+            new["categories"] = [_uri(categorie_uri)]
+        if marque_uri is not None:
+            new["marques"] = [_uri(marque_uri)]
+        if prix is not None:
+            new["prix"] = float(prix)
+        if stock is not None:
+            new["stock"] = int(stock)
+        self._counters.apply_product(old, -1)
+        self._counters.apply_product(new, 1)
+        self._products[uri] = new
+
+    def product_deleted(self, produit_uri: str) -> None:
+        uri = _uri(produit_uri)
+        self._touch(uri, deleted=True)
+        self._counters.apply_product(self._products.pop(uri, None), -1)
+
+    def avis_written(self, avis_uri: str, sentiment: Optional[str] = None, note: Optional[float] = None) -> None:
+        """
+        Applique l'ajout (sentiment fourni) ou la modification de la note d'un avis.
+
+        Args:
+            avis_uri: L'URI de l'avis
+            sentiment: 'positive', 'negative' ou 'neutral' pour un nouvel avis
+            note: La note écrite
+        """
+        uri = _uri(avis_uri)
+        self._touch(uri)
+        old = self._avis.get(uri)
+        if old is None and sentiment is None:
+            return
+        new = dict(old) if old else {"types": [SENTIMENT_TYPES[sentiment]], "note": 0.0}
+        if note is not None:
+            new["note"] = float(note)
+        self._counters.apply_avis(old, -1)
+        self._counters.apply_avis(new, 1)
+        self._avis[uri] = new
+
+    def avis_reclassified(self, avis_uri: str, sentiment: str) -> None:
+        """Applique le changement de classe d'un avis (toutes ses classes remplacées par une seule)"""
+        uri = _uri(avis_uri)
+        self._touch(uri)
+        old = self._avis.get(uri)
+        if old is None:
+            return
+        new = dict(old, types=[SENTIMENT_TYPES[sentiment]])
+        self._counters.apply_avis(old, -1)
+        self._counters.apply_avis(new, 1)
+        self._avis[uri] = new
+
+    def avis_deleted(self, avis_uri: str) -> None:
+        uri = _uri(avis_uri)
+        self._touch(uri, deleted=True)
+        self._counters.apply_avis(self._avis.pop(uri, None), -1)
+
+    # ==================== LECTURES ====================
+
+    def avis_stats(self) -> Dict:
+        counts = self._counters.avis
+        total = sum(counts[k] for k in ("positive", "negative", "neutral"))
+        total_notes = sum(self._counters.notes[k] for k in ("positive", "negative", "neutral"))
+        return {
+            "total_avis": total,
+            "avis_positive": counts["positive"],
+            "avis_negative": counts["negative"],
+            "avis_neutral": counts["neutral"],
+            "average_note": round(total_notes / total if total > 0 else 0, 2)
+        }
+
+    @staticmethod
+    def _by_name(counter: Counter) -> Dict[str, int]:
+        return {uri.split("#")[1]: count for uri, count in counter.items() if count > 0 and "#" in uri}
+
+    def products_by_category(self) -> Dict[str, int]:
+        return self._by_name(self._counters.categories)
+
+    def products_by_brand(self) -> Dict[str, int]:
+        return self._by_name(self._counters.brands)
+
+    def stock_statistics(self) -> Dict:
+        stock = self._counters.stock
+        return {
+            "total_produits": stock["total_produits"],
+            "stock_total": stock["stock_total"],
+            "produits_en_stock": stock["produits_en_stock"],
+            "produits_rupture": stock["produits_rupture"],
+            "valeur_stock": round(stock["valeur_stock"], 2)
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "produits": len(self._products),
+            "avis": len(self._avis),
+            "reconcile_interval": self.reconcile_interval,
+            "reconciliations": self.reconciliations,
+            "drift_corrections": self.drift_corrections,
+            "last_reconcile": self.last_reconcile
+        }
+
+
+# Instance partagée par main et les routers
+dashboard_views = DashboardViews()
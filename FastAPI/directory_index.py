@@ -0,0 +1,359 @@
+"""
+Index secondaires de l'annuaire (clients et fournisseurs)
+Les recherches en langage naturel filtraient les clients et les fournisseurs
+par FILTER(regex(...)) sur le pays, l'adresse et l'URI : Fuseki parcourt alors
+toutes les entités. Ces index en mémoire résolvent les filtres avant la requête :
+    - pays (sans accents ni casse) -> URIs, et les littéraux exacts stockés ;
+    - mots de l'adresse (ville) -> URIs ;
+    - trigrammes du nom (nom local de l'URI) -> URIs, vérifiés par sous-chaîne.
+La requête envoyée à Fuseki ne contient plus que des VALUES (URIs exactes, ou
+littéraux de pays exacts quand le pays est le seul filtre), résolus par ses
+index.
+
+Les index sont construits au démarrage, tenus à jour par les endpoints
+d'écriture des clients et des fournisseurs, et reconstruits périodiquement
+depuis Fuseki (écritures externes).
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+from entity_matcher import fold
+from sparql_client import SparqlClient, sparql_client, sparql_literal
+
+logger = logging.getLogger(__name__)
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+# Intervalle de reconstruction des index depuis Fuseki (secondes)
+REBUILD_INTERVAL = float(os.getenv("DIRECTORY_REBUILD_INTERVAL", "900"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+# IRI sans caractères interdits (évite l'injection dans la requête)
+_IRI = re.compile(r'^[^\s<>"{}|\\^`]+$')
+
+
+def _uri(value: Optional[str]) -> Optional[str]:
+    """Forme complète d'une URI (sans chevrons, préfixe ns: développé)"""
+    if value is None:
+        return None
+    value = value.strip().strip("<>")
+    return NS + value[3:] if value.startswith("ns:") else value
+
+
+def _name(uri: str) -> str:
+    """Nom d'une entité pour la recherche : nom local de l'URI, sans accents ni "_" """
+    return fold(uri.rsplit("#", 1)[-1].rsplit("/", 1)[-1].replace("_", " "))
+
+
+def _trigrams(word: str) -> Set[str]:
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def _literal(term: Dict) -> str:
+    """Un littéral de résultat SPARQL JSON sous forme de terme SPARQL (valeur exacte)"""
+    literal = sparql_literal(term["value"])
+    if term.get("xml:lang"):
+        return f"{literal}@{term['xml:lang']}"
+    if term.get("datatype"):
+        return f"{literal}^^<{term['datatype']}>"
+    return literal
+
+
+class _Directory:
+    """Entités d'une classe et leurs index (pays, mots de l'adresse, trigrammes du nom)"""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict] = {}           # URI -> {"adresse", "pays"} (valeurs SPARQL JSON)
+        self.names: Dict[str, str] = {}              # URI -> nom normalisé
+        self.by_pays: Dict[str, Set[str]] = {}       # pays normalisé -> URIs
+        self.pays_literals: Dict[str, Counter] = {}  # pays normalisé -> littéraux stockés
+        self.by_word: Dict[str, Set[str]] = {}       # mot de l'adresse -> URIs
+        self.by_trigram: Dict[str, Set[str]] = {}    # trigramme du nom -> URIs
+
+    @staticmethod
+    def _folded(entry: Dict, field: str) -> Optional[str]:
+        term = entry.get(field)
+        return fold(term["value"]) if term else None
+
+    def _index(self, uri: str, entry: Dict, add: bool) -> None:
+        def update(index: Dict[str, Set[str]], key: str) -> None:
+            if add:
+                index.setdefault(key, set()).add(uri)
+            else:
+                uris = index.get(key)
+                if uris is not None:
+                    uris.discard(uri)
+                    if not uris:
+                        del index[key]
+
+        pays = self._folded(entry, "pays")
+        if pays:
+            update(self.by_pays, pays)
+            literals = self.pays_literals.setdefault(pays, Counter())
+            literal = _literal(entry["pays"])
+            literals[literal] += 1 if add else -1
+            if literals[literal] <= 0:
+                del literals[literal]
+            if not literals:
+                del self.pays_literals[pays]
+        adresse = self._folded(entry, "adresse")
+        for word in set(_WORD.findall(adresse or "")):
+            update(self.by_word, word)
+        for word in self.names[uri].split():
+            for gram in _trigrams(word):
+                update(self.by_trigram, gram)
+
+    def add(self, uri: str, entry: Dict) -> None:
+        self.remove(uri)
+        self.entries[uri] = entry
+        self.names[uri] = _name(uri)
+        self._index(uri, entry, add=True)
+
+    def remove(self, uri: str) -> None:
+        entry = self.entries.get(uri)
+        if entry is None:
+            return
+        self._index(uri, entry, add=False)
+        del self.entries[uri], self.names[uri]
+
+    # ==================== RÉSOLUTION DES FILTRES ====================
+
+    def _pays_keys(self, pays: Iterable[str]) -> List[str]:
+        # Comme regex(?pays, "A|B", "i") : le pays stocké contient l'un des pays demandés
+        wanted = [fold(p) for p in pays]
+        return [key for key in self.by_pays if any(p in key for p in wanted)]
+
+    def filter_pays(self, uris: Set[str], pays: Iterable[str]) -> Set[str]:
+        """Les entités de l'ensemble situées dans l'un des pays (sans construire l'ensemble du pays)"""
+        sets = [self.by_pays[key] for key in self._pays_keys(pays)]
+        return {uri for uri in uris if any(uri in entities for entities in sets)}
+
+    def literals_pays(self, pays: Iterable[str]) -> List[str]:
+        return sorted(literal for key in self._pays_keys(pays) for literal in self.pays_literals[key])
+
+    def match_ville(self, ville: str) -> Set[str]:
+        """Entités dont l'adresse contient tous les mots de la ville"""
+        words = _WORD.findall(fold(ville))
+        if not words:
+            return set()
+        sets = sorted((self.by_word.get(word, set()) for word in words), key=len)
+        return set.intersection(*sets)
+
+    def match_nom(self, nom: str) -> Set[str]:
+        """Entités dont le nom contient chacun des mots donnés (dans n'importe quel ordre)"""
+        result: Optional[Set[str]] = None
+        for word in sorted(fold(nom).split(), key=len, reverse=True):
+            grams = _trigrams(word)
+            if grams:
+                candidates = set.intersection(*sorted((self.by_trigram.get(g, set()) for g in grams), key=len))
+                if result is not None:
+                    candidates &= result
+            else:
+                candidates = result if result is not None else set(self.names)
+            # Les trigrammes ne garantissent pas l'ordre des lettres : vérification par sous-chaîne
+            result = {uri for uri in candidates if word in self.names[uri]}
+            if not result:
+                break
+        return result or set()
+
+
+class DirectoryIndex:
+    """
+    Index de l'annuaire d'une classe d'entités.
+
+    Args:
+        cls: La classe de l'ontologie (ex. "Client")
+        var: La variable SPARQL des entités dans les résultats (ex. "client")
+    """
+
+    def __init__(self, cls: str, var: str, client: SparqlClient = sparql_client,
+                 rebuild_interval: float = REBUILD_INTERVAL):
+        self.cls = cls
+        self.var = var
+        self.client = client
+        self.rebuild_interval = rebuild_interval
+        self.ready = False
+        self._directory = _Directory()
+        # Entités écrites pendant une reconstruction en cours (URI -> propriétés, None si supprimée)
+        self._dirty: Optional[Dict[str, Optional[Dict]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lookups = 0
+        self.lookup_time = 0.0
+        self.rebuilds = 0
+        self.last_rebuild: Optional[float] = None
+
+    # ==================== CONSTRUCTION ====================
+
+    async def rebuild(self) -> int:
+        """
+        Reconstruit les index depuis Fuseki et remplace les index courants.
+
+        Returns:
+            Le nombre d'entités indexées
+        """
+        query = f"""
+            PREFIX ns: <{NS}>
+            SELECT ?entite ?adresse ?pays
+            WHERE {{
+                ?entite a ns:{self.cls} .
+                OPTIONAL {{ ?entite ns:aAdresse ?adresse . }}
+                OPTIONAL {{ ?entite ns:aPays ?pays . }}
+            }}
+        """
+        directory = _Directory()
+        self._dirty = {}
+        try:
+            async for row in self.client.stream(query):
+                uri = row["entite"]["value"]
+                if uri not in directory.entries:
+                    directory.add(uri, {field: row[field] for field in ("adresse", "pays") if field in row})
+            # Les écritures appliquées pendant la lecture priment sur l'état lu
+            for uri, entry in self._dirty.items():
+                if entry is None:
+                    directory.remove(uri)
+                else:
+                    directory.add(uri, entry)
+        finally:
+            self._dirty = None
+        self._directory = directory
+        self.ready = True
+        self.rebuilds += 1
+        self.last_rebuild = time.time()
+        return len(directory.entries)
+
+    async def _rebuild_periodically(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Erreur de reconstruction de l'index {self.cls}: {e}")
+
+    async def start(self):
+        """Construit les index (au démarrage) et lance leur reconstruction périodique"""
+        try:
+            count = await self.rebuild()
+            logger.info(f"✅ Index de l'annuaire {self.cls}: {count} entités")
+        except Exception as e:
+            # Les recherches utilisent les filtres regex tant que l'index n'est pas prêt
+            logger.error(f"Construction de l'index {self.cls} impossible: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._rebuild_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ==================== ÉCRITURES (appelées après une écriture réussie) ====================
+
+    def written(self, uri: str, create: bool = False, adresse: Optional[str] = None,
+                pays: Optional[str] = None) -> None:
+        """
+        Indexe l'ajout ou la modification d'une entité.
+
+        Args:
+            uri: L'URI de l'entité
+            create: True pour une nouvelle entité ; sinon une entité inconnue est ignorée
+            adresse, pays: Les valeurs écrites (None : inchangée)
+        """
+        uri = _uri(uri)
+        old = self._directory.entries.get(uri)
+        if old is None and not create:
+            return
+        entry = dict(old or {})
+        # Les endpoints écrivent des littéraux "..."^^xsd:string
+        for field, value in (("adresse", adresse), ("pays", pays)):
+            if value is not None:
+                entry[field] = {"type": "literal", "datatype": "http://www.w3.org/2001/XMLSchema#string",
+                                "value": value}
+        self._directory.add(uri, entry)
+        if self._dirty is not None:
+            self._dirty[uri] = entry
+
+    def deleted(self, uri: str) -> None:
+        uri = _uri(uri)
+        self._directory.remove(uri)
+        if self._dirty is not None:
+            self._dirty[uri] = None
+
+    # ==================== REQUÊTE ====================
+
+    def sparql(self, pays: List[str], noms: List[str], ville: Optional[str]) -> Optional[str]:
+        """
+        Requête SPARQL des entités satisfaisant les filtres, résolus par les index.
+
+        Args:
+            pays: Les pays cités (l'un d'eux)
+            noms: Les noms cités (l'un d'eux ; chaque mot d'un nom doit figurer dans l'URI)
+            ville: La ville citée (ses mots doivent figurer dans l'adresse)
+
+        Returns:
+            La requête (VALUES sur les URIs exactes, ou sur les littéraux de pays exacts
+            si le pays est le seul filtre), ou None si l'index n'est pas prêt ou s'il n'y
+            a aucun filtre (la requête d'origine s'applique alors)
+        """
+        if not self.ready or not (pays or noms or ville):
+            return None
+        debut = time.perf_counter()
+        directory = self._directory
+        var = self.var
+        clauses = []
+        if pays:
+            literals = directory.literals_pays(pays)
+            clauses.append(f"VALUES ?pays {{ {' '.join(literals)} }}")
+            clauses.append(f"?{var} ns:aPays ?pays .")
+        if noms or ville:
+            # Les filtres sélectifs (noms, ville) d'abord, le pays ensuite sur le résultat
+            uris: Optional[Set[str]] = None
+            if noms:
+                uris = set()
+                for nom in noms:
+                    uris |= directory.match_nom(nom)
+            if ville:
+                matched = directory.match_ville(ville)
+                uris = matched if uris is None else uris & matched
+            if pays:
+                uris = directory.filter_pays(uris, pays)
+            values = " ".join(f"<{uri}>" for uri in sorted(uris) if _IRI.match(uri))
+            clauses.insert(0, f"VALUES ?{var} {{ {values} }}")
+        self.lookups += 1
+        self.lookup_time += time.perf_counter() - debut
+        where = "\n            ".join(clauses)
+        return f"""
+        PREFIX ns: <{NS}>
+        SELECT ?{var} ?adresse ?telephone ?email ?pays
+        WHERE {{
+            {where}
+            ?{var} a ns:{self.cls} .
+            OPTIONAL {{ ?{var} ns:aAdresse ?adresse . }}
+            OPTIONAL {{ ?{var} ns:aTéléphone ?telephone . }}
+            OPTIONAL {{ ?{var} ns:aEmail ?email . }}
+            OPTIONAL {{ ?{var} ns:aPays ?pays . }}
+        }}
+    """
+
+    def stats(self) -> Dict:
+        directory = self._directory
+        return {
+            "ready": self.ready,
+            "entities": len(directory.entries),
+            "countries": len(directory.by_pays),
+            "address_words": len(directory.by_word),
+            "name_trigrams": len(directory.by_trigram),
+            "lookups": self.lookups,
+            "avg_lookup_ms": round(self.lookup_time / self.lookups * 1000, 3) if self.lookups else 0.0,
+            "rebuild_interval": self.rebuild_interval,
+            "rebuilds": self.rebuilds,
+            "last_rebuild": self.last_rebuild
+        }
+
+
+# Instances partagées par main, les routers et les modules de recherche
+client_directory = DirectoryIndex("Client", "client")
+fournisseur_directory = DirectoryIndex("Fournisseur", "fournisseur")
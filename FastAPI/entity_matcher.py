@@ -0,0 +1,125 @@
+"""
+Reconnaissance des entités connues (catégories, marques, pays, fournisseurs)
+Toutes les variantes d'un dictionnaire {clé: [variantes]} sont compilées en une
+seule expression régulière, factorisée en arbre de préfixes (trie) : le moteur
+d'expressions régulières parcourt la question une fois, sans essayer chaque
+variante à chaque position, quel que soit le nombre de synonymes. Les
+correspondances respectent les frontières de mots ("lg" ne se trouve pas dans
+"algérie") et acceptent un pluriel en -s.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from unidecode import unidecode
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Expression régulière équivalente à l'alternative des mots, factorisée par préfixes"""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not end:
+            return branches[0]
+        # Quantificateur glouton : la variante la plus longue est essayée en premier
+        return "(?:" + "|".join(branches) + ")" + ("?" if end else "")
+
+    return build(trie)
+
+
+def _normalize(text: str) -> str:
+    """Minuscules et espaces simples (les variantes sont écrites ainsi)"""
+    return " ".join(text.lower().split())
+
+
+def fold(text: str) -> str:
+    """Minuscules, sans accents et espaces simples ("Réfrigérateurs  " -> "refrigerateurs")"""
+    return _normalize(unidecode(text))
+
+
+class EntityMatcher:
+    """
+    Recherche de toutes les entités d'un dictionnaire dans un texte, en une passe.
+
+    Args:
+        entities: Clé de l'entité -> variantes (ex. CATEGORIES, PAYS)
+    """
+
+    def __init__(self, entities: Dict[str, Iterable[str]]):
+        self._keys: Dict[str, str] = {}
+        for key, variants in entities.items():
+            for variant in variants:
+                # La première clé déclarée l'emporte si une variante est partagée
+                self._keys.setdefault(_normalize(variant), key)
+        pattern = _trie_pattern(self._keys) if self._keys else "(?!)"
+        self._regex = re.compile(rf"(?<!\w)({pattern})s?(?!\w)")
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def matches(self, text: str) -> List[Tuple[str, str]]:
+        """Les (clé, variante trouvée) dans l'ordre du texte, sans chevauchement"""
+        return [(self._keys[m.group(1)], m.group(1)) for m in self._regex.finditer(_normalize(text))]
+
+    def find_all(self, text: str) -> List[str]:
+        """Les clés des entités présentes, dans l'ordre du texte, sans doublons"""
+        return list(dict.fromkeys(key for key, _ in self.matches(text)))
+
+    def strip(self, text: str) -> str:
+        """Le texte normalisé, sans les entités trouvées (remplacées par des espaces)"""
+        return self._regex.sub(" ", _normalize(text))
+
+    def find(self, text: str) -> Optional[str]:
+        """La clé de la première entité du texte (None si aucune)"""
+        m = self._regex.search(_normalize(text))
+        return self._keys[m.group(1)] if m else None
+
+
+# Comparaison avec la recherche par boucles imbriquées (pour développement)
+if __name__ == "__main__":
+    import random
+    import string
+    import time
+
+    random.seed(0)
+    synonymes = {
+        f"entite{i}": ["".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(4, 12)))
+                       for _ in range(5)]
+        for i in range(2000)
+    }
+    matcher = EntityMatcher(synonymes)
+    questions = [" ".join(random.choice(["produits", "samsung", "moins", "de", "500", "euros"]
+                                        + random.choice(list(synonymes.values())))
+                          for _ in range(12)) for _ in range(500)]
+
+    # Recherche d'origine : chaque variante cherchée dans toute la question
+    def boucles(question):
+        trouvees = []
+        for cle, variantes in synonymes.items():
+            for variante in variantes:
+                if variante in question:
+                    trouvees.append(cle)
+                    break
+        return trouvees
+
+    # Mêmes entités qu'une recherche mot à mot (variantes d'un seul mot, pluriel en -s)
+    for question in questions:
+        mots = set(question.split())
+        attendues = {cle for cle, variantes in synonymes.items()
+                     if any(v in mots or v + "s" in mots for v in variantes)}
+        assert set(matcher.find_all(question)) == attendues, question
+
+    print(f"=== {len(matcher)} variantes ===")
+    for nom, fonction in [("Boucles imbriquées", boucles), ("EntityMatcher", matcher.find_all)]:
+        debut = time.perf_counter()
+        for question in questions:
+            fonction(question)
+        print(f"{nom}: {(time.perf_counter() - debut) / len(questions) * 1000:.3f} ms par question")
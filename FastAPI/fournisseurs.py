@@ -1,15 +1,13 @@
-from fastapi import APIRouter
-from SPARQLWrapper import SPARQLWrapper, JSON
+from fastapi import APIRouter, Query
 from pydantic import BaseModel, Field
+from sparql_client import sparql_client
+from directory_index import fournisseur_directory
+from pagination import Keyset, page_size, MAX_PAGE_SIZE
 from typing import Optional
 
 # Créer un router pour les fournisseurs
 router = APIRouter()
 
-# Configurations de connexion à Fuseki
-sparql_query = SPARQLWrapper("http://localhost:3030/SmartCom/query")
-sparql_update = SPARQLWrapper("http://localhost:3030/SmartCom/update")
-
 # ==================== MODÈLES PYDANTIC ====================
 
 class FournisseurInput(BaseModel):
@@ -26,30 +24,41 @@ class FournisseurUpdate(BaseModel):
     email: Optional[str] = None
     pays: Optional[str] = None
 
+# Ordre de pagination de la liste des fournisseurs (un fournisseur ajouté deux fois
+# a plusieurs valeurs par propriété : une ligne par combinaison, toutes dans la clé)
+FOURNISSEURS_KEYSET = Keyset(("fournisseur", False), ("email", False), ("telephone", False),
+                             ("adresse", False), ("pays", False))
+
 # ==================== ENDPOINTS ====================
 
 # 1. READ ALL - Lire tous les fournisseurs
 @router.get("/fournisseurs")
-async def get_fournisseurs():
-    """Récupérer la liste de tous les fournisseurs"""
-    query = """
-        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?fournisseur ?adresse ?telephone ?email ?pays
-        WHERE {
-            ?fournisseur a ns:Fournisseur .
-            OPTIONAL { ?fournisseur ns:aAdresse ?adresse . }
-            OPTIONAL { ?fournisseur ns:aTéléphone ?telephone . }
-            OPTIONAL { ?fournisseur ns:aEmail ?email . }
-            OPTIONAL { ?fournisseur ns:aPays ?pays . }
-        }
-    """
-    
-    print("Générée SPARQL Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
+async def get_fournisseurs(limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                           cursor: Optional[str] = None):
+    """Récupérer la liste de tous les fournisseurs (paginée si limit ou cursor est fourni)"""
+    size = page_size(limit, cursor)
     try:
-        results = sparql_query.query().convert()
-        return {"fournisseurs": results["results"]["bindings"]}
+        query = f"""
+            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+            SELECT ?fournisseur ?adresse ?telephone ?email ?pays
+            WHERE {{
+                ?fournisseur a ns:Fournisseur .
+                {FOURNISSEURS_KEYSET.filter(cursor)}
+                OPTIONAL {{ ?fournisseur ns:aAdresse ?adresse . }}
+                OPTIONAL {{ ?fournisseur ns:aTéléphone ?telephone . }}
+                OPTIONAL {{ ?fournisseur ns:aEmail ?email . }}
+                OPTIONAL {{ ?fournisseur ns:aPays ?pays . }}
+            }}
+            {FOURNISSEURS_KEYSET.modifiers(size) if size else ""}
+        """
+        
+        print("Générée SPARQL Query:", query)
+        results = await sparql_client.query(query)
+        bindings = results["results"]["bindings"]
+        if size is None:
+            return {"fournisseurs": bindings}
+        rows, next_cursor = FOURNISSEURS_KEYSET.page(bindings, size)
+        return {"fournisseurs": rows, "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
@@ -75,10 +84,9 @@ async def add_fournisseur(fournisseur: FournisseurInput):
     """
     
     print("Générée SPARQL Insert Query:", insert_query)
-    sparql_update.setQuery(insert_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(insert_query)
+        fournisseur_directory.written(fournisseur_uri, create=True, adresse=fournisseur.adresse, pays=fournisseur.pays)
         return {"message": "Fournisseur ajouté avec succès", "fournisseur_uri": fournisseur_uri}
     except Exception as e:
         return {"error": str(e)}
@@ -100,10 +108,8 @@ async def get_fournisseur(fournisseur_uri: str):
     """
     
     print("Générée SPARQL Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(query)
         return {"fournisseur": results["results"]["bindings"]}
     except Exception as e:
         return {"error": str(e)}
@@ -155,10 +161,9 @@ async def update_fournisseur(fournisseur: FournisseurUpdate):
     """
     
     print("Générée SPARQL Update Query:", update_query)
-    sparql_update.setQuery(update_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(update_query)
+        fournisseur_directory.written(fournisseur.fournisseur_uri, adresse=fournisseur.adresse, pays=fournisseur.pays)
         return {"message": "Fournisseur modifié avec succès"}
     except Exception as e:
         return {"error": str(e)}
@@ -175,10 +180,9 @@ async def delete_fournisseur(fournisseur_uri: str):
     """
     
     print("Générée SPARQL Delete Query:", delete_query)
-    sparql_update.setQuery(delete_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(delete_query, touches=["ns:Fournisseur"])
+        fournisseur_directory.deleted(fournisseur_uri)
         return {"message": "Fournisseur supprimé avec succès"}
     except Exception as e:
         return {"error": str(e)}
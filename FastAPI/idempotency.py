@@ -0,0 +1,119 @@
+"""
+Index des clés d'idempotence
+Conserve, pour une durée limitée, le résultat d'une opération associé à la
+clé fournie par le client (en-tête Idempotency-Key). Une requête répétée avec
+la même clé renvoie le résultat d'origine sans rappeler Fuseki ; une requête
+répétée pendant que l'originale est encore en cours attend son résultat.
+
+Cet index est local au processus : il sert de cache devant la clé enregistrée
+dans Fuseki par l'opération elle-même (voir OrderService), qui seule garantit
+l'unicité entre workers et après un redémarrage. Chaque clé garde l'empreinte
+de la requête d'origine : la même clé réutilisée pour une autre requête est
+refusée (IdempotencyConflict).
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class IdempotencyConflict(Exception):
+    """Clé d'idempotence déjà utilisée pour une requête différente"""
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Empreinte SHA-256 d'une requête (parties sérialisables en JSON)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: float = 24 * 3600, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pending: Dict[str, tuple] = {}
+        self.replays = 0
+
+    def get(self, key: str, fingerprint: Optional[str] = None) -> Optional[Any]:
+        """Résultat mémorisé pour cette clé (None si absent ou expiré)"""
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        result, expires_at, stored_fingerprint = entry
+        if expires_at < time.monotonic():
+            del self._results[key]
+            return None
+        self._check(key, stored_fingerprint, fingerprint)
+        return result
+
+    @staticmethod
+    def _check(key: str, stored_fingerprint: Optional[str], fingerprint: Optional[str]) -> None:
+        if stored_fingerprint is not None and fingerprint is not None and stored_fingerprint != fingerprint:
+            raise IdempotencyConflict(f"Clé d'idempotence {key} déjà utilisée pour une autre requête")
+
+    def _store(self, key: str, result: Any, fingerprint: Optional[str]) -> None:
+        self._results[key] = (result, time.monotonic() + self.ttl, fingerprint)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def run(self, key: str, operation: Callable[[], Awaitable[Any]],
+                  should_store: Callable[[Any], bool] = lambda result: True,
+                  fingerprint: Optional[str] = None) -> Any:
+        """
+        Exécute l'opération une seule fois par clé.
+
+        Args:
+            key: La clé d'idempotence (à préfixer par le périmètre, ex. l'id client)
+            operation: Fabrique de la coroutine à exécuter
+            should_store: Indique si le résultat doit être mémorisé (un échec ne l'est
+                          pas, pour que le client puisse réessayer)
+            fingerprint: Empreinte de la requête (voir request_fingerprint)
+
+        Returns:
+            Le résultat de l'opération, ou celui de la première exécution
+
+        Raises:
+            IdempotencyConflict: La clé a déjà servi pour une requête d'empreinte différente
+        """
+        result = self.get(key, fingerprint)
+        if result is not None:
+            self.replays += 1
+            return result
+        pending = self._pending.get(key)
+        if pending is not None:
+            future, pending_fingerprint = pending
+            self._check(key, pending_fingerprint, fingerprint)
+            self.replays += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = (future, fingerprint)
+        try:
+            result = await operation()
+            if should_store(result):
+                self._store(key, result, fingerprint)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # L'exception est transmise aux requêtes en attente ; évite l'avertissement si aucune
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._results),
+            "pending": len(self._pending),
+            "replays": self.replays,
+            "ttl": self.ttl
+        }
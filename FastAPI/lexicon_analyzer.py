@@ -0,0 +1,464 @@
+"""
+Analyse de sentiment par lexiques (NRC anglais, EMOLEX français, tunisien, emojis)
+Les trois lexiques sont fusionnés dans un seul index mot -> masque d'émotions :
+chaque mot porte un entier dont les bits indiquent ses émotions dans chaque
+lexique (bits 0-9 : NRC, 10-19 : français, 20-29 : tunisien, dans l'ordre de
+emotions_list). Le score d'un texte coûte ainsi une recherche par token.
+L'index est lu depuis un cache binaire mappé en mémoire (voir lexicon_cache).
+analyze_sentiment_batch score un lot de textes d'un coup : matrice creuse
+documents × termes, réduite en comptes d'émotions par NumPy.
+Chaque texte n'est tokenisé qu'une fois (prepare) : les mêmes tokens servent à
+la détection de langue et au scoring.
+"""
+
+import json
+import logging
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import nltk
+import numpy as np
+from nltk.tokenize import NLTKWordTokenizer, sent_tokenize, word_tokenize
+from nltk.corpus import stopwords
+from unidecode import unidecode
+from lexicon_cache import MappedLexicon, StaleLexiconCache, build, default_cache_path, source_checksum
+
+logger = logging.getLogger(__name__)
+
+# Position des lexiques dans le masque d'un mot
+NRC_SHIFT = 0
+FRENCH_SHIFT = 10
+TUNISIAN_SHIFT = 20
+EMOTION_MASK = (1 << 10) - 1
+
+
+EMOTIONS_LIST = ['anger', 'anticipation', 'disgust', 'fear', 'joy', 'negative', 'positive', 'sadness', 'surprise', 'trust']
+# Colonnes des émotions comptées positivement / négativement dans le score composé
+POSITIVE_EMOTIONS = [EMOTIONS_LIST.index(emo) for emo in ('positive', 'joy')]
+NEGATIVE_EMOTIONS = [EMOTIONS_LIST.index(emo) for emo in ('negative', 'anger', 'sadness', 'fear')]
+# Bits de chaque masque possible (1024 × 10)
+MASK_BITS = (np.arange(EMOTION_MASK + 1)[:, None] >> np.arange(len(EMOTIONS_LIST)) & 1).astype(np.float64)
+
+# Emojis comptés à part et retirés du texte avant la tokenisation
+EMOJI_PATTERN = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]')
+
+# Tokenizer de mots utilisé par word_tokenize (après le découpage en phrases)
+_word_tokenizer = NLTKWordTokenizer()
+
+# Forme sans accent d'un token (les mêmes tokens reviennent d'un avis à l'autre)
+fold_accents = lru_cache(maxsize=65536)(unidecode)
+
+# Ressources NLTK nécessaires (chemin de recherche, paquet à télécharger)
+NLTK_RESOURCES = [("tokenizers/punkt", "punkt"), ("corpora/stopwords", "stopwords")]
+
+
+def ensure_nltk_data():
+    """Télécharge les ressources NLTK seulement si elles sont absentes"""
+    for resource, package in NLTK_RESOURCES:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            logger.info(f"Téléchargement de la ressource NLTK '{package}'")
+            nltk.download(package, quiet=True)
+
+
+# ==================== LECTURE DES LEXIQUES SOURCES ====================
+
+def _index(lexicon, word, mask, shift):
+    """Ajoute les émotions d'un mot (masque de 10 bits) au lexique situé à `shift`"""
+    if mask:
+        lexicon[word] = lexicon.get(word, 0) | (mask << shift)
+
+
+def _emolex_mask(parts):
+    """Masque des 10 colonnes d'émotions d'une ligne EMOLEX"""
+    return sum(1 << (i - 1) for i in range(1, 11) if int(parts[i]) == 1)
+
+
+def load_emolex_tunisian(lexicon, filepath):
+    if os.path.exists(filepath):
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                next(f)  # Ignorer l'en-tête
+                for line in f:
+                    parts = [p.strip() for p in line.split('\t')]
+                    if len(parts) >= 12:
+                        word = parts[-1].lower()
+                        mask = _emolex_mask(parts)
+                        if mask:
+                            # Une entrée tunisienne remplace la précédente (même mot ou même forme sans accent)
+                            for key in (word, unidecode(word)):
+                                lexicon[key] = (lexicon.get(key, 0) & ~(EMOTION_MASK << TUNISIAN_SHIFT)) | (mask << TUNISIAN_SHIFT)
+            count = sum(1 for entry in lexicon.values() if entry >> TUNISIAN_SHIFT & EMOTION_MASK)
+            logger.info(f"✅ Tunisian: {count} mots")
+        except Exception as e:
+            logger.error(f"Tunisian error: {e}")
+
+
+def load_emolex_french(lexicon, filepath):
+    if os.path.exists(filepath):
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                next(f)  # Ignorer l'en-tête
+                for line in f:
+                    parts = [p.strip() for p in line.split('\t')]
+                    if len(parts) >= 12:
+                        word = parts[-1].lower()
+                        mask = _emolex_mask(parts)
+                        _index(lexicon, word, mask, FRENCH_SHIFT)
+                        _index(lexicon, unidecode(word), mask, FRENCH_SHIFT)
+            logger.info(f"✅ French EMOLEX")
+        except Exception as e:
+            logger.error(f"French error: {e}")
+
+
+def load_nrc_emotions(lexicon, path):
+    try:
+        emotions = 0
+        for filename in os.listdir(path):
+            if '-NRC-Emotion-Lexicon.txt' in filename:
+                emotion = filename.replace('-NRC-Emotion-Lexicon.txt', '').lower()
+                if emotion not in EMOTIONS_LIST:
+                    continue
+                bit = 1 << EMOTIONS_LIST.index(emotion)
+                filepath = os.path.join(path, filename)
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        parts = line.split('\t')
+                        if len(parts) == 2 and parts[1].strip() == '1':
+                            _index(lexicon, parts[0].lower(), bit, NRC_SHIFT)
+                emotions += 1
+        logger.info(f"✅ NRC chargé: {emotions} émotions")
+    except Exception as e:
+        logger.error(f"NRC error: {e}")
+
+
+def parse_lexicons(data_path) -> Dict[str, int]:
+    """Construit l'index mot -> masque d'émotions depuis les fichiers texte"""
+    lexicon: Dict[str, int] = {}
+    lexicons_path = os.path.join(data_path, 'lexicons')
+    load_emolex_tunisian(lexicon, os.path.join(lexicons_path, 'tunisian_emolex.txt'))
+    load_emolex_french(lexicon, os.path.join(lexicons_path, 'french_emolex.txt'))
+    load_nrc_emotions(lexicon, os.path.join(data_path, 'OneFilePerEmotion'))
+    return lexicon
+
+
+def parse_emojis(data_path) -> Dict[str, Dict[str, float]]:
+    """Lit emojis.json (émotions de score positif uniquement)"""
+    emoji_emotions = {}
+    emoji_file = os.path.join(data_path, 'emojis.json')
+    try:
+        with open(emoji_file, 'r', encoding='utf-8') as f:
+            emoji_data = json.load(f)
+            for item in emoji_data:
+                emoji = item['emoji']
+                emotions = item['emotions']
+                emoji_emotions[emoji] = {emo: score for emo, score in emotions.items() if score > 0}
+        logger.info(f"✅ Emojis chargés: {len(emoji_emotions)} emojis")
+    except Exception as e:
+        logger.error(f"Erreur lors du chargement des emojis: {e}")
+    return emoji_emotions
+
+
+def load_lexicon_index(data_path, cache_path=None):
+    """
+    Charge l'index des lexiques et les emojis depuis le cache binaire ; le cache
+    est (re)construit s'il est absent ou si les fichiers sources ont changé.
+
+    Args:
+        data_path: Le dossier data (lexicons/, OneFilePerEmotion/, emojis.json)
+        cache_path: Le fichier cache (par défaut data/lexicons.bin ou LEXICON_CACHE_PATH)
+
+    Returns:
+        (index mot -> masque, emoji -> émotions)
+    """
+    cache_path = cache_path or default_cache_path(data_path)
+    checksum = source_checksum(data_path)
+    try:
+        mapped = MappedLexicon(cache_path, checksum)
+        logger.info(f"✅ Lexiques chargés depuis le cache: {len(mapped)} mots")
+        return mapped, mapped.emoji_emotions
+    except StaleLexiconCache as e:
+        logger.info(f"{e} : reconstruction de {cache_path}")
+    lexicon = parse_lexicons(data_path)
+    emoji_emotions = parse_emojis(data_path)
+    try:
+        build(cache_path, checksum, lexicon, emoji_emotions)
+        mapped = MappedLexicon(cache_path, checksum)
+        return mapped, mapped.emoji_emotions
+    except (OSError, StaleLexiconCache) as e:
+        # Dossier en lecture seule, etc. : l'index reste en mémoire pour ce processus
+        logger.warning(f"Cache des lexiques non écrit ({e}), index en mémoire")
+        return lexicon, emoji_emotions
+
+
+# Classe pour l'analyse de sentiment
+class LexiconAnalyzer:
+    def __init__(self, data_path, cache_path=None):
+        ensure_nltk_data()
+        self.emotions_list = EMOTIONS_LIST
+        # Émotions correspondant à chacun des 1024 masques possibles
+        self.mask_emotions: Tuple[Tuple[str, ...], ...] = tuple(
+            tuple(emo for i, emo in enumerate(self.emotions_list) if mask >> i & 1)
+            for mask in range(EMOTION_MASK + 1)
+        )
+        self.stop_words = {
+            'french': set(stopwords.words('french')),
+            'english': set(stopwords.words('english'))
+        }
+        self.french_keywords = set(['triste', 'génial', 'joyeux', 'heureux', 'content', 'belle', 'beau', 'joli', "j'adore", 'super', 'tristesse', 'colère', 'peur', 'joie'])
+        self.tunisian_keywords = set(['farhèn', 'nebki', 'mridha', 'khayef', 'zwin', 'yallah', 'fer7an'])
+        self.english_keywords = set(['happy', 'sad', 'angry', 'fear', 'joy', 'love', 'awesome', 'great'])
+        self.data_path = data_path
+        # Index mot -> masque (cache binaire mappé en mémoire, ou dictionnaire)
+        self.lexicon, self.emoji_emotions = load_lexicon_index(data_path, cache_path)
+        # Les tokens fréquents des avis sont résolus sans recalculer leur masque
+        self.word_mask = lru_cache(maxsize=65536)(self._word_mask)
+
+    def preprocess_text(self, text, lang):
+        text_no_emojis = EMOJI_PATTERN.sub('', text.lower())
+        tokens = word_tokenize(text_no_emojis, language='french' if lang in ['french', 'tunisian'] else 'english')
+        return self._words([t for t in tokens if len(t) >= 2], lang), EMOJI_PATTERN.findall(text)
+
+    def _words(self, tokens, lang):
+        """Tokens sans mots vides de la langue, plus leurs formes sans accent (sans doublons)"""
+        stop_words = self.stop_words.get(lang, set())
+        words = [t for t in tokens if t not in stop_words]
+        words.extend([fold_accents(t) for t in words])
+        return list(set(words))
+
+    def _language(self, tokens):
+        """Langue d'un texte d'après ses tokens (découpage français, mots vides français retirés)"""
+        words = self._words(tokens, 'french')
+        french_count = sum(1 for w in words if w in self.french_keywords or fold_accents(w) in self.french_keywords)
+        tunisian_count = sum(1 for w in words if w in self.tunisian_keywords)
+        english_count = sum(1 for w in words if w in self.english_keywords)
+        return 'tunisian' if tunisian_count > 0 else 'french' if french_count > english_count else 'english'
+
+    def detect_language(self, text):
+        return self.prepare(text)[0]
+
+    def prepare(self, text):
+        """
+        Tokenise un texte une seule fois pour la détection de langue et le scoring
+        (mêmes résultats que detect_language puis preprocess_text).
+
+        Args:
+            text: Le texte à analyser
+
+        Returns:
+            (langue, tokens à scorer, emojis)
+        """
+        text_no_emojis = EMOJI_PATTERN.sub('', text.lower())
+        sentences = sent_tokenize(text_no_emojis, language='french')
+        tokens = [t for sentence in sentences for t in _word_tokenizer.tokenize(sentence) if len(t) >= 2]
+        lang = self._language(tokens)
+        # Les modèles Punkt français et anglais ne diffèrent que sur les points
+        # (abréviations) : sans point, le découpage français vaut pour l'anglais
+        if lang == 'english' and '.' in text_no_emojis:
+            english_sentences = sent_tokenize(text_no_emojis, language='english')
+            if english_sentences != sentences:
+                tokens = [t for sentence in english_sentences for t in _word_tokenizer.tokenize(sentence) if len(t) >= 2]
+        return lang, self._words(tokens, lang), EMOJI_PATTERN.findall(text)
+
+    def _word_mask(self, word, lang):
+        """
+        Émotions d'un token (masque de 10 bits) pour la langue détectée.
+
+        Args:
+            word: Le token
+            lang: 'english', 'french' ou 'tunisian'
+
+        Returns:
+            Le masque des émotions comptées pour ce token
+        """
+        entry = self.lexicon.get(word, 0)
+        word_no_accent = fold_accents(word)
+        entry_no_accent = self.lexicon.get(word_no_accent, 0) if word_no_accent != word else entry
+        if lang == 'tunisian':
+            # Le mot tel quel, sinon sa forme sans accent
+            return (entry >> TUNISIAN_SHIFT & EMOTION_MASK) or (entry_no_accent >> TUNISIAN_SHIFT & EMOTION_MASK)
+        # NRC : le mot tel quel ne compte qu'en anglais, la forme sans accent dans toutes les langues
+        mask = entry_no_accent >> NRC_SHIFT & EMOTION_MASK
+        if lang == 'english':
+            mask |= entry >> NRC_SHIFT & EMOTION_MASK
+        elif lang == 'french':
+            mask |= (entry | entry_no_accent) >> FRENCH_SHIFT & EMOTION_MASK
+        return mask
+
+    def analyze_sentiment(self, text):
+        lang, words, emojis = self.prepare(text)
+        emotions = Counter()
+
+        for word in words:
+            mask = self.word_mask(word, lang)
+            if mask:
+                emotions.update(self.mask_emotions[mask])
+
+        for emoji in emojis:
+            if emoji in self.emoji_emotions:
+                emotions.update(self.emoji_emotions[emoji])
+
+        compound = (emotions.get('positive', 0) + emotions.get('joy', 0) - (emotions.get('negative', 0) + emotions.get('anger', 0) + emotions.get('sadness', 0) + emotions.get('fear', 0))) / max(sum(emotions.values()), 1)
+        return 'positive' if compound > 0.2 else 'negative' if compound < -0.2 else 'neutral'
+
+    def analyze_sentiment_batch(self, texts: List[str]) -> List[str]:
+        """
+        Score un lot de textes (mêmes résultats que analyze_sentiment).
+
+        Les tokens des documents forment une matrice creuse documents × termes
+        (un terme = un token et la langue du document) : le masque de chaque
+        terme distinct n'est calculé qu'une fois pour le lot, puis les comptes
+        d'émotions par document sont réduits par NumPy.
+
+        Args:
+            texts: Les textes à scorer
+
+        Returns:
+            Le sentiment de chaque texte ('positive', 'negative' ou 'neutral')
+        """
+        n_docs = len(texts)
+        if not n_docs:
+            return []
+        terms: Dict[Tuple[str, str], int] = {}
+        term_masks: List[int] = []
+        emoji_columns: Dict[str, int] = {}
+        doc_rows: List[int] = []
+        term_cols: List[int] = []
+        emoji_rows: List[int] = []
+        emoji_cols: List[int] = []
+        for doc, text in enumerate(texts):
+            lang, words, emojis = self.prepare(text)
+            for word in words:
+                col = terms.get((word, lang))
+                if col is None:
+                    col = terms[(word, lang)] = len(term_masks)
+                    term_masks.append(self.word_mask(word, lang))
+                doc_rows.append(doc)
+                term_cols.append(col)
+            for emoji in emojis:
+                if emoji in self.emoji_emotions:
+                    emoji_rows.append(doc)
+                    emoji_cols.append(emoji_columns.setdefault(emoji, len(emoji_columns)))
+
+        # Émotions par terme (termes × 10), puis somme par document des lignes de la matrice creuse
+        term_emotions = MASK_BITS[np.asarray(term_masks, dtype=np.int64)][np.asarray(term_cols, dtype=np.int64)]
+        emotions = np.zeros((n_docs, len(EMOTIONS_LIST)))
+        np.add.at(emotions, np.asarray(doc_rows, dtype=np.int64), term_emotions)
+        if emoji_rows:
+            emoji_scores = np.array([[self.emoji_emotions[emoji].get(emo, 0) for emo in self.emotions_list]
+                                     for emoji in emoji_columns], dtype=np.float64)
+            np.add.at(emotions, np.asarray(emoji_rows, dtype=np.int64), emoji_scores[np.asarray(emoji_cols, dtype=np.int64)])
+
+        compound = ((emotions[:, POSITIVE_EMOTIONS].sum(axis=1) - emotions[:, NEGATIVE_EMOTIONS].sum(axis=1))
+                    / np.maximum(emotions.sum(axis=1), 1))
+        labels = np.where(compound > 0.2, 'positive', np.where(compound < -0.2, 'negative', 'neutral'))
+        return labels.tolist()
+
+
+# Micro-benchmark de analyze_sentiment sur des avis longs (pour développement)
+if __name__ == "__main__":
+    import sys
+    import time
+    from collections import defaultdict
+
+    data_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    analyzer = LexiconAnalyzer(data_path)
+
+    # Ancienne représentation reconstruite depuis l'index : listes (avec doublons) par
+    # émotion pour le français, ensembles NRC, dictionnaire tunisien
+    emolex_words = defaultdict(lambda: defaultdict(list))
+    nrc_emotions = defaultdict(set)
+    tunisian_words = {}
+    for word, entry in analyzer.lexicon.items():
+        for i, emo in enumerate(analyzer.emotions_list):
+            if entry >> (FRENCH_SHIFT + i) & 1:
+                emolex_words[emo]['french'].extend([word, unidecode(word)])
+            if entry >> (NRC_SHIFT + i) & 1:
+                nrc_emotions[emo].add(word)
+        if entry >> TUNISIAN_SHIFT & EMOTION_MASK:
+            tunisian_words[word] = list(analyzer.mask_emotions[entry >> TUNISIAN_SHIFT & EMOTION_MASK])
+
+    # Ancien prétraitement : le texte complet est tokenisé pour la détection, puis à nouveau
+    def ancien_pretraitement(text):
+        tokens, _ = analyzer.preprocess_text(text, 'french')
+        french_count = sum(1 for w in tokens if w in analyzer.french_keywords or unidecode(w) in analyzer.french_keywords)
+        tunisian_count = sum(1 for w in tokens if w in analyzer.tunisian_keywords)
+        english_count = sum(1 for w in tokens if w in analyzer.english_keywords)
+        lang = 'tunisian' if tunisian_count > 0 else 'french' if french_count > english_count else 'english'
+        return (lang, *analyzer.preprocess_text(text, lang))
+
+    def deux_passes_analyze_sentiment(text):
+        lang, words, emojis = ancien_pretraitement(text)
+        emotions = Counter()
+        for word in words:
+            mask = analyzer.word_mask(word, lang)
+            if mask:
+                emotions.update(analyzer.mask_emotions[mask])
+        for emoji in emojis:
+            if emoji in analyzer.emoji_emotions:
+                emotions.update(analyzer.emoji_emotions[emoji])
+        compound = (emotions.get('positive', 0) + emotions.get('joy', 0) - (emotions.get('negative', 0) + emotions.get('anger', 0) + emotions.get('sadness', 0) + emotions.get('fear', 0))) / max(sum(emotions.values()), 1)
+        return 'positive' if compound > 0.2 else 'negative' if compound < -0.2 else 'neutral'
+
+    def ancien_analyze_sentiment(text):
+        lang, words, emojis = ancien_pretraitement(text)
+        emotions = Counter()
+        if lang == 'tunisian':
+            for word in words:
+                word_no_accent = unidecode(word)
+                if word in tunisian_words or word_no_accent in tunisian_words:
+                    emotions.update(tunisian_words.get(word, []) or tunisian_words.get(word_no_accent, []))
+        else:
+            for word in words:
+                word_no_accent = unidecode(word)
+                for emo in analyzer.emotions_list:
+                    if lang == 'english' and word in nrc_emotions.get(emo, set()) or word_no_accent in nrc_emotions.get(emo, set()):
+                        emotions[emo] += 1
+                    elif word in emolex_words[emo].get(lang, []) or word_no_accent in emolex_words[emo].get(lang, []):
+                        emotions[emo] += 1
+        for emoji in emojis:
+            if emoji in analyzer.emoji_emotions:
+                emotions.update(analyzer.emoji_emotions[emoji])
+        compound = (emotions.get('positive', 0) + emotions.get('joy', 0) - (emotions.get('negative', 0) + emotions.get('anger', 0) + emotions.get('sadness', 0) + emotions.get('fear', 0))) / max(sum(emotions.values()), 1)
+        return 'positive' if compound > 0.2 else 'negative' if compound < -0.2 else 'neutral'
+
+    avis = [
+        "Super produit, livraison rapide, je suis très content et heureux de cet achat. " * 8
+        + "La qualité est belle mais le service client m'a rendu triste et en colère. " * 8,
+        "Great washing machine, I love it, awesome quality but the noise makes me angry and sad. " * 12,
+        "Zwin barcha, ena farhèn bel produit, yallah nchri wahed ekher 😀🎉 " * 10,
+    ]
+    for texte in avis:
+        assert ancien_analyze_sentiment(texte) == analyzer.analyze_sentiment(texte)
+
+    print(f"=== BENCHMARK analyze_sentiment ({len(analyzer.lexicon)} mots indexés) ===\n")
+    for nom, fonction in [("Listes par émotion", ancien_analyze_sentiment),
+                          ("Index de masques, deux tokenisations", deux_passes_analyze_sentiment),
+                          ("Index de masques, une tokenisation", analyzer.analyze_sentiment)]:
+        debut = time.perf_counter()
+        repetitions = 0
+        while time.perf_counter() - debut < 2:
+            for texte in avis:
+                fonction(texte)
+            repetitions += 1
+        duree = (time.perf_counter() - debut) / (repetitions * len(avis))
+        print(f"{nom}: {duree * 1000:.2f} ms par avis")
+
+    # Scoring par lots (re-classification, import en masse) sur des avis courts ; le
+    # corpus sert aussi de non-régression du prétraitement en une passe
+    import random
+    mots = [word for word, _ in zip(analyzer.lexicon, range(20000))] + [
+        "livraison", "produit", "the", "le", "M.", "Dr.", "etc.", "vs.", "...", "!", "?", "zwin", "happy", "😀", "😡"]
+    lot = [" ".join(random.choice(mots) for _ in range(random.randint(3, 40))) for _ in range(5000)]
+    labels = [analyzer.analyze_sentiment(texte) for texte in lot]
+    assert labels == [deux_passes_analyze_sentiment(texte) for texte in lot]
+    assert analyzer.analyze_sentiment_batch(lot) == labels
+    for nom, fonction in [("deux tokenisations, texte par texte", lambda: [deux_passes_analyze_sentiment(t) for t in lot]),
+                          ("analyze_sentiment, texte par texte", lambda: [analyzer.analyze_sentiment(t) for t in lot]),
+                          ("analyze_sentiment_batch (vectorisé)", lambda: analyzer.analyze_sentiment_batch(lot))]:
+        debut = time.perf_counter()
+        fonction()
+        print(f"{nom}: {len(lot) / (time.perf_counter() - debut):.0f} avis/s")
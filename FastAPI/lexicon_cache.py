@@ -0,0 +1,185 @@
+"""
+Cache binaire des lexiques d'émotions
+Les lexiques (NRC, EMOLEX français et tunisien) et emojis.json sont compilés
+dans un fichier binaire versionné, ouvert par mmap : le chargement ne coûte
+que la vérification de la somme de contrôle des fichiers sources, et les
+processus workers partagent les mêmes pages mémoire.
+
+Format (petit-boutiste) :
+    en-tête   : HEADER (magie, version, somme SHA-256 des sources, tailles)
+    table     : n_slots cases SLOT (hash crc32, position et longueur du mot, masque)
+                adressage ouvert, sondage linéaire, n_slots puissance de 2
+    mots      : mots UTF-8 concaténés
+    emojis    : emojis.json réduit aux scores positifs (JSON UTF-8)
+
+Construction : python lexicon_cache.py [chemin/vers/data]
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+FORMAT_VERSION = 1
+MAGIC = b"SHLEXIC\x00"
+HEADER = struct.Struct("<8sHH32sIIQQQQ")
+SLOT = struct.Struct("<IIII")
+CACHE_FILENAME = "lexicons.bin"
+
+
+class StaleLexiconCache(Exception):
+    """Levée quand le cache est absent, d'une autre version ou construit depuis d'autres sources"""
+
+
+def source_files(data_path: str) -> List[str]:
+    """Fichiers dont le cache dépend, dans un ordre stable"""
+    onefile_path = os.path.join(data_path, 'OneFilePerEmotion')
+    nrc_files = sorted(
+        os.path.join(onefile_path, name) for name in os.listdir(onefile_path)
+        if '-NRC-Emotion-Lexicon.txt' in name
+    ) if os.path.isdir(onefile_path) else []
+    return [
+        os.path.join(data_path, 'lexicons', 'tunisian_emolex.txt'),
+        os.path.join(data_path, 'lexicons', 'french_emolex.txt'),
+        *nrc_files,
+        os.path.join(data_path, 'emojis.json')
+    ]
+
+
+def source_checksum(data_path: str) -> bytes:
+    """Somme SHA-256 des fichiers sources (nom relatif et contenu) et de la version du format"""
+    digest = hashlib.sha256(f"v{FORMAT_VERSION}".encode())
+    for path in source_files(data_path):
+        digest.update(os.path.relpath(path, data_path).encode("utf-8") + b"\0")
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"<absent>")
+        digest.update(b"\0")
+    return digest.digest()
+
+
+def default_cache_path(data_path: str) -> str:
+    return os.getenv("LEXICON_CACHE_PATH") or os.path.join(data_path, CACHE_FILENAME)
+
+
+def build(path: str, checksum: bytes, lexicon: Dict[str, int], emoji_emotions: Dict[str, Dict]) -> None:
+    """
+    Écrit le cache binaire (fichier temporaire puis remplacement atomique).
+
+    Args:
+        path: Chemin du fichier à produire
+        checksum: Somme de contrôle des sources (voir source_checksum)
+        lexicon: Index mot -> masque d'émotions
+        emoji_emotions: Emoji -> {émotion: score}
+    """
+    n_slots = 1
+    while n_slots < 2 * max(len(lexicon), 1):
+        n_slots *= 2
+    slots = [None] * n_slots
+    words = bytearray()
+    for word, mask in lexicon.items():
+        key = word.encode("utf-8")
+        h = zlib.crc32(key)
+        i = h & (n_slots - 1)
+        while slots[i] is not None:
+            i = (i + 1) & (n_slots - 1)
+        slots[i] = (h, len(words), len(key), mask)
+        words += key
+    emojis = json.dumps(emoji_emotions, ensure_ascii=False).encode("utf-8")
+
+    table_offset = HEADER.size
+    words_offset = table_offset + n_slots * SLOT.size
+    emojis_offset = words_offset + len(words)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, checksum, n_slots, len(lexicon),
+                            words_offset, len(words), emojis_offset, len(emojis)))
+        empty = SLOT.pack(0, 0, 0, 0)
+        f.write(b"".join(SLOT.pack(*slot) if slot else empty for slot in slots))
+        f.write(words)
+        f.write(emojis)
+    os.replace(tmp_path, path)
+
+
+class MappedLexicon:
+    """Index mot -> masque d'émotions lu directement dans le fichier mappé en mémoire"""
+
+    def __init__(self, path: str, checksum: bytes):
+        try:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise StaleLexiconCache(f"Cache des lexiques illisible: {e}")
+        if len(self._map) < HEADER.size:
+            raise StaleLexiconCache("Cache des lexiques tronqué")
+        (magic, version, _, stored_checksum, self._n_slots, self._n_entries,
+         self._words_offset, _, emojis_offset, emojis_size) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise StaleLexiconCache("Cache des lexiques d'un autre format")
+        if stored_checksum != checksum:
+            raise StaleLexiconCache("Cache des lexiques construit depuis d'autres sources")
+        if len(self._map) != emojis_offset + emojis_size:
+            raise StaleLexiconCache("Cache des lexiques tronqué")
+        self.emoji_emotions = json.loads(self._map[emojis_offset:emojis_offset + emojis_size].decode("utf-8"))
+        # Les mots fréquents des avis sont résolus sans relire la table
+        self.get = lru_cache(maxsize=65536)(self._get)
+
+    def _get(self, word: str, default: int = 0) -> int:
+        key = word.encode("utf-8")
+        h = zlib.crc32(key)
+        mask = self._n_slots - 1
+        i = h & mask
+        while True:
+            slot_hash, offset, length, value = SLOT.unpack_from(self._map, HEADER.size + i * SLOT.size)
+            if length == 0:
+                return default
+            if slot_hash == h and length == len(key):
+                start = self._words_offset + offset
+                if self._map[start:start + length] == key:
+                    return value
+            i = (i + 1) & mask
+
+    def __contains__(self, word: str) -> bool:
+        return self.get(word, None) is not None
+
+    def __len__(self) -> int:
+        return self._n_entries
+
+    def __iter__(self) -> Iterator[str]:
+        return (word for word, _ in self.items())
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        for i in range(self._n_slots):
+            _, offset, length, value = SLOT.unpack_from(self._map, HEADER.size + i * SLOT.size)
+            if length:
+                start = self._words_offset + offset
+                yield self._map[start:start + length].decode("utf-8"), value
+
+
+# Construction du cache (étape de build, avant le démarrage des workers)
+if __name__ == "__main__":
+    import sys
+    import time
+    from lexicon_analyzer import parse_emojis, parse_lexicons
+
+    data_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    path = default_cache_path(data_path)
+
+    debut = time.perf_counter()
+    lexicon = parse_lexicons(data_path)
+    emoji_emotions = parse_emojis(data_path)
+    checksum = source_checksum(data_path)
+    build(path, checksum, lexicon, emoji_emotions)
+    print(f"Cache construit: {path} ({os.path.getsize(path)} octets, {len(lexicon)} mots, "
+          f"{len(emoji_emotions)} emojis) en {(time.perf_counter() - debut) * 1000:.0f} ms")
+
+    debut = time.perf_counter()
+    mapped = MappedLexicon(path, source_checksum(data_path))
+    print(f"Chargement (somme de contrôle + mmap): {(time.perf_counter() - debut) * 1000:.1f} ms")
+    assert all(mapped.get(word) == mask for word, mask in lexicon.items())
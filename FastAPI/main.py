@@ -1,5 +1,4 @@
-from fastapi import FastAPI, HTTPException
-from SPARQLWrapper import SPARQLWrapper, JSON
+from fastapi import FastAPI, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from produits import router as produits_router
@@ -8,40 +7,64 @@ from stock import router as stock_router
 from clients import router as clients_router
 from promotions import router as promotions_router
 from nlp_search import analyser_question_nlp
-from nlp_search_fournisseurs import analyser_question_fournisseur
+from nlp_search_fournisseurs import analyser_question_fournisseur, construire_requete_index_fournisseur
 from nlp_search_stock import analyser_question_stock
-from nlp_search_clients import analyser_question_client
+from nlp_search_clients import analyser_question_client, construire_requete_index_client
 from cart_queries import CartQueries
 from order_service import OrderService
-import spacy
-from spacy.lang.fr import French
-from collections import defaultdict, Counter
+from sparql_client import sparql_client
+from idempotency import IdempotencyStore, IdempotencyConflict, request_fingerprint
+from sentiment_pool import SentimentPool
+from sentiment_batcher import SentimentBatcher, SentimentUnavailable, SENTIMENT_LIVE_WORKERS, FALLBACK_SENTIMENT
+from avis_ingestion import AvisIngestion
+from reclassification import ReclassificationJob, PROVISIONAL_SENTIMENT
+from pagination import Keyset, InvalidCursor, page_size, MAX_PAGE_SIZE
+from streaming import ndjson_response
+from dashboard_views import dashboard_views
+from nlp_models import nlp_models, BLANK_FRENCH
+from vocabulary import vocabulary
+from plan_cache import plan_cache
+from product_search import product_search, SEARCH_TOP_K
+from directory_index import client_directory, fournisseur_directory
+from suggest import suggester, SUGGEST_TOP_K, SUGGEST_MAX_K
 import re
-import os
+import asyncio
 import logging
 import time
 from uuid import uuid4
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from unidecode import unidecode
-import nltk
-import json
-# Téléchargement des ressources NLTK
-nltk.download('punkt')
-nltk.download('stopwords')
+from typing import Optional
 
 # Configuration de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Charger le modèle SpaCy pour le français (à installer avec `python -m spacy download fr_core_news_sm`)
-nlp = French()
+# Pipeline SpaCy français vide (tokenizer, mots vides) de /filter-avis, chargé par le registre
+nlp_models.require(BLANK_FRENCH)
 
 app = FastAPI()  # Une seule instance de FastAPI
 
-# Configurations de connexion à Fuseki
-sparql_query = SPARQLWrapper("http://localhost:3030/SmartCom/query")  # Pour les requêtes SELECT
-sparql_update = SPARQLWrapper("http://localhost:3030/SmartCom/update")  # Pour les requêtes UPDATE
+# Charger les pipelines SpaCy et vérifier les ressources NLTK au démarrage (hors de l'import)
+@app.on_event("startup")
+async def warm_up_nlp_models():
+    from lexicon_analyzer import ensure_nltk_data
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, ensure_nltk_data)
+    await loop.run_in_executor(None, nlp_models.warm_up)
+
+# Endpoint de supervision des pipelines NLP chargés
+@app.get("/nlp/models")
+async def get_nlp_models_stats():
+    return nlp_models.stats()
+
+# Fermer le pool de connexions Fuseki à l'arrêt
+@app.on_event("shutdown")
+async def close_sparql_client():
+    await sparql_client.aclose()
+
+# Endpoint de supervision de la passerelle SPARQL (requêtes en cours, file d'attente)
+@app.get("/sparql/stats")
+async def get_sparql_stats():
+    return sparql_client.stats()
 
 # Activer CORS
 app.add_middleware(
@@ -75,6 +98,9 @@ class UpdateQuantityRequest(BaseModel):
     product_uri: str
     quantity: int
 
+class RepriceRequest(BaseModel):
+    product_uri: Optional[str] = None
+
 class OrderRequest(BaseModel):
     full_name: str
     email: str
@@ -95,19 +121,97 @@ class AvisUpdate(BaseModel):
 cart_queries = CartQueries()
 order_service = OrderService()
 
-# Dictionnaire pour mapper les noms textuels aux URIs
-entity_mappings = {
-    "lave-vaisselle": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Lave-vaisselle>",
-    "lave-linge": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Lave-linge>",
-    "réfrigérateurs": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Réfrigérateurs>",
-    "aspirateurs": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Aspirateurs>",
-    "cuisinières": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Cuisinières>",
-    "micro-ondes": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Micro-ondes>",
-    "sèche-linge": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Sèche-linge>",
-    "beko": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Beko>",
-    "lg": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#LG>",
-    "samsung": "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Samsung>",
-}
+# Checkout results by idempotency key (kept 24h, bounded size): local cache in front
+# of the key stored on the order in Fuseki, which is shared by every worker
+checkout_idempotency = IdempotencyStore(ttl=24 * 3600, max_entries=10000)
+
+# Renseigner le prix unitaire des articles de panier créés avant le snapshot de prix
+@app.on_event("startup")
+async def backfill_cart_prices():
+    await cart_queries.reprice_cart_items(missing_only=True)
+
+# Charger les vues matérialisées du tableau de bord et lancer leur réconciliation
+@app.on_event("startup")
+async def start_dashboard_views():
+    await dashboard_views.start()
+
+@app.on_event("shutdown")
+async def stop_dashboard_views():
+    await dashboard_views.stop()
+
+# Endpoint de supervision des vues du tableau de bord
+@app.get("/dashboard/views")
+async def get_dashboard_views_stats():
+    return dashboard_views.stats()
+
+# Charger le vocabulaire du catalogue (catégories, marques) et lancer son rafraîchissement
+@app.on_event("startup")
+async def start_vocabulary():
+    await vocabulary.start()
+
+@app.on_event("shutdown")
+async def stop_vocabulary():
+    await vocabulary.stop()
+
+# Endpoint de supervision du vocabulaire de la recherche en langage naturel
+@app.get("/nlp/vocabulary")
+async def get_vocabulary_stats():
+    return vocabulary.stats()
+
+# Construire l'index plein texte des produits et lancer sa reconstruction périodique
+@app.on_event("startup")
+async def start_product_search():
+    await product_search.start()
+
+@app.on_event("shutdown")
+async def stop_product_search():
+    await product_search.stop()
+
+# Endpoint de supervision de l'index plein texte des produits
+@app.get("/nlp/product-index")
+async def get_product_index_stats():
+    return product_search.stats()
+
+# Construire le trie des suggestions de saisie (après l'index des produits, dont il lit les produits)
+@app.on_event("startup")
+async def start_suggester():
+    await suggester.start()
+
+@app.on_event("shutdown")
+async def stop_suggester():
+    await suggester.stop()
+
+# Endpoint de supervision des suggestions de saisie
+@app.get("/suggest/stats")
+async def get_suggest_stats():
+    return suggester.stats()
+
+# Construire les index de l'annuaire (clients, fournisseurs) et lancer leur reconstruction périodique
+@app.on_event("startup")
+async def start_directory_indexes():
+    await asyncio.gather(client_directory.start(), fournisseur_directory.start())
+
+@app.on_event("shutdown")
+async def stop_directory_indexes():
+    await client_directory.stop()
+    await fournisseur_directory.stop()
+
+# Endpoint de supervision des index de l'annuaire
+@app.get("/nlp/directories")
+async def get_directory_indexes_stats():
+    return {"clients": client_directory.stats(), "fournisseurs": fournisseur_directory.stats()}
+
+# Plans (entités, SPARQL) des questions en langage naturel, mis en cache par question normalisée ;
+# le NER des clients et fournisseurs lit les majuscules : leurs clés gardent casse et accents
+plan_cache.register("produits", analyser_question_nlp)
+plan_cache.register("stock", analyser_question_stock)
+plan_cache.register("clients", analyser_question_client, fold_accents=False)
+plan_cache.register("fournisseurs", analyser_question_fournisseur, fold_accents=False)
+
+# Endpoint de supervision du cache des plans de la recherche en langage naturel
+@app.get("/nlp/plan-cache")
+async def get_plan_cache_stats():
+    return plan_cache.stats()
 
 # Template de base pour les requêtes avec filtres multiples
 base_query = """
@@ -121,13 +225,21 @@ base_query = """
         OPTIONAL { ?produit ns:aSousCatégorie ?categorie . }
         OPTIONAL { ?produit ns:aProduitMarque ?marque . }
         OPTIONAL { ?produit ns:aImage ?image . }
+        {keyset_clause}
     }
+    {page_clause}
 """
 
+# Ordre de pagination des résultats de /sparql (un produit peut avoir plusieurs
+# catégories, marques ou images : une ligne par combinaison, toutes dans la clé)
+PRODUITS_KEYSET = Keyset(("produit", False), ("categorie", False), ("marque", False), ("image", False),
+                         ("description", False), ("prix", False))
+
 # Fonction pour transformer une question naturelle en SPARQL avec filtres multiples
-def natural_to_sparql(question):
+def natural_to_sparql(question, keyset_clause="", page_clause=""):
     question = question.lower().strip()
     filters = []
+    query = base_query.replace("{keyset_clause}", keyset_clause).replace("{page_clause}", page_clause)
 
     cat_match = re.search(r'(par categorie|by category)\s+(\w+(?:-\w+)?)', question)
     mar_match = re.search(r'(par marque|by brand)\s+(\w+)', question)
@@ -135,173 +247,79 @@ def natural_to_sparql(question):
 
     if cat_match:
         cat_name = cat_match.group(2)
-        cat_uri = entity_mappings.get(cat_name, f"<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#{cat_name}>")
+        cat_uri = f"<{vocabulary.snapshot.lookup(cat_name) or 'http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#' + cat_name}>"
         filters.append(f"?produit ns:aSousCatégorie ?categorie . FILTER (?categorie = {cat_uri})")
     if mar_match:
         mar_name = mar_match.group(2)
-        mar_uri = entity_mappings.get(mar_name, f"<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#{mar_name}>")
+        mar_uri = f"<{vocabulary.snapshot.lookup(mar_name) or 'http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#' + mar_name}>"
         filters.append(f"?produit ns:aProduitMarque ?marqueUri . FILTER (?marqueUri = {mar_uri})")
     if prix_match:
         prix_value = prix_match.group(2)
         filters.append(f"?produit ns:aPrix ?prix . FILTER (?prix < {prix_value} && datatype(?prix) = <http://www.w3.org/2001/XMLSchema#decimal>)")
 
     if not filters and "liste des produits" in question:
-        return base_query.replace("{filter_clause}", "")
+        return query.replace("{filter_clause}", "")
     elif not filters and "list of products" in question:
-        return base_query.replace("{filter_clause}", "")
+        return query.replace("{filter_clause}", "")
 
     if filters:
         filter_clause = " . ".join(filters)
-        return base_query.replace("{filter_clause}", filter_clause)
+        return query.replace("{filter_clause}", filter_clause)
 
     return None
 
-# Classe pour l'analyse de sentiment
-class LexiconAnalyzer:
-    def __init__(self, data_path):
-        self.emolex_words = defaultdict(lambda: defaultdict(list))
-        self.nrc_emotions = {}
-        self.tunisian_words = {}
-        self.emoji_emotions = {}
-        self.emotions_list = ['anger', 'anticipation', 'disgust', 'fear', 'joy', 'negative', 'positive', 'sadness', 'surprise', 'trust']
-        self.stop_words = {
-            'french': set(stopwords.words('french')),
-            'english': set(stopwords.words('english'))
-        }
-        self.french_keywords = set(['triste', 'génial', 'joyeux', 'heureux', 'content', 'belle', 'beau', 'joli', "j'adore", 'super', 'tristesse', 'colère', 'peur', 'joie'])
-        self.tunisian_keywords = set(['farhèn', 'nebki', 'mridha', 'khayef', 'zwin', 'yallah', 'fer7an'])
-        self.english_keywords = set(['happy', 'sad', 'angry', 'fear', 'joy', 'love', 'awesome', 'great'])
-        self.data_path = data_path
-        self.load_lexicons()
-        self.load_emoji_emotions()
-
-    def load_emoji_emotions(self):
-        emoji_file = os.path.join(self.data_path, 'emojis.json')
-        try:
-            with open(emoji_file, 'r', encoding='utf-8') as f:
-                emoji_data = json.load(f)
-                for item in emoji_data:
-                    emoji = item['emoji']
-                    emotions = item['emotions']
-                    self.emoji_emotions[emoji] = {emo: score for emo, score in emotions.items() if score > 0}
-            logger.info(f"✅ Emojis chargés: {len(self.emoji_emotions)} emojis")
-        except Exception as e:
-            logger.error(f"Erreur lors du chargement des emojis: {e}")
-
-    def load_lexicons(self):
-        lexicons_path = os.path.join(self.data_path, 'lexicons')
-        onefile_path = os.path.join(self.data_path, 'OneFilePerEmotion')
-        self.load_emolex_tunisian(os.path.join(lexicons_path, 'tunisian_emolex.txt'))
-        self.load_emolex_french(os.path.join(lexicons_path, 'french_emolex.txt'))
-        self.load_nrc_emotions(onefile_path)
-
-    def load_emolex_tunisian(self, filepath):
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    next(f)  # Ignorer l'en-tête
-                    for line in f:
-                        parts = [p.strip() for p in line.split('\t')]
-                        if len(parts) >= 12:
-                            word = parts[-1].lower()
-                            word_no_accent = unidecode(word)
-                            emotion_scores = [int(parts[i]) for i in range(1, 11)]
-                            word_emotions = [emo for i, emo in enumerate(self.emotions_list) if emotion_scores[i] == 1]
-                            if word_emotions:
-                                self.tunisian_words[word] = word_emotions
-                                self.tunisian_words[word_no_accent] = word_emotions
-                logger.info(f"✅ Tunisian: {len(self.tunisian_words)} mots")
-            except Exception as e:
-                logger.error(f"Tunisian error: {e}")
-
-    def load_emolex_french(self, filepath):
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    next(f)  # Ignorer l'en-tête
-                    for line in f:
-                        parts = [p.strip() for p in line.split('\t')]
-                        if len(parts) >= 12:
-                            word = parts[-1].lower()
-                            word_no_accent = unidecode(word)
-                            emotion_scores = [int(parts[i]) for i in range(1, 11)]
-                            for i, emo in enumerate(self.emotions_list):
-                                if emotion_scores[i] == 1:
-                                    self.emolex_words[emo]['french'].append(word)
-                                    self.emolex_words[emo]['french'].append(word_no_accent)
-                logger.info(f"✅ French EMOLEX")
-            except Exception as e:
-                logger.error(f"French error: {e}")
-
-    def load_nrc_emotions(self, path):
-        try:
-            for filename in os.listdir(path):
-                if '-NRC-Emotion-Lexicon.txt' in filename:
-                    emotion = filename.replace('-NRC-Emotion-Lexicon.txt', '').lower()
-                    filepath = os.path.join(path, filename)
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        self.nrc_emotions[emotion] = {line.split('\t')[0].lower() for line in f if len(line.split('\t')) == 2 and line.split('\t')[1].strip() == '1'}
-            logger.info(f"✅ NRC chargé: {len(self.nrc_emotions)} émotions")
-        except Exception as e:
-            logger.error(f"NRC error: {e}")
-
-    def preprocess_text(self, text, lang):
-        text_lower = text.lower()
-        emojis = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]').findall(text)
-        text_no_emojis = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]').sub('', text_lower)
-        tokens = word_tokenize(text_no_emojis, language='french' if lang in ['french', 'tunisian'] else 'english')
-        tokens = [t for t in tokens if t not in self.stop_words.get(lang, set()) and len(t) >= 2]
-        tokens.extend([unidecode(t) for t in tokens])
-        return list(set(tokens)), emojis
-
-    def detect_language(self, text):
-        tokens, _ = self.preprocess_text(text, 'french')
-        french_count = sum(1 for w in tokens if w in self.french_keywords or unidecode(w) in self.french_keywords)
-        tunisian_count = sum(1 for w in tokens if w in self.tunisian_keywords)
-        english_count = sum(1 for w in tokens if w in self.english_keywords)
-        return 'tunisian' if tunisian_count > 0 else 'french' if french_count > english_count else 'english'
-
-    def analyze_sentiment(self, text):
-        lang = self.detect_language(text)
-        words, emojis = self.preprocess_text(text, lang)
-        emotions = Counter()
-
-        if lang == 'tunisian':
-            for word in words:
-                word_no_accent = unidecode(word)
-                if word in self.tunisian_words or word_no_accent in self.tunisian_words:
-                    emotions.update(self.tunisian_words.get(word, []) or self.tunisian_words.get(word_no_accent, []))
-        else:
-            for word in words:
-                word_no_accent = unidecode(word)
-                for emo in self.emotions_list:
-                    if lang == 'english' and word in self.nrc_emotions.get(emo, set()) or word_no_accent in self.nrc_emotions.get(emo, set()):
-                        emotions[emo] += 1
-                    elif word in self.emolex_words[emo].get(lang, []) or word_no_accent in self.emolex_words[emo].get(lang, []):
-                        emotions[emo] += 1
-
-        for emoji in emojis:
-            if emoji in self.emoji_emotions:
-                emotions.update(self.emoji_emotions[emoji])
-
-        compound = (emotions.get('positive', 0) + emotions.get('joy', 0) - (emotions.get('negative', 0) + emotions.get('anger', 0) + emotions.get('sadness', 0) + emotions.get('fear', 0))) / max(sum(emotions.values()), 1)
-        return 'positive' if compound > 0.2 else 'negative' if compound < -0.2 else 'neutral'
-
-# Initialisation de l'analyseur
-analyzer = LexiconAnalyzer(data_path="C:\\ShopHub\\ShopHub\\FastAPI\\data")
+# Pools de processus d'analyse : un pool dédié aux avis unitaires (regroupés en
+# micro-lots), que l'import en masse et la re-classification ne peuvent pas occuper ;
+# chaque processus charge son LexiconAnalyzer depuis ce dossier
+SENTIMENT_DATA_PATH = "C:\\ShopHub\\ShopHub\\FastAPI\\data"
+live_sentiment_pool = SentimentPool(data_path=SENTIMENT_DATA_PATH, workers=SENTIMENT_LIVE_WORKERS)
+sentiment_pool = SentimentPool(data_path=SENTIMENT_DATA_PATH)
+sentiment_batcher = SentimentBatcher(live_sentiment_pool)
+avis_ingestion = AvisIngestion(sentiment_pool)
+
+# Re-classification des avis stockés (après un changement des lexiques ou des seuils)
+reclassification = ReclassificationJob(sentiment_pool)
+
+@app.on_event("startup")
+async def start_sentiment_batcher():
+    await sentiment_batcher.start()
+
+@app.on_event("shutdown")
+async def stop_sentiment_pool():
+    await reclassification.cancel()
+    await sentiment_batcher.stop()
+    live_sentiment_pool.shutdown()
+    sentiment_pool.shutdown()
+
+# Endpoint de supervision de l'analyse de sentiment (taille des lots, avis classés provisoirement)
+@app.get("/avis/scoring/stats")
+async def get_sentiment_scoring_stats():
+    return {**sentiment_batcher.stats(), "bulk_pool": sentiment_pool.stats()}
 
 # Endpoint pour récupérer les produits
 @app.get("/sparql")
-async def get_sparql_results(question: str):
-    sparql_query.setQuery(natural_to_sparql(question))
-    if not sparql_query.query:
+async def get_sparql_results(question: str,
+                             limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                             cursor: Optional[str] = None):
+    size = page_size(limit, cursor)
+    try:
+        if size is None:
+            query = natural_to_sparql(question)
+        else:
+            query = natural_to_sparql(question, PRODUITS_KEYSET.filter(cursor), PRODUITS_KEYSET.modifiers(size))
+    except InvalidCursor as e:
+        return {"error": str(e)}
+    if not query:
         return {"error": "Question non reconnue. Exemples : 'liste des produits', 'produits par categorie Lave-vaisselle et marque Beko', 'products with price less than 500'."}
 
-    print("Générée SPARQL Query:", sparql_query.query)
-    sparql_query.setReturnFormat(JSON)
+    print("Générée SPARQL Query:", query)
     try:
-        results = sparql_query.query().convert()
-        return {"results": results["results"]["bindings"]}
+        results = await sparql_client.query(query)
+        bindings = results["results"]["bindings"]
+        if size is None:
+            return {"results": bindings}
+        rows, next_cursor = PRODUITS_KEYSET.page(bindings, size)
+        return {"results": rows, "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
@@ -317,7 +335,7 @@ async def filter_avis(query: NaturalQuery):
     question = query.question.lower().strip()
 
     # Analyse avec SpaCy
-    doc = nlp(question)
+    doc = nlp_models.get(BLANK_FRENCH)(question)
     entities = [ent.text for ent in doc.ents]
     tokens = [token.text for token in doc if not token.is_stop]
 
@@ -372,10 +390,8 @@ async def filter_avis(query: NaturalQuery):
         """
         print("Requête SPARQL pour", filter_type, ":", sparql_query_text)  # Débogage
 
-    sparql_query.setQuery(sparql_query_text)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(sparql_query_text)
         print("Résultats bruts:", results)  # Débogage
         avis_list = results.get("results", {}).get("bindings", [])
         return {"avis": avis_list}  # Retourne explicitement la liste des bindings
@@ -390,8 +406,9 @@ async def filter_avis(query: NaturalQuery):
 async def get_cart(client_id: int = 1):
     """Get all items in the cart for a client"""
     try:
-        items = cart_queries.get_cart_items(client_id)
-        summary = cart_queries.get_cart_summary(client_id)
+        # Une seule requête : le résumé est calculé à partir des articles
+        items = await cart_queries.get_cart_items(client_id)
+        summary = cart_queries.summarize_items(items)
         return {
             "items": items or [],
             "summary": summary
@@ -401,11 +418,23 @@ async def get_cart(client_id: int = 1):
 
 # Add new endpoints for order management
 @app.get("/orders")
-async def get_all_orders():
-    """Get all orders in the system"""
+async def get_all_orders(limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None, stream: bool = False):
+    """Get all orders in the system
+    
+    Without limit/cursor the full list is returned; otherwise one page of
+    orders (newest first) with the cursor of the next page. With stream=true
+    every order is streamed as NDJSON, one line per order, unordered (exports).
+    """
+    if stream:
+        return ndjson_response(order_service.stream_all_orders())
     try:
-        orders = order_service.get_all_orders()
-        return orders
+        size = page_size(limit, cursor)
+        if size is None:
+            return await order_service.get_all_orders()
+        return await order_service.get_orders_page(size, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -413,7 +442,7 @@ async def get_all_orders():
 async def get_client_orders(client_id: int):
     """Get all orders for a specific client"""
     try:
-        orders = order_service.get_client_orders(client_id)
+        orders = await order_service.get_client_orders(client_id)
         return {"orders": orders}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -422,7 +451,7 @@ async def get_client_orders(client_id: int):
 async def cancel_order(order_id: str):
     """Cancel a specific order"""
     try:
-        result = order_service.cancel_order(order_id)
+        result = await order_service.cancel_order(order_id)
         if result["success"]:
             return {"message": result["message"]}
         else:
@@ -434,7 +463,7 @@ async def cancel_order(order_id: str):
 async def get_order_details(order_id: str):
     """Get detailed information about a specific order"""
     try:
-        order = order_service.get_order_details(order_id)
+        order = await order_service.get_order_details(order_id)
         if order:
             return order
         else:
@@ -446,7 +475,7 @@ async def get_order_details(order_id: str):
 async def get_cart_summary(client_id: int = 1):
     """Get cart summary (total items and amount)"""
     try:
-        summary = cart_queries.get_cart_summary(client_id)
+        summary = await cart_queries.get_cart_summary(client_id)
         return summary
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -455,7 +484,7 @@ async def get_cart_summary(client_id: int = 1):
 async def add_to_cart(request: AddToCartRequest):
     """Add a product to the cart"""
     try:
-        success = cart_queries.add_to_cart(request.client_id, request.product_uri, request.quantity)
+        success = await cart_queries.add_to_cart(request.client_id, request.product_uri, request.quantity)
         if success:
             return {"success": True, "message": f"Product added to cart with quantity {request.quantity}"}
         else:
@@ -467,7 +496,7 @@ async def add_to_cart(request: AddToCartRequest):
 async def remove_from_cart(request: RemoveFromCartRequest):
     """Remove a product from the cart"""
     try:
-        success = cart_queries.remove_from_cart(request.client_id, request.product_uri)
+        success = await cart_queries.remove_from_cart(request.client_id, request.product_uri)
         if success:
             return {"success": True, "message": "Product removed from cart"}
         else:
@@ -479,7 +508,7 @@ async def remove_from_cart(request: RemoveFromCartRequest):
 async def clear_cart(client_id: int = 1):
     """Clear all items from the cart"""
     try:
-        success = cart_queries.clear_cart(client_id)
+        success = await cart_queries.clear_cart(client_id)
         if success:
             return {"success": True, "message": "Cart cleared"}
         else:
@@ -488,26 +517,52 @@ async def clear_cart(client_id: int = 1):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/cart/{client_id}/checkout")
-async def checkout_cart(client_id: int, order_details: OrderRequest):
-    """Convert cart to order with customer details"""
+async def checkout_cart(client_id: int, order_details: OrderRequest,
+                        idempotency_key: Optional[str] = Header(default=None)):
+    """Convert cart to order with customer details
+    
+    A retried request carrying the same Idempotency-Key header returns the
+    original order instead of creating a second one, whichever worker handles
+    it; the same key with a different client or order details is rejected (422).
+    """
     try:
-        # Check if cart is empty before proceeding
-        cart_summary = cart_queries.get_cart_summary(client_id)
-        if not cart_summary or cart_summary.get("totalItems", 0) == 0:
-            raise HTTPException(status_code=400, detail="Cart is empty")
-        
         # Convert Pydantic model to dict
         order_data = order_details.dict()
         
-        # Create order using the order service
-        result = order_service.create_order_from_cart(client_id, order_data)
+        # Create order, its line items and clear the cart in one update request
+        # (an empty cart is reported by the order service)
+        if idempotency_key:
+            fingerprint = request_fingerprint(client_id, order_data)
+            result = await checkout_idempotency.run(
+                idempotency_key,
+                lambda: order_service.create_order_from_cart(client_id, order_data, idempotency_key, fingerprint),
+                should_store=lambda result: result["success"],
+                fingerprint=fingerprint
+            )
+        else:
+            result = await order_service.create_order_from_cart(client_id, order_data)
         
         if result["success"]:
-            # Clear the cart after successful order creation
-            cart_queries.clear_cart(client_id)
             return result
         else:
             raise HTTPException(status_code=400, detail=result["message"])
+    except IdempotencyConflict as e:
+        # Same key, different client or order details
+        raise HTTPException(status_code=422, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/cart/reprice")
+async def reprice_cart_items(request: RepriceRequest):
+    """Refresh cart item unit prices after a product price change"""
+    try:
+        success = await cart_queries.reprice_cart_items(request.product_uri)
+        if success:
+            return {"success": True, "message": "Cart prices updated"}
+        else:
+            raise HTTPException(status_code=400, detail="Failed to update cart prices")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -515,7 +570,7 @@ async def checkout_cart(client_id: int, order_details: OrderRequest):
 async def update_cart_quantity(client_id: int, request: UpdateQuantityRequest):
     """Update quantity of an item in the cart"""
     try:
-        success = cart_queries.update_cart_quantity(client_id, request.product_uri, request.quantity)
+        success = await cart_queries.update_cart_quantity(client_id, request.product_uri, request.quantity)
         if success:
             return {"success": True, "message": f"Quantity updated to {request.quantity}"}
         else:
@@ -545,10 +600,8 @@ async def get_avis(product_uri: str):
             OPTIONAL {{ ?avis a ?type . }}
         }}
     """
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(query, cache=True)
         return {"avis": results["results"]["bindings"]}
     except Exception as e:
         return {"error": str(e)}
@@ -559,7 +612,14 @@ async def add_avis(avis: AvisInput):
     if not avis.product_uri.startswith("<http://") or not avis.product_uri.endswith(">"):
         avis.product_uri = f"<{avis.product_uri}>"
     avis_uri = f"<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Avis_{uuid4()}>"
-    sentiment = analyzer.analyze_sentiment(avis.commentaire)
+    # Pool occupé ou en redémarrage : l'avis est enregistré quand même, classé par
+    # défaut et marqué pour que la re-classification le re-score
+    provisoire = ""
+    try:
+        sentiment = await sentiment_batcher.score(avis.commentaire)
+    except SentimentUnavailable:
+        sentiment = FALLBACK_SENTIMENT
+        provisoire = f"{avis_uri} <{PROVISIONAL_SENTIMENT}> true ."
     avis_class = {
         'positive': "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Avis_positif>",
         'negative': "<http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Avis_négatif>",
@@ -574,17 +634,48 @@ async def add_avis(avis: AvisInput):
             {avis_uri} ns:aNote "{avis.note}"^^xsd:decimal .
             {avis_uri} ns:aCommentaire "{avis.commentaire}"^^xsd:string .
             {avis_uri} ns:aAvisProduit {avis.product_uri} .
+            {provisoire}
         }}
     """
     print("Générée SPARQL Update Query:", insert_query)
-    sparql_update.setQuery(insert_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
-        return {"message": "Avis ajouté avec succès", "avis_uri": avis_uri, "sentiment": sentiment}
+        await sparql_client.update(insert_query)
+        dashboard_views.avis_written(avis_uri, sentiment=sentiment, note=avis.note)
+        return {"message": "Avis ajouté avec succès", "avis_uri": avis_uri, "sentiment": sentiment,
+                "sentiment_provisoire": bool(provisoire)}
+    except Exception as e:
+        return {"error": str(e)}
+
+# Endpoint pour importer des avis en masse (corps JSONL : un avis par ligne,
+# {"product_uri": ..., "note": ..., "commentaire": ...})
+@app.post("/add-avis/bulk")
+async def add_avis_bulk(request: Request):
+    try:
+        return await avis_ingestion.ingest(request.stream())
     except Exception as e:
         return {"error": str(e)}
 
+# Endpoint pour lancer la re-classification de tous les avis (tâche de fond ;
+# resume=true reprend après la dernière page écrite d'un job interrompu,
+# pending_only=true ne re-score que les avis classés provisoirement)
+@app.post("/avis/reclassify")
+async def start_reclassification(resume: bool = True, pending_only: bool = False):
+    if not reclassification.start(resume=resume, pending_only=pending_only):
+        raise HTTPException(status_code=409, detail="Une re-classification est déjà en cours")
+    return reclassification.status()
+
+# Endpoint de suivi de la re-classification (avancement, débit, temps restant estimé)
+@app.get("/avis/reclassify/status")
+async def get_reclassification_status():
+    return reclassification.status()
+
+# Endpoint pour interrompre la re-classification (elle pourra être reprise)
+@app.post("/avis/reclassify/cancel")
+async def cancel_reclassification():
+    if not await reclassification.cancel():
+        raise HTTPException(status_code=409, detail="Aucune re-classification en cours")
+    return reclassification.status()
+
 # Endpoint pour supprimer un avis
 @app.delete("/delete-avis")
 async def delete_avis(avis_uri: str):
@@ -594,10 +685,9 @@ async def delete_avis(avis_uri: str):
             <{avis_uri}> ?p ?o .
         }}
     """
-    sparql_update.setQuery(delete_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(delete_query, touches=["ns:Avis", "ns:Avis_positif", "ns:Avis_négatif"])
+        dashboard_views.avis_deleted(avis_uri)
         return {"message": "Avis supprimé avec succès"}
     except Exception as e:
         return {"error": str(e)}
@@ -621,17 +711,16 @@ async def update_avis(avis: AvisUpdate):
             <{avis.avis_uri}> ns:aCommentaire ?oldCommentaire .
         }}
     """
-    sparql_update.setQuery(update_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(update_query)
+        dashboard_views.avis_written(avis.avis_uri, note=avis.note)
         return {"message": "Avis modifié avec succès"}
     except Exception as e:
         return {"error": str(e)}
 
 # Endpoint pour la recherche NLP (Langage Naturel)
 @app.post("/search-products-nlp")
-async def search_products_nlp(question: str):
+async def search_products_nlp(question: str, top_k: int = Query(default=SEARCH_TOP_K, ge=1, le=MAX_PAGE_SIZE)):
     """
     Recherche de produits en utilisant le traitement du langage naturel (NLP).
     L'utilisateur peut poser une question en français et le système la convertit en SPARQL.
@@ -640,36 +729,62 @@ async def search_products_nlp(question: str):
     - "Quels sont les produits de la catégorie lave-vaisselle ?"
     - "Montre-moi les réfrigérateurs Samsung"
     - "Je cherche des lave-linge avec un prix inférieur à 600 euros"
+    - "Réfrigérateur inox A+++ silencieux" (termes libres : les top_k produits les plus pertinents)
     """
     try:
-        # Analyser la question avec SpaCy
-        analyse = analyser_question_nlp(question)
+        # Analyser la question (plan en cache si elle a déjà été posée)
+        analyse = plan_cache.analyse("produits", question)
         
         if "error" in analyse:
             return {"error": analyse["error"]}
         
-        # Exécuter la requête SPARQL générée
-        sparql_query.setQuery(analyse["sparql_query"])
-        sparql_query.setReturnFormat(JSON)
+        # Termes libres : classement BM25 dans l'index en mémoire, avec les filtres extraits
+        # (la requête SPARQL générée ne porte que sur les filtres). Si aucun terme n'est connu
+        # de l'index, le classement serait vide : les filtres seuls s'appliquent, via Fuseki
+        termes = analyse["entites"].get("termes") or []
+        if product_search.ready and product_search.known_terms(termes):
+            return {
+                "question": question,
+                "entites_detectees": analyse["entites"],
+                "sparql_genere": analyse["sparql_query"],
+                "moteur": "bm25",
+                "results": product_search.search(analyse["entites"], top_k)
+            }
         
-        results = sparql_query.query().convert()
+        # Exécuter la requête SPARQL générée
+        results = await sparql_client.query(analyse["sparql_query"])
         
         return {
             "question": question,
             "entites_detectees": analyse["entites"],
             "sparql_genere": analyse["sparql_query"],
+            "moteur": "sparql",
             "results": results["results"]["bindings"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Endpoint des suggestions de saisie (autocomplétion de la barre de recherche)
+@app.get("/suggest")
+async def suggest(q: str = Query(min_length=1), k: int = Query(default=SUGGEST_TOP_K, ge=1, le=SUGGEST_MAX_K)):
+    """
+    Complétions d'un début de saisie : catégories, marques et produits, des plus
+    populaires aux moins populaires (casse et accents ignorés).
+
+    Exemples : "lave" -> Lave-linge, Lave-vaisselle ; "refri" -> Réfrigérateurs
+    """
+    return {"query": q, "suggestions": suggester.suggest(q, k)}
+
 # Nouveau endpoint pour les statistiques des avis
 @app.get("/dashboard/avis-stats")
 async def get_avis_stats():
+    if dashboard_views.ready:
+        return dashboard_views.avis_stats()
+    # Un comptage et une somme des notes par type d'avis, calculés par Fuseki
     query = """
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
         PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-        SELECT ?type ?note
+        SELECT ?type (COUNT(?note) AS ?count) (SUM(xsd:double(?note)) AS ?total)
         WHERE {
             {
                 ?avis a ns:Avis_positif .
@@ -683,28 +798,28 @@ async def get_avis_stats():
             }
             ?avis ns:aNote ?note .
         }
+        GROUP BY ?type
     """
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
-        bindings = results["results"]["bindings"]
+        rows = await sparql_client.aggregate(query)
         
-        # Compter les avis par type
+        # Répartir les comptages par type
         avis_counts = {"positive": 0, "negative": 0, "neutral": 0}
         total_notes = 0
         note_count = 0
         
-        for binding in bindings:
-            note = float(binding["note"]["value"])
-            if "Avis_positif" in binding["type"]["value"]:
-                avis_counts["positive"] += 1
-            elif "Avis_négatif" in binding["type"]["value"]:
-                avis_counts["negative"] += 1
+        for row in rows:
+            if not row.get("type"):
+                continue
+            count = int(row.get("count") or 0)
+            if "Avis_positif" in row["type"]:
+                avis_counts["positive"] += count
+            elif "Avis_négatif" in row["type"]:
+                avis_counts["negative"] += count
             else:
-                avis_counts["neutral"] += 1
-            total_notes += note
-            note_count += 1
+                avis_counts["neutral"] += count
+            total_notes += float(row.get("total") or 0)
+            note_count += count
         
         # Calculer la moyenne des notes
         average_note = total_notes / note_count if note_count > 0 else 0
@@ -732,22 +847,22 @@ async def search_suppliers_nlp(question: str):
     - "Fournisseur Samsung en Tunisie"
     """
     try:
-        # Analyser la question avec SpaCy
-        analyse = analyser_question_fournisseur(question)
+        # Analyser la question (plan en cache si elle a déjà été posée)
+        analyse = plan_cache.analyse("fournisseurs", question)
         
         if "error" in analyse:
             return {"error": analyse["error"]}
         
-        # Exécuter la requête SPARQL générée
-        sparql_query.setQuery(analyse["sparql_query"])
-        sparql_query.setReturnFormat(JSON)
+        # Filtres résolus par l'index de l'annuaire (VALUES) ; sinon la requête générée (regex)
+        sparql_query = construire_requete_index_fournisseur(analyse["entites"]) or analyse["sparql_query"]
         
-        results = sparql_query.query().convert()
+        # Exécuter la requête SPARQL
+        results = await sparql_client.query(sparql_query)
         
         return {
             "question": question,
             "entites_detectees": analyse["entites"],
-            "sparql_genere": analyse["sparql_query"],
+            "sparql_genere": sparql_query,
             "results": results["results"]["bindings"]
         }
     except Exception as e:
@@ -767,17 +882,14 @@ async def search_stock_nlp(question: str):
     - "Tous les produits avec un stock supérieur à 50 unités"
     """
     try:
-        # Analyser la question avec SpaCy
-        analyse = analyser_question_stock(question)
+        # Analyser la question (plan en cache si elle a déjà été posée)
+        analyse = plan_cache.analyse("stock", question)
         
         if "error" in analyse:
             return {"error": analyse["error"]}
         
         # Exécuter la requête SPARQL générée
-        sparql_query.setQuery(analyse["sparql_query"])
-        sparql_query.setReturnFormat(JSON)
-        
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(analyse["sparql_query"])
         
         return {
             "question": question,
@@ -802,22 +914,22 @@ async def search_clients_nlp(question: str):
     - "Liste des clients français"
     """
     try:
-        # Analyser la question avec SpaCy
-        analyse = analyser_question_client(question)
+        # Analyser la question (plan en cache si elle a déjà été posée)
+        analyse = plan_cache.analyse("clients", question)
         
         if "error" in analyse:
             return {"error": analyse["error"]}
         
-        # Exécuter la requête SPARQL générée
-        sparql_query.setQuery(analyse["sparql_query"])
-        sparql_query.setReturnFormat(JSON)
+        # Filtres résolus par l'index de l'annuaire (VALUES) ; sinon la requête générée (regex)
+        sparql_query = construire_requete_index_client(analyse["entites"]) or analyse["sparql_query"]
         
-        results = sparql_query.query().convert()
+        # Exécuter la requête SPARQL
+        results = await sparql_client.query(sparql_query)
         
         return {
             "question": question,
             "entites_detectees": analyse["entites"],
-            "sparql_genere": analyse["sparql_query"],
+            "sparql_genere": sparql_query,
             "results": results["results"]["bindings"]
         }
     except Exception as e:
@@ -826,6 +938,8 @@ async def search_clients_nlp(question: str):
 # Nouveau endpoint pour les produits par catégorie
 @app.get("/dashboard/products-by-category")
 async def get_products_by_category():
+    if dashboard_views.ready:
+        return dashboard_views.products_by_category()
     query = """
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
         SELECT ?categorie (COUNT(?produit) AS ?count)
@@ -835,23 +949,17 @@ async def get_products_by_category():
         }
         GROUP BY ?categorie
     """
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
-        bindings = results["results"]["bindings"]
-        categories = {}
-        for binding in bindings:
-            cat_name = binding["categorie"]["value"].split("#")[1]
-            count = int(binding["count"]["value"])
-            categories[cat_name] = count
-        return categories
+        rows = await sparql_client.aggregate(query)
+        return {row["categorie"].split("#")[1]: int(row["count"]) for row in rows if row.get("categorie")}
     except Exception as e:
         return {"error": str(e)}
 
 # Nouveau endpoint pour les produits par marque
 @app.get("/dashboard/products-by-brand")
 async def get_products_by_brand():
+    if dashboard_views.ready:
+        return dashboard_views.products_by_brand()
     query = """
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
         SELECT ?marque (COUNT(?produit) AS ?count)
@@ -861,17 +969,9 @@ async def get_products_by_brand():
         }
         GROUP BY ?marque
     """
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
-        bindings = results["results"]["bindings"]
-        brands = {}
-        for binding in bindings:
-            brand_name = binding["marque"]["value"].split("#")[1]
-            count = int(binding["count"]["value"])
-            brands[brand_name] = count
-        return brands
+        rows = await sparql_client.aggregate(query)
+        return {row["marque"].split("#")[1]: int(row["count"]) for row in rows if row.get("marque")}
 
     except Exception as e:
         return {"error": str(e)}
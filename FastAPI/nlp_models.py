@@ -0,0 +1,146 @@
+"""
+Registre des modèles NLP du processus
+Les modules de recherche en langage naturel et main demandent leurs pipelines
+SpaCy à ce registre au lieu de les charger à l'import : chaque pipeline est
+chargé une seule fois (au premier usage ou pendant warm_up, au démarrage),
+avec uniquement les composants demandés. SpaCy lui-même n'est importé qu'au
+premier chargement, ce qui garde l'import de main rapide et sans accès réseau.
+
+Vérification du temps d'import : python nlp_models.py [budget_en_secondes]
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Modèle français (à installer avec `python -m spacy download fr_core_news_sm`)
+FRENCH_MODEL = "fr_core_news_sm"
+# Pipeline français vide (tokenizer et mots vides, sans modèle à installer)
+BLANK_FRENCH = "blank:fr"
+# Composants nécessaires à l'extraction des entités nommées (PER, ORG)
+NER_COMPONENTS = ("ner",)
+
+# Budget (secondes) de `import main` dans un nouvel interpréteur
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "3.0"))
+
+
+class NlpModels:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pipelines: Dict[Tuple[str, Tuple[str, ...]], object] = {}
+        self._required: Set[Tuple[str, Tuple[str, ...]]] = set()
+        self._missing: Set[str] = set()
+        self.load_times: Dict[str, float] = {}
+
+    @staticmethod
+    def _key(name: str, components: Iterable[str]) -> Tuple[str, Tuple[str, ...]]:
+        return name, tuple(sorted(set(components)))
+
+    def require(self, name: str, components: Iterable[str] = ()) -> None:
+        """Déclare un pipeline à charger pendant warm_up (appelé à l'import des modules)"""
+        self._required.add(self._key(name, components))
+
+    def available(self, name: str) -> bool:
+        """Le modèle est-il installé (sans le charger) ?"""
+        if name.startswith("blank:"):
+            return True
+        if name in self._missing:
+            return False
+        import spacy.util
+        if spacy.util.is_package(name):
+            return True
+        self._missing.add(name)
+        logger.error(f"Le modèle {name} n'est pas installé. Exécutez: python -m spacy download {name}")
+        return False
+
+    def _load(self, name: str, components: Tuple[str, ...]):
+        import spacy
+        debut = time.perf_counter()
+        if name.startswith("blank:"):
+            nlp = spacy.blank(name[len("blank:"):])
+        else:
+            # Les composants non demandés ne sont pas chargés du tout
+            meta = spacy.util.get_model_meta(spacy.util.get_package_path(name))
+            pipes = meta.get("components") or meta.get("pipeline", [])
+            nlp = spacy.load(name, exclude=[pipe for pipe in pipes if pipe not in components])
+        label = f"{name}[{','.join(components)}]"
+        self.load_times[label] = round(time.perf_counter() - debut, 3)
+        logger.info(f"✅ Pipeline SpaCy {label} chargé en {self.load_times[label]}s")
+        return nlp
+
+    def get(self, name: str, components: Iterable[str] = ()):
+        """
+        Retourne le pipeline (chargé une fois par processus).
+
+        Args:
+            name: Le nom du modèle SpaCy installé (ex. FRENCH_MODEL), ou "blank:<langue>"
+                  pour un pipeline vide (ex. BLANK_FRENCH)
+            components: Les composants à charger (ex. NER_COMPONENTS) ; le tokenizer
+                        est toujours présent. Un composant qui écoute le tok2vec
+                        partagé doit être demandé avec "tok2vec".
+
+        Returns:
+            Le pipeline SpaCy, ou None si le modèle n'est pas installé
+        """
+        key = self._key(name, components)
+        nlp = self._pipelines.get(key)
+        if nlp is not None:
+            return nlp
+        if not self.available(name):
+            return None
+        with self._lock:
+            if key not in self._pipelines:
+                self._pipelines[key] = self._load(*key)
+            return self._pipelines[key]
+
+    def warm_up(self) -> None:
+        """Charge tous les pipelines déclarés par require (au démarrage de l'application)"""
+        for name, components in sorted(self._required):
+            self.get(name, components)
+
+    def stats(self) -> Dict:
+        return {
+            "loaded": sorted(f"{name}[{','.join(components)}]" for name, components in self._pipelines),
+            "missing": sorted(self._missing),
+            "load_times": self.load_times
+        }
+
+
+# Registre partagé par main et les modules de recherche
+nlp_models = NlpModels()
+
+
+# Vérification du budget de temps d'import de main (à lancer en CI ou avant un déploiement)
+if __name__ == "__main__":
+    import subprocess
+    import sys
+
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_TIME_BUDGET
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = (
+        "import sys, time\n"
+        "debut = time.perf_counter()\n"
+        "import main\n"
+        "print(time.perf_counter() - debut)\n"
+        "print(','.join(m for m in ('spacy', 'nltk', 'torch') if m in sys.modules))\n"
+    )
+    mesures: List[float] = []
+    for _ in range(3):
+        sortie = subprocess.run([sys.executable, "-c", script], cwd=here, capture_output=True, text=True)
+        if sortie.returncode != 0:
+            print(sortie.stderr)
+            sys.exit(1)
+        duree, lourds = sortie.stdout.splitlines()[-2:]
+        mesures.append(float(duree))
+    meilleure = min(mesures)
+    print(f"import main: {meilleure:.2f}s (budget {budget:.2f}s), mesures: {', '.join(f'{m:.2f}' for m in mesures)}")
+    if lourds:
+        print(f"ÉCHEC: modules chargés à l'import: {lourds}")
+        sys.exit(1)
+    if meilleure > budget:
+        print("ÉCHEC: budget de temps d'import dépassé")
+        sys.exit(1)
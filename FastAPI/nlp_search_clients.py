@@ -1,13 +1,11 @@
-import spacy
 import re
 from typing import Dict, List, Optional
+from nlp_models import nlp_models, FRENCH_MODEL, NER_COMPONENTS
+from entity_matcher import EntityMatcher
+from directory_index import client_directory
 
-# Charger le modèle français de SpaCy
-try:
-    nlp = spacy.load("fr_core_news_sm")
-except OSError:
-    print("Le modèle français n'est pas installé. Exécutez: python -m spacy download fr_core_news_sm")
-    nlp = None
+# Modèle français de SpaCy (entités nommées), chargé par le registre au démarrage
+nlp_models.require(FRENCH_MODEL, NER_COMPONENTS)
 
 # Dictionnaire des pays et leurs variantes
 PAYS = {
@@ -27,6 +25,9 @@ PAYS = {
     "corée": ["corée", "coréen", "coréenne", "séoul", "korea"]
 }
 
+# Reconnaissance des pays (expression compilée une fois)
+PAYS_MATCHER = EntityMatcher(PAYS)
+
 
 def extraire_entites_client(question: str) -> Dict:
     """
@@ -43,6 +44,7 @@ def extraire_entites_client(question: str) -> Dict:
     entites = {
         "nom_client": None,
         "pays": None,
+        "liste_pays": [],
         "ville": None,
         "intention": "recherche"  # recherche, liste
     }
@@ -51,16 +53,13 @@ def extraire_entites_client(question: str) -> Dict:
     if any(mot in question_lower for mot in ["tous", "liste", "affiche", "montre-moi tous"]):
         entites["intention"] = "liste"
     
-    # Extraire le pays
-    for pays_key, variantes in PAYS.items():
-        for variante in variantes:
-            if variante in question_lower:
-                entites["pays"] = pays_key
-                break
-        if entites["pays"]:
-            break
+    # Extraire les pays (tous, dans l'ordre de la question)
+    entites["liste_pays"] = PAYS_MATCHER.find_all(question_lower)
+    if entites["liste_pays"]:
+        entites["pays"] = entites["liste_pays"][0]
     
     # Extraire les noms propres (potentiels noms/prénoms de clients)
+    nlp = nlp_models.get(FRENCH_MODEL, NER_COMPONENTS)
     if nlp:
         doc = nlp(question)
         for ent in doc.ents:
@@ -107,9 +106,10 @@ def construire_requete_sparql_client(entites: Dict) -> str:
     filters = []
     
     # Filtre par pays
-    if entites["pays"]:
-        # Utiliser FILTER avec regex pour matcher le pays (insensible à la casse)
-        pays_capitalise = entites["pays"].capitalize()
+    liste_pays = entites.get("liste_pays") or ([entites["pays"]] if entites["pays"] else [])
+    if liste_pays:
+        # Utiliser FILTER avec regex pour matcher le(s) pays (insensible à la casse)
+        pays_capitalise = "|".join(pays.capitalize() for pays in liste_pays)
         filters.append(f'        FILTER (regex(?pays, "{pays_capitalise}", "i"))')
     
     # Filtre par nom de client
@@ -140,6 +140,23 @@ def construire_requete_sparql_client(entites: Dict) -> str:
     return query
 
 
+def construire_requete_index_client(entites: Dict) -> Optional[str]:
+    """
+    Construit la requête SPARQL des clients à partir de l'index de l'annuaire :
+    pays, noms et ville sont résolus en mémoire, la requête ne contient que des VALUES.
+    
+    Args:
+        entites: Dictionnaire contenant les entités extraites
+        
+    Returns:
+        La requête SPARQL construite, ou None si l'index n'est pas prêt ou si la
+        question n'a aucun filtre (construire_requete_sparql_client s'applique)
+    """
+    liste_pays = entites.get("liste_pays") or ([entites["pays"]] if entites["pays"] else [])
+    noms = [entites["nom_client"]] if entites["nom_client"] else []
+    return client_directory.sparql(liste_pays, noms, entites["ville"])
+
+
 def analyser_question_client(question: str) -> Dict:
     """
     Fonction principale qui analyse une question sur les clients.
@@ -150,7 +167,7 @@ def analyser_question_client(question: str) -> Dict:
     Returns:
         Un dictionnaire contenant les entités extraites et la requête SPARQL générée
     """
-    if not nlp:
+    if not nlp_models.available(FRENCH_MODEL):
         return {
             "error": "Le modèle NLP n'est pas chargé",
             "entites": {},
@@ -1,13 +1,11 @@
-import spacy
 import re
 from typing import Dict, List, Optional
+from nlp_models import nlp_models, FRENCH_MODEL, NER_COMPONENTS
+from entity_matcher import EntityMatcher
+from directory_index import fournisseur_directory
 
-# Charger le modèle français de SpaCy
-try:
-    nlp = spacy.load("fr_core_news_sm")
-except OSError:
-    print("Le modèle français n'est pas installé. Exécutez: python -m spacy download fr_core_news_sm")
-    nlp = None
+# Modèle français de SpaCy (entités nommées), chargé par le registre au démarrage
+nlp_models.require(FRENCH_MODEL, NER_COMPONENTS)
 
 # Dictionnaire des pays et leurs variantes
 PAYS = {
@@ -41,6 +39,10 @@ FOURNISSEURS_CONNUS = {
     "panasonic": ["panasonic"]
 }
 
+# Reconnaissance des pays et des fournisseurs connus (expressions compilées une fois)
+PAYS_MATCHER = EntityMatcher(PAYS)
+FOURNISSEUR_MATCHER = EntityMatcher(FOURNISSEURS_CONNUS)
+
 
 def extraire_entites_fournisseur(question: str) -> Dict:
     """
@@ -56,7 +58,9 @@ def extraire_entites_fournisseur(question: str) -> Dict:
     
     entites = {
         "nom_fournisseur": None,
+        "fournisseurs": [],
         "pays": None,
+        "liste_pays": [],
         "ville": None,
         "intention": "recherche"  # recherche, liste
     }
@@ -65,26 +69,19 @@ def extraire_entites_fournisseur(question: str) -> Dict:
     if any(mot in question_lower for mot in ["tous", "liste", "affiche", "montre-moi tous"]):
         entites["intention"] = "liste"
     
-    # Extraire le pays
-    for pays_key, variantes in PAYS.items():
-        for variante in variantes:
-            if variante in question_lower:
-                entites["pays"] = pays_key
-                break
-        if entites["pays"]:
-            break
+    # Extraire les pays (tous, dans l'ordre de la question)
+    entites["liste_pays"] = PAYS_MATCHER.find_all(question_lower)
+    if entites["liste_pays"]:
+        entites["pays"] = entites["liste_pays"][0]
     
-    # Extraire le nom du fournisseur
-    for fournisseur_key, variantes in FOURNISSEURS_CONNUS.items():
-        for variante in variantes:
-            if variante in question_lower:
-                entites["nom_fournisseur"] = fournisseur_key
-                break
-        if entites["nom_fournisseur"]:
-            break
+    # Extraire les noms des fournisseurs connus
+    entites["fournisseurs"] = FOURNISSEUR_MATCHER.find_all(question_lower)
+    if entites["fournisseurs"]:
+        entites["nom_fournisseur"] = entites["fournisseurs"][0]
     
     # Si pas trouvé dans la liste connue, essayer d'extraire un nom propre
-    if not entites["nom_fournisseur"] and nlp:
+    nlp = nlp_models.get(FRENCH_MODEL, NER_COMPONENTS) if not entites["nom_fournisseur"] else None
+    if nlp:
         doc = nlp(question)
         for ent in doc.ents:
             if ent.label_ == "ORG":  # Organisation
@@ -127,15 +124,17 @@ def construire_requete_sparql_fournisseur(entites: Dict) -> str:
     filters = []
     
     # Filtre par pays
-    if entites["pays"]:
-        # Utiliser FILTER avec regex pour matcher le pays (insensible à la casse)
-        pays_capitalise = entites["pays"].capitalize()
+    liste_pays = entites.get("liste_pays") or ([entites["pays"]] if entites["pays"] else [])
+    if liste_pays:
+        # Utiliser FILTER avec regex pour matcher le(s) pays (insensible à la casse)
+        pays_capitalise = "|".join(pays.capitalize() for pays in liste_pays)
         filters.append(f'        FILTER (regex(?pays, "{pays_capitalise}", "i"))')
     
     # Filtre par nom de fournisseur
-    if entites["nom_fournisseur"]:
-        # Utiliser FILTER avec regex sur l'URI du fournisseur
-        nom_fournisseur = entites["nom_fournisseur"].capitalize()
+    noms = entites.get("fournisseurs") or ([entites["nom_fournisseur"]] if entites["nom_fournisseur"] else [])
+    if noms:
+        # Utiliser FILTER avec regex sur l'URI du (des) fournisseur(s)
+        nom_fournisseur = "|".join(nom.capitalize() for nom in noms)
         filters.append(f'        FILTER (regex(str(?fournisseur), "{nom_fournisseur}", "i"))')
     
     # Filtre par ville (dans l'adresse)
@@ -160,6 +159,23 @@ def construire_requete_sparql_fournisseur(entites: Dict) -> str:
     return query
 
 
+def construire_requete_index_fournisseur(entites: Dict) -> Optional[str]:
+    """
+    Construit la requête SPARQL des fournisseurs à partir de l'index de l'annuaire :
+    pays, noms et ville sont résolus en mémoire, la requête ne contient que des VALUES.
+    
+    Args:
+        entites: Dictionnaire contenant les entités extraites
+        
+    Returns:
+        La requête SPARQL construite, ou None si l'index n'est pas prêt ou si la
+        question n'a aucun filtre (construire_requete_sparql_fournisseur s'applique)
+    """
+    liste_pays = entites.get("liste_pays") or ([entites["pays"]] if entites["pays"] else [])
+    noms = entites.get("fournisseurs") or ([entites["nom_fournisseur"]] if entites["nom_fournisseur"] else [])
+    return fournisseur_directory.sparql(liste_pays, noms, entites["ville"])
+
+
 def analyser_question_fournisseur(question: str) -> Dict:
     """
     Fonction principale qui analyse une question sur les fournisseurs.
@@ -170,7 +186,7 @@ def analyser_question_fournisseur(question: str) -> Dict:
     Returns:
         Un dictionnaire contenant les entités extraites et la requête SPARQL générée
     """
-    if not nlp:
+    if not nlp_models.available(FRENCH_MODEL):
         return {
             "error": "Le modèle NLP n'est pas chargé",
             "entites": {},
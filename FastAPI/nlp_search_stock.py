@@ -1,52 +1,8 @@
-import spacy
 import re
 from typing import Dict, List, Optional
-
-# Charger le modèle français de SpaCy
-try:
-    nlp = spacy.load("fr_core_news_sm")
-except OSError:
-    print("Le modèle français n'est pas installé. Exécutez: python -m spacy download fr_core_news_sm")
-    nlp = None
-
-# Dictionnaire des catégories et leurs variantes
-CATEGORIES = {
-    "lave-vaisselle": ["lave-vaisselle", "lave vaisselle", "lavevaisselle", "lave-vaisselles"],
-    "lave-linge": ["lave-linge", "lave linge", "lavelinge", "machine à laver", "lave-linges"],
-    "réfrigérateurs": ["réfrigérateur", "réfrigérateurs", "frigo", "frigidaire", "réfrigérateur"],
-    "aspirateurs": ["aspirateur", "aspirateurs", "aspiro"],
-    "cuisinières": ["cuisinière", "cuisinières", "cuisiniere", "cuisinieres"],
-    "micro-ondes": ["micro-onde", "micro-ondes", "microonde", "microondes", "micro onde"],
-    "sèche-linge": ["sèche-linge", "sèche linge", "sechelinge", "sécheur", "sèche-linges"]
-}
-
-# Dictionnaire des marques
-MARQUES = {
-    "samsung": ["samsung"],
-    "lg": ["lg"],
-    "beko": ["beko"],
-    "bosch": ["bosch"],
-    "whirlpool": ["whirlpool"]
-}
-
-# Mapping vers les URIs de l'ontologie
-CATEGORY_URIS = {
-    "lave-vaisselle": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Lave-vaisselle",
-    "lave-linge": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Lave-linge",
-    "réfrigérateurs": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Réfrigérateurs",
-    "aspirateurs": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Aspirateurs",
-    "cuisinières": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Cuisinières",
-    "micro-ondes": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Micro-ondes",
-    "sèche-linge": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Sèche-linge"
-}
-
-MARQUE_URIS = {
-    "samsung": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Samsung",
-    "lg": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#LG",
-    "beko": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Beko",
-    "bosch": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Bosch",
-    "whirlpool": "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#Whirlpool"
-}
+from nlp_models import nlp_models, FRENCH_MODEL
+from vocabulary import vocabulary, entity_filters
+from entity_matcher import fold
 
 
 def extraire_entites_stock(question: str) -> Dict:
@@ -59,13 +15,18 @@ def extraire_entites_stock(question: str) -> Dict:
     Returns:
         Un dictionnaire contenant les entités extraites (catégorie, marque, quantité de stock, etc.)
     """
-    question_lower = question.lower().strip()
+    # Minuscules, sans accents ni espaces multiples : "épuisé" et "epuise" se valent
+    question_lower = fold(question)
     
     entites = {
         "categorie": None,
         "categorie_uri": None,
+        "categories": [],
+        "categorie_uris": [],
         "marque": None,
         "marque_uri": None,
+        "marques": [],
+        "marque_uris": [],
         "stock_min": None,
         "stock_max": None,
         "statut_stock": None,  # "rupture", "stock_faible", "en_stock"
@@ -79,48 +40,43 @@ def extraire_entites_stock(question: str) -> Dict:
         entites["intention"] = "alerte"
     
     # Détecter le statut du stock
-    if any(mot in question_lower for mot in ["rupture", "en rupture", "en-rupture", "épuisé", "épuisée"]):
+    if any(mot in question_lower for mot in ["rupture", "en rupture", "en-rupture", "epuise", "epuisee"]):
         entites["statut_stock"] = "rupture"
     elif any(mot in question_lower for mot in ["stock faible", "stock-faible", "faible", "critique", "bas", "basse"]):
         entites["statut_stock"] = "stock_faible"
     elif any(mot in question_lower for mot in ["disponible", "en stock", "en-stock", "en stock", "disponibles"]):
         entites["statut_stock"] = "en_stock"
     
-    # Extraire la catégorie
-    for categorie_key, variantes in CATEGORIES.items():
-        for variante in variantes:
-            if variante in question_lower:
-                entites["categorie"] = categorie_key
-                entites["categorie_uri"] = CATEGORY_URIS.get(categorie_key)
-                break
-        if entites["categorie"]:
-            break
-    
-    # Extraire la marque
-    for marque_key, variantes in MARQUES.items():
-        for variante in variantes:
-            if variante in question_lower:
-                entites["marque"] = marque_key
-                entites["marque_uri"] = MARQUE_URIS.get(marque_key)
-                break
-        if entites["marque"]:
-            break
+    # Extraire les catégories et les marques (toutes, dans l'ordre de la question),
+    # d'après le vocabulaire courant du catalogue
+    snapshot = vocabulary.snapshot
+    entites["categories"] = snapshot.find_all("categories", question_lower)
+    entites["categorie_uris"] = [snapshot.uri("categories", c) for c in entites["categories"]]
+    if entites["categories"]:
+        entites["categorie"] = entites["categories"][0]
+        entites["categorie_uri"] = entites["categorie_uris"][0]
+    
+    entites["marques"] = snapshot.find_all("marques", question_lower)
+    entites["marque_uris"] = [snapshot.uri("marques", m) for m in entites["marques"]]
+    if entites["marques"]:
+        entites["marque"] = entites["marques"][0]
+        entites["marque_uri"] = entites["marque_uris"][0]
     
     # Extraire les quantités de stock
     # Patterns: "moins de X unités", "inférieur à X", "< X", "maximum X"
     stock_patterns = [
-        r"(?:moins de|inférieur[e]? à|au maximum|maximum|stock <|stock inférieur à)\s*(\d+)",
-        r"(?:plus de|supérieur[e]? à|au minimum|minimum|stock >|stock supérieur à)\s*(\d+)",
-        r"(?:entre|de)\s*(\d+)\s*(?:et|à)\s*(\d+)\s*(?:unités?)?",
-        r"(\d+)\s*(?:unités?|unités disponibles)"
+        r"(?:moins de|inferieur[e]? a|au maximum|maximum|stock <|stock inferieur a)\s*(\d+)",
+        r"(?:plus de|superieur[e]? a|au minimum|minimum|stock >|stock superieur a)\s*(\d+)",
+        r"(?:entre|de)\s*(\d+)\s*(?:et|a)\s*(\d+)\s*(?:unites?)?",
+        r"(\d+)\s*(?:unites?|unites disponibles)"
     ]
     
     for pattern in stock_patterns:
         match = re.search(pattern, question_lower)
         if match:
-            if "moins" in question_lower or "inférieur" in question_lower or "<" in question_lower or "max" in question_lower:
+            if "moins" in question_lower or "inferieur" in question_lower or "<" in question_lower or "max" in question_lower:
                 entites["stock_max"] = int(match.group(1))
-            elif "plus" in question_lower or "supérieur" in question_lower or ">" in question_lower or "min" in question_lower:
+            elif "plus" in question_lower or "superieur" in question_lower or ">" in question_lower or "min" in question_lower:
                 entites["stock_min"] = int(match.group(1))
             elif "entre" in question_lower or ("de" in question_lower and "et" in question_lower):
                 if len(match.groups()) >= 2:
@@ -153,13 +109,8 @@ def construire_requete_sparql_stock(entites: Dict) -> str:
     
     filters = []
     
-    # Ajouter le filtre de catégorie
-    if entites["categorie_uri"]:
-        filters.append(f"        ?produit ns:aSousCatégorie <{entites['categorie_uri']}> .")
-    
-    # Ajouter le filtre de marque
-    if entites["marque_uri"]:
-        filters.append(f"        ?produit ns:aProduitMarque <{entites['marque_uri']}> .")
+    # Ajouter les filtres de catégorie et de marque (VALUES si la question en cite plusieurs)
+    filters.extend(entity_filters(entites))
     
     # Toujours récupérer les propriétés optionnelles
     query += "\n".join(filters) if filters else ""
@@ -207,7 +158,7 @@ def analyser_question_stock(question: str) -> Dict:
     Returns:
         Un dictionnaire contenant les entités extraites et la requête SPARQL générée
     """
-    if not nlp:
+    if not nlp_models.available(FRENCH_MODEL):
         return {
             "error": "Le modèle NLP n'est pas chargé",
             "entites": {},
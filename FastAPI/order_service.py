@@ -1,29 +1,29 @@
-from SPARQLWrapper import SPARQLWrapper, JSON, POST
+from sparql_client import SparqlClient, sparql_client, sparql_literal, sparql_term
+from pagination import Keyset
+from idempotency import IdempotencyConflict
 from datetime import datetime
 import uuid
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
+
+# Order listing pages: newest first, the URI breaks ties between orders of the same day
+ORDERS_KEYSET = Keyset(("date", True), ("commande", False))
+
+# Checkout attempts when the cart changes between its read and the order update
+CHECKOUT_ATTEMPTS = 3
 
 class OrderService:
-    def __init__(self, query_endpoint: str = "http://localhost:3030/SmartCom/query", 
-                 update_endpoint: str = "http://localhost:3030/SmartCom/update"):
-        self.query_endpoint = query_endpoint
-        self.update_endpoint = update_endpoint
+    def __init__(self, client: SparqlClient = sparql_client):
+        self.client = client
         
-    def _execute_query(self, query: str, is_update: bool = False) -> Optional[List[Dict]]:
+    async def _execute_query(self, query: str, is_update: bool = False,
+                             touches: Optional[List[str]] = None) -> Optional[List[Dict]]:
         """Execute SPARQL query and return results"""
         try:
-            # Use different endpoints for query vs update operations
-            endpoint = self.update_endpoint if is_update else self.query_endpoint
-            sparql = SPARQLWrapper(endpoint)
-            sparql.setQuery(query)
-            
             if is_update:
-                sparql.setMethod(POST)
-                sparql.query()
+                await self.client.update(query, touches=touches)
                 return True
             else:
-                sparql.setReturnFormat(JSON)
-                results = sparql.query().convert()
+                results = await self.client.query(query)
                 
                 if "boolean" in results:
                     return results["boolean"]
@@ -34,105 +34,212 @@ class OrderService:
             print(f"SPARQL query error: {e}")
             return None
 
-    def create_order_from_cart(self, client_id: int, order_details: Dict) -> Dict:
-        """Create an order from cart items with customer details"""
+    async def create_order_from_cart(self, client_id: int, order_details: Dict,
+                                     idempotency_key: Optional[str] = None,
+                                     fingerprint: Optional[str] = None) -> Dict:
+        """Create an order from cart items with customer details
+        
+        Args:
+            client_id: The client whose cart is checked out
+            order_details: Customer details stored on the order
+            idempotency_key: Idempotency-Key of the request, stored on the order in the
+                             same update: a retry (from any worker) gets the same order back
+            fingerprint: Hash of the request, compared when the key is reused
+        
+        Raises:
+            IdempotencyConflict: The key was already used for a different request
+        """
         try:
-            # Generate unique order ID
-            order_id = str(uuid.uuid4())[:8]
-            order_uri = f"ns:Commande_{order_id}"
-            client_uri = f"ns:Client{client_id}"
-            cart_uri = f"ns:Panier_Client{client_id}"
-            
-            print(f"Creating order {order_uri} for client {client_uri}")
-            
-            # Get cart items first
-            cart_items_query = f"""
-            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-            SELECT ?produit ?quantity ?prix WHERE {{
-                ?cartItem ns:inCart {cart_uri} ;
-                         ns:refersToProduct ?produit ;
-                         ns:hasQuantity ?quantity .
-                ?produit ns:aPrix ?prix .
-            }}
-            """
-            
-            cart_items = self._execute_query(cart_items_query)
-            if not cart_items:
-                return {"success": False, "message": "Cart is empty"}
-            
-            # Calculate totals
-            total_items = sum(int(item.get("quantity", {}).get("value", 0)) for item in cart_items)
-            total_amount = sum(
-                int(item.get("quantity", {}).get("value", 0)) * 
-                float(item.get("prix", {}).get("value", 0)) 
-                for item in cart_items
-            )
-            
-            # Create order with all details
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            
-            order_creation_query = f"""
-            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-            INSERT DATA {{
-                {order_uri} a ns:Commande ;
-                           ns:aCommandeClient {client_uri} ;
-                           ns:aDateCommande "{current_date}"^^<http://www.w3.org/2001/XMLSchema#date> ;
-                           ns:aMontantTotal {total_amount} ;
-                           ns:aNombreArticles {total_items} ;
-                           ns:aStatutCommande "En cours" ;
-                           ns:aAdresseLivraison "{order_details.get('delivery_address', '')}" ;
-                           ns:aTelephoneClient "{order_details.get('phone', '')}" ;
-                           ns:aEmailClient "{order_details.get('email', '')}" ;
-                           ns:aNomClient "{order_details.get('full_name', '')}" .
-            }}
-            """
-            
-            print(f"Order creation query: {order_creation_query}")
-            
-            # Execute order creation
-            order_result = self._execute_query(order_creation_query, is_update=True)
-            if not order_result:
-                return {"success": False, "message": "Failed to create order"}
-            
-            # Add order items
-            for item in cart_items:
-                product_uri = item.get("produit", {}).get("value", "")
-                quantity = int(item.get("quantity", {}).get("value", 0))
-                price = float(item.get("prix", {}).get("value", 0))
-                
-                # Create order item
-                order_item_id = str(uuid.uuid4())[:8]
-                order_item_uri = f"ns:ArticleCommande_{order_item_id}"
-                
-                order_item_query = f"""
-                PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-                INSERT DATA {{
-                    {order_item_uri} a ns:ArticleCommande ;
-                                    ns:dansCommande {order_uri} ;
-                                    ns:refereAuProduit <{product_uri}> ;
-                                    ns:aQuantiteCommandee {quantity} ;
-                                    ns:aPrixUnitaire {price} ;
-                                    ns:aSousTotal {quantity * price} .
-                }}
-                """
-                
-                self._execute_query(order_item_query, is_update=True)
-            
-            return {
-                "success": True,
-                "message": "Order created successfully",
-                "order_id": order_id,
-                "order_uri": order_uri,
-                "total_amount": total_amount,
-                "total_items": total_items,
-                "order_details": order_details
-            }
+            # The checkout only applies to the exact cart it read: when an item
+            # changes in between, read the cart again and retry
+            for _ in range(CHECKOUT_ATTEMPTS):
+                if idempotency_key:
+                    replay = await self._replay(idempotency_key, fingerprint, order_details)
+                    if replay is not None:
+                        return replay
+                result = await self._checkout(client_id, order_details, idempotency_key, fingerprint)
+                if result is not None:
+                    return result
+            return {"success": False, "message": "Cart changed during checkout, please retry"}
             
+        except IdempotencyConflict:
+            raise
         except Exception as e:
             print(f"Error creating order: {e}")
             return {"success": False, "message": f"Error creating order: {str(e)}"}
 
-    def get_order_details(self, order_id: str) -> Optional[Dict]:
+    async def _replay(self, idempotency_key: str, fingerprint: Optional[str], order_details: Dict) -> Optional[Dict]:
+        """Result of the order already created with this idempotency key (None if there is none)"""
+        query = f"""
+        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+        SELECT ?commande ?empreinte ?montant ?articles WHERE {{
+            ?commande ns:aCleIdempotence {sparql_literal(idempotency_key)} ;
+                     ns:aEmpreinteRequete ?empreinte ;
+                     ns:aMontantTotal ?montant ;
+                     ns:aNombreArticles ?articles .
+        }}
+        LIMIT 1
+        """
+        results = await self._execute_query(query)
+        if not results:
+            return None
+        order = results[0]
+        if fingerprint and order["empreinte"]["value"] != fingerprint:
+            raise IdempotencyConflict(f"Idempotency key {idempotency_key} was already used for a different request")
+        order_id = order["commande"]["value"].rsplit("Commande_", 1)[-1]
+        return {
+            "success": True,
+            "message": "Order created successfully",
+            "order_id": order_id,
+            "order_uri": f"ns:Commande_{order_id}",
+            "total_amount": float(order["montant"]["value"]),
+            "total_items": int(order["articles"]["value"]),
+            "order_details": order_details
+        }
+
+    async def _checkout(self, client_id: int, order_details: Dict, idempotency_key: Optional[str] = None,
+                        fingerprint: Optional[str] = None) -> Optional[Dict]:
+        """One checkout attempt (None if the cart changed, or the key was used, between the read and the update)"""
+        # Generate unique order ID
+        order_id = str(uuid.uuid4())[:8]
+        order_uri = f"ns:Commande_{order_id}"
+        client_uri = f"ns:Client{client_id}"
+        cart_uri = f"ns:Panier_Client{client_id}"
+        
+        print(f"Creating order {order_uri} for client {client_uri}")
+        
+        # Get cart items first (unit price snapshotted on each CartItem)
+        cart_items_query = f"""
+        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+        SELECT ?cartItem ?produit ?quantity ?prix WHERE {{
+            ?cartItem ns:inCart {cart_uri} ;
+                     ns:refersToProduct ?produit ;
+                     ns:hasQuantity ?quantity .
+            OPTIONAL {{ ?cartItem ns:aPrixUnitaire ?prix }}
+        }}
+        """
+        
+        cart_items = await self._execute_query(cart_items_query)
+        if cart_items is None:
+            return {"success": False, "message": "Failed to read cart"}
+        if not cart_items:
+            return {"success": False, "message": "Cart is empty"}
+        
+        # An item without a price snapshot would be ordered for free: refuse the
+        # order until it is repriced (POST /cart/reprice)
+        unpriced = [item["produit"]["value"] for item in cart_items if "prix" not in item]
+        if unpriced:
+            return {"success": False, "message": f"Cart items without a price: {', '.join(unpriced)}"}
+        
+        # Calculate totals
+        total_items = sum(int(item["quantity"]["value"]) for item in cart_items)
+        total_amount = sum(int(item["quantity"]["value"]) * float(item["prix"]["value"]) for item in cart_items)
+        
+        # Create order with all details
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        
+        # Order line items
+        order_item_triples = []
+        for item in cart_items:
+            product_uri = item["produit"]["value"]
+            quantity = int(item["quantity"]["value"])
+            price = float(item["prix"]["value"])
+            order_item_uri = f"ns:ArticleCommande_{str(uuid.uuid4())[:8]}"
+            order_item_triples.append(f"""
+            {order_item_uri} a ns:ArticleCommande ;
+                            ns:dansCommande {order_uri} ;
+                            ns:refereAuProduit <{product_uri}> ;
+                            ns:aQuantiteCommandee {quantity} ;
+                            ns:aPrixUnitaire {price} ;
+                            ns:aSousTotal {quantity * price} .""")
+        
+        # The exact (item, quantity, price) rows read above: the order is only
+        # created if they are all still in the cart, and only they are removed
+        # (an item added meanwhile stays in the cart)
+        read_rows = " ".join(
+            f"({sparql_term(item['cartItem'])} {sparql_term(item['quantity'])} {sparql_term(item['prix'])})"
+            for item in cart_items
+        )
+        
+        # The idempotency key is written with the order, and the order is only
+        # created if no other order carries it yet (concurrent retries on other workers)
+        key_triples, key_filter = "", ""
+        if idempotency_key:
+            key_triples = f"""{order_uri} ns:aCleIdempotence {sparql_literal(idempotency_key)} ;
+                       ns:aEmpreinteRequete {sparql_literal(fingerprint or '')} ."""
+            key_filter = f"FILTER NOT EXISTS {{ ?commandeExistante ns:aCleIdempotence {sparql_literal(idempotency_key)} }}"
+        
+        # Order, line items and cart clear are sent as one multi-operation
+        # update request, which Fuseki applies in a single transaction
+        checkout_query = f"""
+        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+        INSERT {{
+            {order_uri} a ns:Commande ;
+                       ns:aCommandeClient {client_uri} ;
+                       ns:aDateCommande "{current_date}"^^<http://www.w3.org/2001/XMLSchema#date> ;
+                       ns:aMontantTotal {total_amount} ;
+                       ns:aNombreArticles {total_items} ;
+                       ns:aStatutCommande "En cours" ;
+                       ns:aAdresseLivraison {sparql_literal(order_details.get('delivery_address', ''))} ;
+                       ns:aTelephoneClient {sparql_literal(order_details.get('phone', ''))} ;
+                       ns:aEmailClient {sparql_literal(order_details.get('email', ''))} ;
+                       ns:aNomClient {sparql_literal(order_details.get('full_name', ''))} .
+            {key_triples}
+            {"".join(order_item_triples)}
+        }}
+        WHERE {{
+            {{
+                SELECT (COUNT(*) AS ?unchanged) WHERE {{
+                    VALUES (?cartItem ?quantity ?prix) {{ {read_rows} }}
+                    ?cartItem ns:inCart {cart_uri} ;
+                             ns:hasQuantity ?quantity ;
+                             ns:aPrixUnitaire ?prix .
+                }}
+            }}
+            FILTER (?unchanged = {len(cart_items)})
+            {key_filter}
+        }} ;
+        DELETE {{
+            ?cartItem ?p ?o .
+        }}
+        WHERE {{
+            {order_uri} a ns:Commande .
+            VALUES (?cartItem ?quantity ?prix) {{ {read_rows} }}
+            ?cartItem ns:hasQuantity ?quantity ;
+                     ?p ?o .
+        }}
+        """
+        
+        print(f"Checkout query: {checkout_query}")
+        
+        # Execute order creation and cart clear
+        order_result = await self._execute_query(checkout_query, is_update=True, touches=["ns:CartItem"])
+        if not order_result:
+            return {"success": False, "message": "Failed to create order"}
+        
+        # The update matches nothing when the cart changed since it was read
+        # (or another request created the order for the same idempotency key)
+        created = await self._execute_query(f"""
+        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+        ASK {{ {order_uri} a ns:Commande }}
+        """)
+        if created is None:
+            return {"success": False, "message": "Failed to confirm order creation"}
+        if not created:
+            print(f"Cart {cart_uri} changed during checkout, retrying")
+            return None
+        
+        return {
+            "success": True,
+            "message": "Order created successfully",
+            "order_id": order_id,
+            "order_uri": order_uri,
+            "total_amount": total_amount,
+            "total_items": total_items,
+            "order_details": order_details
+        }
+
+    async def get_order_details(self, order_id: str) -> Optional[Dict]:
         """Get order details by order ID"""
         order_uri = f"ns:Commande_{order_id}"
         
@@ -151,7 +258,7 @@ class OrderService:
         }}
         """
         
-        results = self._execute_query(query)
+        results = await self._execute_query(query)
         if results and len(results) > 0:
             result = results[0]
             return {
@@ -168,7 +275,7 @@ class OrderService:
             }
         return None
 
-    def get_client_orders(self, client_id: int) -> List[Dict]:
+    async def get_client_orders(self, client_id: int) -> List[Dict]:
         """Get all orders for a specific client"""
         client_uri = f"ns:Client{client_id}"
         
@@ -184,7 +291,7 @@ class OrderService:
         ORDER BY DESC(?date)
         """
         
-        results = self._execute_query(query)
+        results = await self._execute_query(query)
         orders = []
         
         if results:
@@ -203,7 +310,7 @@ class OrderService:
         
         return orders
     
-    def cancel_order(self, order_id: str) -> Dict:
+    async def cancel_order(self, order_id: str) -> Dict:
         """Cancel an order by updating its status"""
         try:
             order_uri = f"ns:Commande_{order_id}"
@@ -216,7 +323,7 @@ class OrderService:
             }}
             """
             
-            results = self._execute_query(check_query)
+            results = await self._execute_query(check_query)
             if not results:
                 return {"success": False, "message": "Order not found"}
             
@@ -235,7 +342,7 @@ class OrderService:
             WHERE {{ {order_uri} ns:aStatutCommande ?oldStatus }}
             """
             
-            result = self._execute_query(update_query, is_update=True)
+            result = await self._execute_query(update_query, is_update=True)
             if result:
                 return {"success": True, "message": "Order cancelled successfully"}
             else:
@@ -245,11 +352,11 @@ class OrderService:
             print(f"Error cancelling order: {e}")
             return {"success": False, "message": f"Error cancelling order: {str(e)}"}
     
-    def get_all_orders(self) -> List[Dict]:
-        """Get all orders in the system"""
-        query = """
+    def _all_orders_query(self, keyset_clause: str = "", modifiers: str = "ORDER BY DESC(?date)") -> str:
+        """Build the order listing query (keyset filter and modifiers for one page)"""
+        return f"""
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?commande ?client ?date ?montant ?articles ?statut ?adresse ?telephone ?email ?nom WHERE {
+        SELECT ?commande ?client ?date ?montant ?articles ?statut ?adresse ?telephone ?email ?nom WHERE {{
             ?commande a ns:Commande ;
                      ns:aCommandeClient ?client ;
                      ns:aDateCommande ?date ;
@@ -260,32 +367,61 @@ class OrderService:
                      ns:aTelephoneClient ?telephone ;
                      ns:aEmailClient ?email ;
                      ns:aNomClient ?nom .
-        }
-        ORDER BY DESC(?date)
+            {keyset_clause}
+        }}
+        {modifiers}
         """
+
+    @staticmethod
+    def _order_from_binding(result: Dict) -> Dict:
+        """Convert one order listing row to the API representation"""
+        order_uri = result.get("commande", {}).get("value", "")
+        order_id = order_uri.split("_")[-1] if "_" in order_uri else order_uri
         
-        results = self._execute_query(query)
-        orders = []
+        return {
+            "id": order_id,
+            "order_id": order_id,
+            "order_uri": order_uri,
+            "client": result.get("client", {}).get("value", ""),
+            "order_date": result.get("date", {}).get("value", ""),
+            "created_at": result.get("date", {}).get("value", ""),
+            "total_amount": float(result.get("montant", {}).get("value", 0)),
+            "total_items": int(result.get("articles", {}).get("value", 0)),
+            "status": result.get("statut", {}).get("value", ""),
+            "delivery_address": result.get("adresse", {}).get("value", ""),
+            "phone": result.get("telephone", {}).get("value", ""),
+            "email": result.get("email", {}).get("value", ""),
+            "full_name": result.get("nom", {}).get("value", "")
+        }
+
+    async def get_all_orders(self) -> List[Dict]:
+        """Get all orders in the system"""
+        results = await self._execute_query(self._all_orders_query())
+        return [self._order_from_binding(result) for result in results or []]
+
+    async def stream_all_orders(self) -> AsyncIterator[Dict]:
+        """Yield every order as it is received from Fuseki (exports, unordered)
         
-        if results:
-            for result in results:
-                order_uri = result.get("commande", {}).get("value", "")
-                order_id = order_uri.split("_")[-1] if "_" in order_uri else order_uri
-                
-                orders.append({
-                    "id": order_id,
-                    "order_id": order_id,
-                    "order_uri": order_uri,
-                    "client": result.get("client", {}).get("value", ""),
-                    "order_date": result.get("date", {}).get("value", ""),
-                    "created_at": result.get("date", {}).get("value", ""),
-                    "total_amount": float(result.get("montant", {}).get("value", 0)),
-                    "total_items": int(result.get("articles", {}).get("value", 0)),
-                    "status": result.get("statut", {}).get("value", ""),
-                    "delivery_address": result.get("adresse", {}).get("value", ""),
-                    "phone": result.get("telephone", {}).get("value", ""),
-                    "email": result.get("email", {}).get("value", ""),
-                    "full_name": result.get("nom", {}).get("value", "")
-                })
+        No ORDER BY: Fuseki would have to sort every order before sending the
+        first row, losing the first-byte latency and memory benefits of streaming.
+        """
+        async for result in self.client.stream(self._all_orders_query(modifiers="")):
+            yield self._order_from_binding(result)
+
+    async def get_orders_page(self, limit: int, cursor: Optional[str] = None) -> Dict:
+        """
+        Get one page of orders, newest first.
         
-        return orders
\ No newline at end of file
+        Args:
+            limit: Page size
+            cursor: Cursor returned with the previous page (None for the first page)
+            
+        Returns:
+            Dict with the page of orders and the cursor of the next page (None on the last page)
+        """
+        query = self._all_orders_query(ORDERS_KEYSET.filter(cursor), ORDERS_KEYSET.modifiers(limit))
+        rows, next_cursor = ORDERS_KEYSET.page(await self._execute_query(query) or [], limit)
+        return {
+            "orders": [self._order_from_binding(result) for result in rows],
+            "next_cursor": next_cursor
+        }
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+Pagination par curseur (keyset) des listes SPARQL
+Au lieu d'un OFFSET, qui oblige Fuseki à parcourir toutes les lignes
+précédentes, chaque page reprend après la clé de tri de la dernière ligne
+renvoyée : le curseur est cette clé, encodée de façon opaque. La requête
+reçoit un FILTER sur la clé, un ORDER BY et un LIMIT (taille de page + 1,
+la ligne supplémentaire indique qu'une page suivante existe).
+"""
+
+import base64
+import json
+from typing import Dict, List, Optional, Tuple
+from sparql_client import sparql_literal
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """Levée quand le curseur reçu n'a pas été produit par cette API"""
+
+
+def encode_cursor(values: List[str]) -> str:
+    """Encode la clé de tri de la dernière ligne d'une page"""
+    payload = json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[str]:
+    """Décode un curseur et vérifie qu'il contient une clé de la taille attendue"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Curseur invalide : {e}")
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise InvalidCursor("Curseur invalide : clé de tri inattendue")
+    return values
+
+
+def page_size(limit: Optional[int], cursor: Optional[str]) -> Optional[int]:
+    """Taille de page demandée (None : ancienne réponse complète, sans pagination)"""
+    if limit is None and cursor is None:
+        return None
+    return limit or DEFAULT_PAGE_SIZE
+
+
+class Keyset:
+    """
+    Clé de tri d'une liste paginée.
+
+    Args:
+        keys: Variables SPARQL de la clé, dans l'ordre de tri, avec leur sens
+              (True pour décroissant), ex. ("date", True), ("commande", False).
+              La dernière variable doit identifier la ligne de façon unique.
+    """
+
+    def __init__(self, *keys: Tuple[str, bool]):
+        self.keys = keys
+
+    @staticmethod
+    def _expression(var: str) -> str:
+        # Comparaison sur la forme texte : même ordre pour ORDER BY et FILTER,
+        # et une variable OPTIONAL non liée se range comme la chaîne vide
+        return f'COALESCE(STR(?{var}), "")'
+
+    def filter(self, cursor: Optional[str]) -> str:
+        """Clause FILTER ne gardant que les lignes situées après le curseur"""
+        if cursor is None:
+            return ""
+        values = decode_cursor(cursor, len(self.keys))
+        alternatives = []
+        for i, (var, descending) in enumerate(self.keys):
+            terms = [f"{self._expression(prev)} = {sparql_literal(values[j])}"
+                     for j, (prev, _) in enumerate(self.keys[:i])]
+            terms.append(f"{self._expression(var)} {'<' if descending else '>'} {sparql_literal(values[i])}")
+            alternatives.append("(" + " && ".join(terms) + ")")
+        return f"FILTER ({' || '.join(alternatives)})"
+
+    def modifiers(self, limit: int) -> str:
+        """ORDER BY sur la clé et LIMIT (une ligne de plus pour détecter la page suivante)"""
+        order = " ".join(f"DESC({self._expression(var)})" if descending else self._expression(var)
+                         for var, descending in self.keys)
+        return f"ORDER BY {order} LIMIT {limit + 1}"
+
+    def page(self, bindings: List[Dict], limit: int) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Découpe le résultat de la requête en page.
+
+        Returns:
+            Les lignes de la page et le curseur de la page suivante (None si dernière page)
+        """
+        if len(bindings) <= limit:
+            return bindings, None
+        rows = bindings[:limit]
+        last = rows[-1]
+        return rows, encode_cursor([last.get(var, {}).get("value", "") for var, _ in self.keys])
@@ -0,0 +1,133 @@
+"""
+Cache des plans de la recherche en langage naturel
+Les mêmes questions reviennent sans cesse : le plan d'une question (entités
+extraites et requête SPARQL générée) est conservé par type de recherche et
+question normalisée (taille bornée, éviction LRU). Une question déjà vue évite
+l'extraction des entités, dont le NER SpaCy des recherches de clients et de
+fournisseurs.
+
+Clé normalisée :
+    - produits et stock : minuscules, sans accents, espaces simples (leurs
+      extracteurs lisent la question sous cette forme) ;
+    - clients et fournisseurs : espaces simples seulement, car le NER et la
+      détection des villes lisent les majuscules et les accents.
+Le plan est calculé à partir de la clé : deux questions de même clé ont donc
+toujours le même plan. Tout le cache est vidé quand le vocabulaire du
+catalogue change de version (nouvelle catégorie ou marque reconnue).
+"""
+
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+from entity_matcher import fold
+from vocabulary import Vocabulary, vocabulary
+
+# Nombre maximal de plans conservés (tous types de recherche confondus)
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "2048"))
+
+
+def normalize_question(question: str, fold_accents: bool = True) -> str:
+    """Clé de cache d'une question (voir le docstring du module)"""
+    return fold(question) if fold_accents else " ".join(question.split())
+
+
+class PlanCache:
+    def __init__(self, vocab: Vocabulary = vocabulary, max_entries: int = PLAN_CACHE_SIZE):
+        self.vocabulary = vocab
+        self.max_entries = max_entries
+        self._analysers: Dict[str, Tuple[Callable[[str], Dict], bool]] = {}
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Dict, str]]" = OrderedDict()
+        # Version du vocabulaire avec laquelle les plans en cache ont été calculés
+        self.version = vocab.snapshot.version
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.evictions = 0
+        self.invalidations = 0
+
+    def register(self, kind: str, analyser: Callable[[str], Dict], fold_accents: bool = True) -> None:
+        """
+        Déclare un type de recherche.
+
+        Args:
+            kind: Le type de recherche (ex. "produits")
+            analyser: La fonction analyser_question_* du type
+            fold_accents: Normaliser la casse et les accents de la clé (False si
+                          l'extraction lit les majuscules, ex. NER)
+        """
+        self._analysers[kind] = (analyser, fold_accents)
+        self.hits.setdefault(kind, 0)
+        self.misses.setdefault(kind, 0)
+
+    def _check_version(self) -> None:
+        version = self.vocabulary.snapshot.version
+        if version != self.version:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.version = version
+
+    def analyse(self, kind: str, question: str) -> Dict:
+        """
+        Retourne le plan d'une question (calculé une fois par clé normalisée).
+
+        Args:
+            kind: Le type de recherche déclaré par register
+            question: La question de l'utilisateur en français
+
+        Returns:
+            Le résultat de analyser_question_* : entités extraites et requête SPARQL
+            générée (ou "error", jamais mis en cache)
+        """
+        analyser, fold_accents = self._analysers[kind]
+        self._check_version()
+        key = (kind, normalize_question(question, fold_accents))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits[kind] += 1
+            entites, sparql_query = entry
+        else:
+            self.misses[kind] += 1
+            analyse = analyser(key[1])
+            if "error" in analyse:
+                return analyse
+            entites, sparql_query = analyse["entites"], analyse["sparql_query"]
+            self._entries[key] = (entites, sparql_query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        # Les entités en cache sont partagées : l'appelant reçoit une copie
+        return {
+            "entites": dict(entites),
+            "sparql_query": sparql_query,
+            "question_originale": question
+        }
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        by_kind = {}
+        for kind in self._analysers:
+            lookups = self.hits[kind] + self.misses[kind]
+            by_kind[kind] = {
+                "hits": self.hits[kind],
+                "misses": self.misses[kind],
+                "hit_rate": round(self.hits[kind] / lookups, 3) if lookups else 0.0
+            }
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "vocabulary_version": self.version,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "by_kind": by_kind
+        }
+
+
+# Instance partagée par les endpoints de recherche en langage naturel
+plan_cache = PlanCache()
@@ -0,0 +1,445 @@
+"""
+Recherche plein texte des produits (index inversé, classement BM25)
+Les termes libres d'une question ("inox", "silencieux", "A+++") sont cherchés
+dans un index inversé en mémoire construit sur le nom, la description, la
+catégorie et la marque de chaque produit, au lieu de regex non indexées sur
+ns:aDescription. Les filtres structurés extraits de la question (catégories,
+marques, prix) sont appliqués sur les mêmes identifiants de documents.
+
+L'index est construit au démarrage, tenu à jour par les endpoints d'écriture
+des produits, et reconstruit périodiquement depuis Fuseki (écritures externes).
+Une modification ajoute une nouvelle version du document et marque l'ancienne
+comme supprimée : les listes de postings ne sont jamais réécrites, et la
+reconstruction périodique élimine les versions supprimées.
+
+Mesure sur un catalogue synthétique : python product_search.py [nombre_de_produits]
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from entity_matcher import fold
+from sparql_client import SparqlClient, sparql_client, binding_value, XSD
+
+logger = logging.getLogger(__name__)
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+# Intervalle de reconstruction de l'index depuis Fuseki (secondes)
+REBUILD_INTERVAL = float(os.getenv("PRODUCT_SEARCH_REBUILD_INTERVAL", "900"))
+# Nombre de résultats renvoyés par défaut
+SEARCH_TOP_K = int(os.getenv("PRODUCT_SEARCH_TOP_K", "20"))
+
+# Paramètres BM25 usuels (saturation du tf, normalisation par la longueur)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Mots (sans accents) sans valeur de recherche : mots outils, formulation des
+# questions et mots des filtres de prix, déjà interprétés par l'extraction
+STOP_WORDS = frozenset("""
+    a au aux avec ce ces cet cette d de des du elle en et il je j l la le les leur lui m ma me mes moi mon
+    n ne nous on ou par pas pour qu que qui s sa se ses son sur t ta te tes toi ton tu un une vos votre vous y
+    est sont ai as avez avons ont quel quelle quels quelles dans sans chez
+    cherche cherches cherchons cherchez chercher veux voudrais voudrions montre montrez affiche affichez
+    donne donnez trouve trouvez liste lister tous toutes tout toute filtre filtrer ayant produit produits
+    article articles categorie categories marque marques prix moins plus entre inferieur inferieure
+    superieur superieure max maximum min minimum euro euros eur
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+\+*")
+
+PRODUCTS_QUERY = f"""
+    PREFIX ns: <{NS}>
+    SELECT ?produit ?description ?prix ?categorie ?marque ?image
+    WHERE {{
+        ?produit a ns:Produit .
+        OPTIONAL {{ ?produit ns:aDescription ?description . }}
+        OPTIONAL {{ ?produit ns:aPrix ?prix . }}
+        OPTIONAL {{ ?produit ns:aSousCatégorie ?categorie . }}
+        OPTIONAL {{ ?produit ns:aProduitMarque ?marque . }}
+        OPTIONAL {{ ?produit ns:aImage ?image . }}
+    }}
+"""
+
+# Propriétés d'un produit renvoyées avec chaque résultat (comme la requête SPARQL)
+FIELDS = ("description", "prix", "categorie", "marque", "image")
+
+
+def _uri(value: Optional[str]) -> Optional[str]:
+    """Forme complète d'une URI (sans chevrons, préfixe ns: développé)"""
+    if value is None:
+        return None
+    value = value.strip().strip("<>")
+    return NS + value[3:] if value.startswith("ns:") else value
+
+
+def _label(uri: Optional[str]) -> str:
+    """Nom lisible d'une URI (nom local, "_" remplacés par des espaces)"""
+    if not uri:
+        return ""
+    return uri.rsplit("#", 1)[-1].rsplit("/", 1)[-1].replace("_", " ")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Termes d'un texte pour l'index : minuscules sans accents, mots et nombres
+    suivis de leurs "+" ("A+++"), sans mots vides ni nombres seuls (ceux des
+    questions sont des prix ou des quantités), pluriel en -s retiré.
+    """
+    terms = []
+    for token in _TOKEN.findall(fold(text)):
+        if token in STOP_WORDS or token.isdigit():
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def query_terms(text: str) -> List[str]:
+    """Les termes distincts d'une question, dans l'ordre"""
+    return list(dict.fromkeys(tokenize(text)))
+
+
+def _document_text(uri: str, doc: Dict) -> str:
+    return " ".join((_label(uri), doc.get("description", {}).get("value", ""),
+                     _label(doc.get("categorie", {}).get("value")), _label(doc.get("marque", {}).get("value"))))
+
+
+class _Index:
+    """Index inversé en ajout seul ; un document modifié reçoit un nouvel identifiant"""
+
+    def __init__(self):
+        self.uris: List[str] = []            # identifiant -> URI
+        self.ids: Dict[str, int] = {}        # URI -> identifiant de la version vivante
+        self.docs: Dict[str, Dict] = {}      # URI -> propriétés (valeurs SPARQL JSON)
+        self.postings: Dict[str, Tuple[array, array]] = {}   # terme -> (identifiants, tf)
+        self.df: Counter = Counter()         # terme -> nombre de documents vivants
+        self.total_length = 0
+        self.lengths = array("d")
+        self.alive = array("b")
+        self.prix = array("d")
+        self.categories = array("i")
+        self.marques = array("i")
+        self.codes: Dict[str, int] = {}      # URI de catégorie ou de marque -> code
+
+    def _code(self, uri: Optional[str]) -> int:
+        if uri is None:
+            return -1
+        return self.codes.setdefault(uri, len(self.codes))
+
+    def add(self, uri: str, doc: Dict) -> None:
+        self.remove(uri)
+        doc_id = len(self.uris)
+        terms = Counter(tokenize(_document_text(uri, doc)))
+        for term, tf in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("i"), array("H"))
+            posting[0].append(doc_id)
+            posting[1].append(min(tf, 65535))
+            self.df[term] += 1
+        length = sum(terms.values())
+        prix = binding_value(doc.get("prix"))
+        self.uris.append(uri)
+        self.ids[uri] = doc_id
+        self.docs[uri] = doc
+        self.total_length += length
+        self.lengths.append(length)
+        self.alive.append(1)
+        self.prix.append(float(prix) if isinstance(prix, (int, float)) else math.nan)
+        self.categories.append(self._code(doc.get("categorie", {}).get("value")))
+        self.marques.append(self._code(doc.get("marque", {}).get("value")))
+
+    def remove(self, uri: str) -> None:
+        doc_id = self.ids.pop(uri, None)
+        if doc_id is None:
+            return
+        doc = self.docs.pop(uri)
+        for term in set(tokenize(_document_text(uri, doc))):
+            self.df[term] -= 1
+            if not self.df[term]:
+                del self.df[term]
+        self.alive[doc_id] = 0
+        self.total_length -= int(self.lengths[doc_id])
+
+    def _codes(self, uris: Iterable[str]) -> List[int]:
+        # Une URI absente de l'index ne correspond à aucun document (-2)
+        return [self.codes.get(_uri(uri), -2) for uri in uris]
+
+    def search(self, terms: List[str], k: int, categorie_uris: Iterable[str] = (),
+               marque_uris: Iterable[str] = (), prix_min: Optional[float] = None,
+               prix_max: Optional[float] = None) -> List[Tuple[str, float]]:
+        live = len(self.ids)
+        if not live or k <= 0:
+            return []
+        avgdl = max(self.total_length / live, 1.0)
+        # Vues sans copie sur les tableaux de l'index (libérées au retour)
+        lengths = np.frombuffer(self.lengths, dtype=np.float64)
+        scores = np.zeros(len(self.uris))
+        for term in dict.fromkeys(terms):
+            df = self.df.get(term)
+            if not df:
+                continue
+            ids = np.frombuffer(self.postings[term][0], dtype=np.int32)
+            tfs = np.frombuffer(self.postings[term][1], dtype=np.uint16).astype(np.float64)
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ids] / avgdl)
+            # Un document apparaît une fois par liste de postings : pas d'indices répétés
+            scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        mask = (scores > 0) & np.frombuffer(self.alive, dtype=np.bool_)
+        categorie_codes, marque_codes = self._codes(categorie_uris), self._codes(marque_uris)
+        if categorie_codes:
+            mask &= np.isin(np.frombuffer(self.categories, dtype=np.int32), categorie_codes)
+        if marque_codes:
+            mask &= np.isin(np.frombuffer(self.marques, dtype=np.int32), marque_codes)
+        # Comparaisons strictes, comme les FILTER de la requête SPARQL (prix absent : exclu)
+        if prix_min is not None:
+            mask &= np.frombuffer(self.prix, dtype=np.float64) > prix_min
+        if prix_max is not None:
+            mask &= np.frombuffer(self.prix, dtype=np.float64) < prix_max
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.uris[i], float(scores[i])) for i in ranked]
+
+
+class ProductSearch:
+    def __init__(self, client: SparqlClient = sparql_client, rebuild_interval: float = REBUILD_INTERVAL):
+        self.client = client
+        self.rebuild_interval = rebuild_interval
+        self.ready = False
+        self._index = _Index()
+        # Produits écrits pendant une reconstruction en cours (URI -> propriétés, None si supprimé) :
+        # leur état en mémoire est plus récent que celui lu depuis Fuseki
+        self._dirty: Optional[Dict[str, Optional[Dict]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.searches = 0
+        self.search_time = 0.0
+        self.rebuilds = 0
+        self.last_rebuild: Optional[float] = None
+
+    # ==================== CONSTRUCTION ====================
+
+    async def rebuild(self) -> int:
+        """
+        Reconstruit l'index depuis Fuseki et remplace l'index courant.
+
+        Returns:
+            Le nombre de produits indexés
+        """
+        index = _Index()
+        self._dirty = {}
+        try:
+            async for row in self.client.stream(PRODUCTS_QUERY):
+                uri = row["produit"]["value"]
+                if uri not in index.docs:
+                    index.add(uri, {field: row[field] for field in FIELDS if field in row})
+            # Les écritures appliquées pendant la lecture priment sur l'état lu
+            for uri, doc in self._dirty.items():
+                if doc is None:
+                    index.remove(uri)
+                else:
+                    index.add(uri, doc)
+        finally:
+            self._dirty = None
+        self._index = index
+        self.ready = True
+        self.rebuilds += 1
+        self.last_rebuild = time.time()
+        return len(index.ids)
+
+    async def _rebuild_periodically(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Erreur de reconstruction de l'index des produits: {e}")
+
+    async def start(self):
+        """Construit l'index (au démarrage) et lance sa reconstruction périodique"""
+        try:
+            count = await self.rebuild()
+            logger.info(f"✅ Index plein texte des produits: {count} produits, {len(self._index.df)} termes")
+        except Exception as e:
+            # /search-products-nlp interroge Fuseki tant que l'index n'est pas prêt
+            logger.error(f"Construction de l'index des produits impossible: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._rebuild_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ==================== ÉCRITURES (appelées après une écriture réussie) ====================
+
+    def product_written(self, produit_uri: str, create: bool = False, description: Optional[str] = None,
+                        prix: Optional[float] = None, categorie_uri: Optional[str] = None,
+                        marque_uri: Optional[str] = None, image: Optional[str] = None) -> None:
+        """
+        Indexe l'ajout ou la modification d'un produit.
+
+        Args:
+            produit_uri: L'URI du produit
+            create: True pour un nouveau produit ; sinon un produit inconnu est ignoré
+            description, prix, categorie_uri, marque_uri, image: Les valeurs écrites (None : inchangée)
+        """
+        uri = _uri(produit_uri)
+        old = self._index.docs.get(uri)
+        if old is None and not create:
+            return
+        doc = dict(old or {})
+        if description is not None:
+            doc["description"] = {"type": "literal", "datatype": XSD + "string", "value": description}
+        if prix is not None:
+            doc["prix"] = {"type": "literal", "datatype": XSD + "decimal", "value": str(prix)}
+        if categorie_uri is not None:
+            doc["categorie"] = {"type": "uri", "value": _uri(categorie_uri)}
+        if marque_uri is not None:
+            doc["marque"] = {"type": "uri", "value": _uri(marque_uri)}
+        if image is not None:
+            doc["image"] = {"type": "literal", "datatype": XSD + "anyURI", "value": image}
+        self._index.add(uri, doc)
+        if self._dirty is not None:
+            self._dirty[uri] = doc
+
+    def product_deleted(self, produit_uri: str) -> None:
+        uri = _uri(produit_uri)
+        self._index.remove(uri)
+        if self._dirty is not None:
+            self._dirty[uri] = None
+
+    def documents(self) -> List[Tuple[str, Dict]]:
+        """Les produits indexés (URI, propriétés en valeurs SPARQL JSON)"""
+        return list(self._index.docs.items())
+
+    def document(self, produit_uri: str) -> Optional[Dict]:
+        """Les propriétés indexées d'un produit (None s'il n'est pas indexé)"""
+        return self._index.docs.get(_uri(produit_uri))
+
+    # ==================== RECHERCHE ====================
+
+    def known_terms(self, terms: Iterable[str]) -> List[str]:
+        """Les termes présents dans au moins un produit indexé (les autres ne classent rien)"""
+        return [term for term in terms if term in self._index.df]
+
+    def search(self, entites: Dict, k: int = SEARCH_TOP_K) -> List[Dict]:
+        """
+        Classe les produits selon les termes libres de la question, parmi ceux
+        qui satisfont les filtres structurés.
+
+        Args:
+            entites: Les entités extraites par analyser_question_nlp ("termes",
+                     catégories, marques, prix)
+            k: Le nombre maximal de résultats
+
+        Returns:
+            Les produits au format des résultats SPARQL JSON (produit, description,
+            prix, categorie, marque, image), avec leur "score", du plus pertinent
+            au moins pertinent
+        """
+        debut = time.perf_counter()
+        index = self._index
+        ranked = index.search(
+            entites.get("termes") or [], k,
+            categorie_uris=entites.get("categorie_uris") or [],
+            marque_uris=entites.get("marque_uris") or [],
+            prix_min=entites.get("prix_min"), prix_max=entites.get("prix_max")
+        )
+        results = []
+        for uri, score in ranked:
+            row = {"produit": {"type": "uri", "value": uri}}
+            row.update(index.docs[uri])
+            row["score"] = {"type": "literal", "datatype": XSD + "double", "value": f"{score:.4f}"}
+            results.append(row)
+        self.searches += 1
+        self.search_time += time.perf_counter() - debut
+        return results
+
+    def stats(self) -> Dict:
+        index = self._index
+        return {
+            "ready": self.ready,
+            "products": len(index.ids),
+            "terms": len(index.df),
+            "deleted_versions": len(index.uris) - len(index.ids),
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_time / self.searches * 1000, 3) if self.searches else 0.0,
+            "rebuild_interval": self.rebuild_interval,
+            "rebuilds": self.rebuilds,
+            "last_rebuild": self.last_rebuild
+        }
+
+
+# Instance partagée par main et le router des produits
+product_search = ProductSearch()
+
+
+# Mesure sur un catalogue synthétique (pour développement)
+if __name__ == "__main__":
+    import random
+    import sys
+
+    random.seed(0)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    categories = [NS + c for c in ("Lave-linge", "Lave-vaisselle", "Réfrigérateurs", "Aspirateurs", "Micro-ondes")]
+    marques = [NS + m for m in ("Samsung", "LG", "Beko", "Bosch", "Whirlpool", "Haier", "Candy")]
+    mots = ("inox silencieux A+++ A++ blanc noir gris encastrable pose libre grande capacité vapeur "
+            "programme rapide départ différé classe énergie écran tactile froid ventilé no frost "
+            "compact connecté wifi moteur induction tambour essorage tiroir congélateur sans sac").split()
+    index = _Index()
+    debut = time.perf_counter()
+    for i in range(total):
+        index.add(f"{NS}Produit_{i}", {
+            "description": {"type": "literal", "value": " ".join(random.choices(mots, k=random.randint(8, 25)))},
+            "prix": {"type": "literal", "datatype": XSD + "decimal", "value": str(random.randint(50, 2000))},
+            "categorie": {"type": "uri", "value": random.choice(categories)},
+            "marque": {"type": "uri", "value": random.choice(marques)}
+        })
+    print(f"=== {total} produits indexés en {time.perf_counter() - debut:.1f}s, {len(index.df)} termes ===")
+
+    requetes = [
+        (["inox", "silencieux"], {}),
+        (["a+++"], {"categorie_uris": [categories[0]]}),
+        (["encastrable", "vapeur", "wifi"], {"marque_uris": marques[:2], "prix_max": 800}),
+        (query_terms("réfrigérateur no frost ventilé"), {"prix_min": 300}),
+    ]
+    for terms, filtres in requetes:
+        debut = time.perf_counter()
+        for _ in range(20):
+            top = index.search(terms, 20, **filtres)
+        duree = (time.perf_counter() - debut) / 20 * 1000
+        print(f"{terms} {filtres}: {len(top)} résultats en {duree:.2f} ms")
+
+    # Mêmes résultats qu'un classement BM25 calculé document par document
+    terms, filtres = requetes[2]
+    live = len(index.ids)
+    avgdl = index.total_length / live
+    attendus = []
+    for uri, doc_id in index.ids.items():
+        doc = index.docs[uri]
+        prix = float(doc["prix"]["value"])
+        if doc["marque"]["value"] not in filtres["marque_uris"] or not prix < filtres["prix_max"]:
+            continue
+        tf = Counter(tokenize(_document_text(uri, doc)))
+        score = sum(math.log(1 + (live - index.df[t] + 0.5) / (index.df[t] + 0.5)) * tf[t] * (BM25_K1 + 1)
+                    / (tf[t] + BM25_K1 * (1 - BM25_B + BM25_B * index.lengths[doc_id] / avgdl))
+                    for t in terms if tf[t])
+        if score > 0:
+            attendus.append((score, uri))
+    attendus.sort(key=lambda item: -item[0])
+    obtenus = index.search(terms, 20, **filtres)
+    assert [round(s, 6) for s, _ in attendus[:20]] == [round(s, 6) for _, s in obtenus]
+    print("Classement identique au calcul BM25 document par document")
@@ -1,14 +1,14 @@
 from fastapi import APIRouter
-from SPARQLWrapper import SPARQLWrapper, JSON
 from pydantic import BaseModel, Field
+from sparql_client import sparql_client
+from dashboard_views import dashboard_views
+from vocabulary import vocabulary
+from product_search import product_search
+from suggest import suggester
 
 # Créer un router pour les produits
 router = APIRouter()
 
-# Configurations de connexion à Fuseki
-sparql_query = SPARQLWrapper("http://localhost:3030/SmartCom/query")
-sparql_update = SPARQLWrapper("http://localhost:3030/SmartCom/update")
-
 # ==================== MODÈLES PYDANTIC ====================
 
 class ProduitInput(BaseModel):
@@ -62,10 +62,16 @@ async def add_produit(produit: ProduitInput):
     """
     
     print("Générée SPARQL Insert Query:", insert_query)
-    sparql_update.setQuery(insert_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(insert_query)
+        dashboard_views.product_written(produit_uri, create=True, categorie_uri=categorie_uri,
+                                        marque_uri=marque_uri, prix=produit.prix,
+                                        stock=produit.stock_disponible)
+        vocabulary.observe(categorie_uri=categorie_uri, marque_uri=marque_uri)
+        product_search.product_written(produit_uri, create=True, description=produit.description,
+                                       prix=produit.prix, categorie_uri=categorie_uri,
+                                       marque_uri=marque_uri, image=produit.image)
+        suggester.product_written(produit_uri)
         return {"message": "Produit ajouté avec succès", "produit_uri": produit_uri}
     except Exception as e:
         return {"error": str(e)}
@@ -90,10 +96,8 @@ async def get_produit(produit_uri: str):
     """
     
     print("Générée SPARQL Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(query, cache=True)
         return {"produit": results["results"]["bindings"]}
     except Exception as e:
         return {"error": str(e)}
@@ -162,10 +166,16 @@ async def update_produit(produit: ProduitUpdate):
     """
     
     print("Générée SPARQL Update Query:", update_query)
-    sparql_update.setQuery(update_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(update_query)
+        dashboard_views.product_written(produit.produit_uri, categorie_uri=produit.categorie_uri,
+                                        marque_uri=produit.marque_uri, prix=produit.prix,
+                                        stock=produit.stock_disponible)
+        vocabulary.observe(categorie_uri=produit.categorie_uri, marque_uri=produit.marque_uri)
+        product_search.product_written(produit.produit_uri, description=produit.description,
+                                       prix=produit.prix, categorie_uri=produit.categorie_uri,
+                                       marque_uri=produit.marque_uri, image=produit.image)
+        suggester.product_written(produit.produit_uri)
         return {"message": "Produit modifié avec succès"}
     except Exception as e:
         return {"error": str(e)}
@@ -182,10 +192,11 @@ async def delete_produit(produit_uri: str):
     """
     
     print("Générée SPARQL Delete Query:", delete_query)
-    sparql_update.setQuery(delete_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(delete_query, touches=["ns:Produit"])
+        dashboard_views.product_deleted(produit_uri)
+        product_search.product_deleted(produit_uri)
+        suggester.product_deleted(produit_uri)
         return {"message": "Produit supprimé avec succès"}
     except Exception as e:
         return {"error": str(e)} 
\ No newline at end of file
@@ -1,16 +1,13 @@
-from fastapi import APIRouter
-from SPARQLWrapper import SPARQLWrapper, JSON
+from fastapi import APIRouter, Query
 from pydantic import BaseModel, Field
+from sparql_client import sparql_client
+from pagination import Keyset, page_size, MAX_PAGE_SIZE
 from typing import Optional
 from datetime import datetime
 
 # Créer un router pour les promotions
 router = APIRouter()
 
-# Configurations de connexion à Fuseki
-sparql_query = SPARQLWrapper("http://localhost:3030/SmartCom/query")
-sparql_update = SPARQLWrapper("http://localhost:3030/SmartCom/update")
-
 # ==================== MODÈLES PYDANTIC ====================
 
 class PromotionInput(BaseModel):
@@ -32,6 +29,11 @@ class RemiseInput(BaseModel):
     montant_remise: float = Field(ge=0)
     promotion_uri: str
 
+# Ordres de pagination (une promotion peut s'appliquer à plusieurs produits,
+# une remise peut être offerte par plusieurs promotions)
+PROMOTIONS_KEYSET = Keyset(("dateDebut", True), ("promotion", False), ("produit", False))
+REMISES_KEYSET = Keyset(("remise", False), ("promotion", False))
+
 # ==================== ENDPOINTS PROMOTIONS ====================
 
 # 1. CREATE - Ajouter une promotion
@@ -60,10 +62,8 @@ async def add_promotion(promotion: PromotionInput):
     """
     
     print("Générée SPARQL Insert Query:", insert_query)
-    sparql_update.setQuery(insert_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(insert_query)
         return {
             "message": "Promotion ajoutée avec succès", 
             "promotion_uri": promotion_uri,
@@ -74,28 +74,33 @@ async def add_promotion(promotion: PromotionInput):
 
 # 2. READ ALL - Lire toutes les promotions
 @router.get("/promotions")
-async def get_promotions():
-    """Récupérer la liste de toutes les promotions"""
-    query = """
-        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?promotion ?dateDebut ?dateFin ?pourcentage ?reduction ?produit
-        WHERE {
-            ?promotion a ns:prommotion .
-            OPTIONAL { ?promotion ns:aDateDebut ?dateDebut . }
-            OPTIONAL { ?promotion ns:aDateFin ?dateFin . }
-            OPTIONAL { ?promotion ns:aPourcentageReduction ?pourcentage . }
-            OPTIONAL { ?promotion ns:aReduction ?reduction . }
-            OPTIONAL { ?promotion ns:aAppliqueAProduit ?produit . }
-        }
-        ORDER BY DESC(?dateDebut)
-    """
-    
-    print("Générée SPARQL Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
+async def get_promotions(limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                         cursor: Optional[str] = None):
+    """Récupérer la liste de toutes les promotions (paginée si limit ou cursor est fourni)"""
+    size = page_size(limit, cursor)
     try:
-        results = sparql_query.query().convert()
-        return {"promotions": results["results"]["bindings"]}
+        query = f"""
+            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+            SELECT ?promotion ?dateDebut ?dateFin ?pourcentage ?reduction ?produit
+            WHERE {{
+                ?promotion a ns:prommotion .
+                OPTIONAL {{ ?promotion ns:aDateDebut ?dateDebut . }}
+                OPTIONAL {{ ?promotion ns:aDateFin ?dateFin . }}
+                OPTIONAL {{ ?promotion ns:aPourcentageReduction ?pourcentage . }}
+                OPTIONAL {{ ?promotion ns:aReduction ?reduction . }}
+                OPTIONAL {{ ?promotion ns:aAppliqueAProduit ?produit . }}
+                {PROMOTIONS_KEYSET.filter(cursor)}
+            }}
+            {PROMOTIONS_KEYSET.modifiers(size) if size else "ORDER BY DESC(?dateDebut)"}
+        """
+        
+        print("Générée SPARQL Query:", query)
+        results = await sparql_client.query(query)
+        bindings = results["results"]["bindings"]
+        if size is None:
+            return {"promotions": bindings}
+        rows, next_cursor = PROMOTIONS_KEYSET.page(bindings, size)
+        return {"promotions": rows, "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
@@ -124,10 +129,8 @@ async def get_active_promotions():
     
     print("Générée SPARQL Active Promotions Query:", query)
     print(f"Date actuelle utilisée: {now}")
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(query, cache=True)
         return {"promotions_actives": results["results"]["bindings"]}
     except Exception as e:
         return {"error": str(e)}
@@ -151,10 +154,8 @@ async def get_product_promotions(produit_uri: str):
     """
     
     print("Générée SPARQL Product Promotions Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(query)
         return {"promotions": results["results"]["bindings"]}
     except Exception as e:
         return {"error": str(e)}
@@ -205,10 +206,8 @@ async def update_promotion(promotion: PromotionUpdate):
     """
     
     print("Générée SPARQL Update Query:", update_query)
-    sparql_update.setQuery(update_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(update_query)
         return {"message": "Promotion modifiée avec succès"}
     except Exception as e:
         return {"error": str(e)}
@@ -225,10 +224,8 @@ async def delete_promotion(promotion_uri: str):
     """
     
     print("Générée SPARQL Delete Query:", delete_query)
-    sparql_update.setQuery(delete_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(delete_query, touches=["ns:prommotion"])
         return {"message": "Promotion supprimée avec succès"}
     except Exception as e:
         return {"error": str(e)}
@@ -257,34 +254,38 @@ async def add_remise(remise: RemiseInput):
     """
     
     print("Générée SPARQL Insert Remise Query:", insert_query)
-    sparql_update.setQuery(insert_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(insert_query)
         return {"message": "Remise créée avec succès", "remise_uri": remise_uri}
     except Exception as e:
         return {"error": str(e)}
 
 # 8. READ ALL - Lire toutes les remises
 @router.get("/remises")
-async def get_remises():
-    """Récupérer la liste de toutes les remises"""
-    query = """
-        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?remise ?montant ?promotion
-        WHERE {
-            ?remise a ns:Remise .
-            OPTIONAL { ?remise ns:aMontantRemise ?montant . }
-            OPTIONAL { ?promotion ns:aOffreRemise ?remise . }
-        }
-    """
-    
-    print("Générée SPARQL Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
+async def get_remises(limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                      cursor: Optional[str] = None):
+    """Récupérer la liste de toutes les remises (paginée si limit ou cursor est fourni)"""
+    size = page_size(limit, cursor)
     try:
-        results = sparql_query.query().convert()
-        return {"remises": results["results"]["bindings"]}
+        query = f"""
+            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+            SELECT ?remise ?montant ?promotion
+            WHERE {{
+                ?remise a ns:Remise .
+                OPTIONAL {{ ?remise ns:aMontantRemise ?montant . }}
+                OPTIONAL {{ ?promotion ns:aOffreRemise ?remise . }}
+                {REMISES_KEYSET.filter(cursor)}
+            }}
+            {REMISES_KEYSET.modifiers(size) if size else ""}
+        """
+        
+        print("Générée SPARQL Query:", query)
+        results = await sparql_client.query(query)
+        bindings = results["results"]["bindings"]
+        if size is None:
+            return {"remises": bindings}
+        rows, next_cursor = REMISES_KEYSET.page(bindings, size)
+        return {"remises": rows, "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
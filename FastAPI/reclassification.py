@@ -0,0 +1,311 @@
+"""
+Re-classification des avis stockés
+Quand les lexiques ou les seuils de l'analyse de sentiment changent, les avis
+déjà enregistrés gardent leur ancienne classe (ns:Avis_positif, ns:Avis_négatif
+ou ns:Avis). Ce job parcourt tous les avis par pages (curseur keyset sur l'URI),
+les score par lots dans le pool de processus (analyze_sentiment_batch,
+vectorisé), et n'envoie que les classes qui changent, par DELETE/INSERT groupés.
+Chaque page ne choisit que ses avis (filtre et tri sur ?avis lui-même, LIMIT)
+avant de regrouper leurs classes : le coût d'une page ne dépend pas de son rang.
+
+Un avis enregistré 'neutral' faute de scoring (pool occupé ou en redémarrage)
+porte la marque ns:aSentimentProvisoire : le job le re-score et retire la marque,
+même si sa classe ne change pas. pending_only=True ne parcourt que ces avis.
+
+Après chaque page écrite, l'avancement (curseur, compteurs) est enregistré dans
+un fichier de reprise : un job interrompu reprend après la dernière page
+écrite, tant que les lexiques n'ont pas changé entre-temps.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from sparql_client import SparqlClient, sparql_client, sparql_literal
+from sentiment_pool import SentimentPool
+from dashboard_views import DashboardViews, dashboard_views, SENTIMENT_TYPES
+from lexicon_cache import source_checksum
+from pagination import encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+# Nombre d'avis lus par page
+RECLASSIFY_PAGE_SIZE = int(os.getenv("RECLASSIFY_PAGE_SIZE", "5000"))
+# Nombre maximal d'avis par requête DELETE/INSERT
+RECLASSIFY_UPDATE_BATCH = int(os.getenv("RECLASSIFY_UPDATE_BATCH", "1000"))
+CHECKPOINT_FILENAME = "reclassification_checkpoint.json"
+# Marque d'un avis classé par défaut, à re-scorer
+PROVISIONAL_SENTIMENT = NS + "aSentimentProvisoire"
+
+# IRI sans caractères interdits (évite l'injection dans la requête)
+_IRI = re.compile(r'^[^\s<>"{}|\\^`]+$')
+
+
+def _page_query(cursor: Optional[str], limit: int, pending_only: bool = False) -> str:
+    # Les avis de la page (après le curseur, une ligne de plus pour détecter la page
+    # suivante) sont choisis avant le regroupement de leurs classes. ?avis est
+    # toujours lié : pas de COALESCE. SPARQL ne compare pas les IRI avec ">", d'où
+    # STR(?avis), dont l'ordre est celui de ORDER BY ?avis
+    after = f"FILTER (STR(?avis) > {sparql_literal(decode_cursor(cursor, 1)[0])})" if cursor else ""
+    pending = f"?avis <{PROVISIONAL_SENTIMENT}> true ." if pending_only else ""
+    return f"""
+        PREFIX ns: <{NS}>
+        SELECT ?avis (GROUP_CONCAT(DISTINCT STR(?type); separator=" ") AS ?types)
+               (SAMPLE(?commentaire) AS ?texte) (SAMPLE(?provisoire) AS ?aRescorer)
+        WHERE {{
+            {{
+                SELECT DISTINCT ?avis WHERE {{
+                    VALUES ?classe {{ ns:Avis_positif ns:Avis_négatif ns:Avis }}
+                    ?avis a ?classe .
+                    {pending}
+                    {after}
+                }}
+                ORDER BY ?avis
+                LIMIT {limit + 1}
+            }}
+            VALUES ?type {{ ns:Avis_positif ns:Avis_négatif ns:Avis }}
+            ?avis a ?type .
+            OPTIONAL {{ ?avis ns:aCommentaire ?commentaire . }}
+            OPTIONAL {{ ?avis <{PROVISIONAL_SENTIMENT}> ?provisoire . }}
+        }}
+        GROUP BY ?avis
+        ORDER BY ?avis
+    """
+
+
+def _count_query(pending_only: bool = False) -> str:
+    pending = f"?avis <{PROVISIONAL_SENTIMENT}> true ." if pending_only else ""
+    return f"""
+        PREFIX ns: <{NS}>
+        SELECT (COUNT(DISTINCT ?avis) AS ?total)
+        WHERE {{
+            VALUES ?type {{ ns:Avis_positif ns:Avis_négatif ns:Avis }}
+            ?avis a ?type .
+            {pending}
+        }}
+    """
+
+
+def default_checkpoint_path(data_path: str) -> str:
+    return os.getenv("RECLASSIFY_CHECKPOINT_PATH") or os.path.join(data_path, CHECKPOINT_FILENAME)
+
+
+class ReclassificationJob:
+    def __init__(self, pool: SentimentPool, client: SparqlClient = sparql_client,
+                 views: DashboardViews = dashboard_views, checkpoint_path: Optional[str] = None,
+                 page_size: int = RECLASSIFY_PAGE_SIZE, update_batch: int = RECLASSIFY_UPDATE_BATCH):
+        self.pool = pool
+        self.client = client
+        self.views = views
+        self.checkpoint_path = checkpoint_path or default_checkpoint_path(pool.data_path)
+        self.page_size = page_size
+        self.update_batch = update_batch
+        self._task: Optional[asyncio.Task] = None
+        self.pending_only = False
+        self.progress: Dict = {"state": "idle"}
+
+    # ==================== REPRISE ====================
+
+    def _read_checkpoint(self, checksum: str) -> Optional[Dict]:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get("lexicon_checksum") != checksum:
+            logger.info("Lexiques modifiés depuis le dernier job : re-classification depuis le début")
+            return None
+        return checkpoint
+
+    def _write_checkpoint(self, checkpoint: Dict) -> None:
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self) -> None:
+        try:
+            os.remove(self.checkpoint_path)
+        except OSError:
+            pass
+
+    # ==================== LECTURE / SCORING / ÉCRITURE ====================
+
+    async def _fetch_page(self, cursor: Optional[str]) -> Tuple[List[Dict], Optional[str]]:
+        results = await self.client.query(_page_query(cursor, self.page_size, self.pending_only))
+        rows = results["results"]["bindings"]
+        if len(rows) <= self.page_size:
+            return rows, None
+        rows = rows[:self.page_size]
+        return rows, encode_cursor([rows[-1]["avis"]["value"]])
+
+    @staticmethod
+    def _update_query(changes: List[Tuple[str, str]]) -> str:
+        """Une opération DELETE/INSERT par nouvelle classe (marque provisoire retirée), dans une seule requête"""
+        by_sentiment: Dict[str, List[str]] = {}
+        for avis_uri, sentiment in changes:
+            by_sentiment.setdefault(sentiment, []).append(f"<{avis_uri}>")
+        operations = [
+            f"""
+            DELETE {{ ?avis a ?ancienne . ?avis <{PROVISIONAL_SENTIMENT}> ?provisoire }}
+            INSERT {{ ?avis a <{SENTIMENT_TYPES[sentiment]}> }}
+            WHERE {{
+                VALUES ?avis {{ {" ".join(uris)} }}
+                VALUES ?ancienne {{ ns:Avis_positif ns:Avis_négatif ns:Avis }}
+                ?avis a ?ancienne .
+                OPTIONAL {{ ?avis <{PROVISIONAL_SENTIMENT}> ?provisoire . }}
+            }}"""
+            for sentiment, uris in by_sentiment.items()
+        ]
+        return f"PREFIX ns: <{NS}>\n" + " ;\n".join(operations)
+
+    async def _process_page(self, rows: List[Dict]) -> None:
+        progress = self.progress
+        avis = []
+        for row in rows:
+            uri = row["avis"]["value"]
+            texte = row.get("texte", {}).get("value")
+            if texte is None or not _IRI.match(uri):
+                progress["skipped"] += 1
+                continue
+            types = set(row.get("types", {}).get("value", "").split())
+            avis.append((uri, types, texte, "aRescorer" in row))
+
+        sentiments = await self.pool.score_spread([texte for _, _, texte, _ in avis])
+        # Classe modifiée, ou classe provisoire confirmée (la marque est retirée)
+        changes = [(uri, sentiment) for (uri, types, _, provisoire), sentiment in zip(avis, sentiments)
+                   if provisoire or types != {SENTIMENT_TYPES[sentiment]}]
+        changed = {uri for (uri, types, _, _), sentiment in zip(avis, sentiments)
+                   if types != {SENTIMENT_TYPES[sentiment]}}
+        for i in range(0, len(changes), self.update_batch):
+            batch = changes[i:i + self.update_batch]
+            await self.client.update(self._update_query(batch))
+            for uri, sentiment in batch:
+                self.views.avis_reclassified(uri, sentiment)
+                if uri in changed:
+                    progress["transitions"][sentiment] += 1
+        progress["processed"] += len(avis)
+        progress["changed"] += len(changed)
+        progress["rescored"] += sum(1 for *_, provisoire in avis if provisoire)
+
+    async def _run(self, resume: bool) -> None:
+        progress = self.progress
+        checksum = source_checksum(self.pool.data_path).hex()
+        # Les avis à re-scorer perdent leur marque une fois écrits : ce parcours,
+        # court, n'a pas de fichier de reprise (et ne touche pas à celui du job complet)
+        checkpoint = self._read_checkpoint(checksum) if resume and not self.pending_only else None
+        if checkpoint:
+            progress.update({key: checkpoint[key]
+                             for key in ("cursor", "processed", "changed", "rescored", "skipped", "pages")
+                             if key in checkpoint})
+            progress["transitions"] = Counter(checkpoint["transitions"])
+            progress["resumed"] = True
+
+        total = await self.client.aggregate(_count_query(self.pending_only), cache=False)
+        progress["total"] = int(total[0]["total"]) if total else 0
+        start, processed_before = time.perf_counter(), progress["processed"] + progress["skipped"]
+
+        # La page suivante est lue pendant le scoring et l'écriture de la page courante
+        fetching = asyncio.ensure_future(self._fetch_page(progress["cursor"]))
+        try:
+            while True:
+                rows, next_cursor = await fetching
+                if next_cursor is not None:
+                    fetching = asyncio.ensure_future(self._fetch_page(next_cursor))
+                await self._process_page(rows)
+                progress["pages"] += 1
+                progress["cursor"] = next_cursor
+                if next_cursor is None:
+                    break
+                if not self.pending_only:
+                    self._write_checkpoint({
+                        "lexicon_checksum": checksum,
+                        "cursor": next_cursor,
+                        "processed": progress["processed"],
+                        "changed": progress["changed"],
+                        "rescored": progress["rescored"],
+                        "skipped": progress["skipped"],
+                        "pages": progress["pages"],
+                        "transitions": dict(progress["transitions"])
+                    })
+                elapsed = time.perf_counter() - start
+                done = progress["processed"] + progress["skipped"]
+                rate = (done - processed_before) / elapsed if elapsed > 0 else 0.0
+                progress["avis_per_second"] = round(rate, 1)
+                progress["eta_s"] = round(max(progress["total"] - done, 0) / rate, 1) if rate > 0 else None
+        finally:
+            if not fetching.done():
+                fetching.cancel()
+        if not self.pending_only:
+            self._clear_checkpoint()
+        elapsed = time.perf_counter() - start
+        progress["avis_per_second"] = round((progress["processed"] + progress["skipped"] - processed_before) / elapsed, 1) if elapsed > 0 else 0.0
+        progress["eta_s"] = 0.0
+
+    async def _run_and_report(self, resume: bool) -> None:
+        progress = self.progress
+        try:
+            await self._run(resume)
+            progress["state"] = "completed"
+            logger.info(f"✅ Re-classification terminée: {progress['processed']} avis, {progress['changed']} modifiés")
+        except asyncio.CancelledError:
+            progress["state"] = "cancelled"
+            raise
+        except Exception as e:
+            progress["state"] = "failed"
+            progress["error"] = str(e)
+            logger.error(f"Erreur de re-classification des avis (reprise possible): {e}")
+        finally:
+            progress["finished_at"] = time.time()
+
+    # ==================== PILOTAGE ====================
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, resume: bool = True, pending_only: bool = False) -> bool:
+        """
+        Lance le job en tâche de fond.
+
+        Args:
+            resume: Reprendre après la dernière page écrite d'un job interrompu
+            pending_only: Ne re-scorer que les avis classés par défaut (ns:aSentimentProvisoire)
+
+        Returns:
+            False si un job est déjà en cours
+        """
+        if self.running:
+            return False
+        self.pending_only = pending_only
+        self.progress = {
+            "state": "running", "pending_only": pending_only, "resumed": False, "total": None,
+            "processed": 0, "changed": 0, "rescored": 0, "skipped": 0, "pages": 0, "cursor": None,
+            "transitions": Counter(), "avis_per_second": None, "eta_s": None, "error": None,
+            "started_at": time.time(), "finished_at": None
+        }
+        self._task = asyncio.create_task(self._run_and_report(resume))
+        return True
+
+    async def cancel(self) -> bool:
+        """Interrompt le job en cours (le fichier de reprise est conservé)"""
+        if not self.running:
+            return False
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return True
+
+    def status(self) -> Dict:
+        status = {key: value for key, value in self.progress.items() if key != "cursor"}
+        if "transitions" in status:
+            status["transitions"] = dict(status["transitions"])
+        return status
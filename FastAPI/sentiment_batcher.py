@@ -0,0 +1,172 @@
+"""
+Micro-batching de l'analyse de sentiment des avis
+Les endpoints déposent chaque commentaire dans une file bornée et attendent son
+résultat ; une tâche de fond regroupe les commentaires arrivés ensemble (au plus
+SENTIMENT_BATCH_SIZE, après une attente de SENTIMENT_BATCH_WAIT secondes) et
+score chaque lot dans son propre pool de processus (SENTIMENT_LIVE_WORKERS
+processus, distinct de celui de l'import en masse et de la re-classification,
+qui ne peuvent donc pas le saturer). La boucle d'événements n'exécute donc
+jamais la tokenisation NLTK.
+
+Si la file est pleine, si le scoring échoue ou dépasse SENTIMENT_TIMEOUT, score()
+lève SentimentUnavailable : l'appelant enregistre l'avis avec FALLBACK_SENTIMENT,
+marqué comme provisoire pour que la re-classification le re-score.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+from sentiment_pool import SentimentPool
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal de commentaires par lot
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+# Attente (secondes) pour regrouper les commentaires arrivés ensemble
+SENTIMENT_BATCH_WAIT = float(os.getenv("SENTIMENT_BATCH_WAIT", "0.005"))
+# Nombre maximal de commentaires en attente de scoring
+SENTIMENT_QUEUE_SIZE = int(os.getenv("SENTIMENT_QUEUE_SIZE", "1000"))
+# Délai maximal (secondes) du scoring d'un avis
+SENTIMENT_TIMEOUT = float(os.getenv("SENTIMENT_TIMEOUT", "2.0"))
+# Processus du pool dédié aux avis unitaires
+SENTIMENT_LIVE_WORKERS = int(os.getenv("SENTIMENT_LIVE_WORKERS", str(max(1, (os.cpu_count() or 2) // 4))))
+
+# Classe enregistrée (provisoirement) quand le sentiment n'a pas pu être calculé
+FALLBACK_SENTIMENT = "neutral"
+
+
+class SentimentUnavailable(Exception):
+    """Le sentiment d'un avis n'a pas pu être calculé (file pleine, délai dépassé, erreur)"""
+
+
+class SentimentBatcher:
+    def __init__(self, pool: SentimentPool, max_batch: int = SENTIMENT_BATCH_SIZE,
+                 max_wait: float = SENTIMENT_BATCH_WAIT, max_queue: int = SENTIMENT_QUEUE_SIZE,
+                 timeout: float = SENTIMENT_TIMEOUT):
+        self.pool = pool
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.timeout = timeout
+        # La file et la tâche de regroupement sont liées à la boucle d'événements courante
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Task] = set()
+        self.scored = 0
+        self.batches = 0
+        self.batched = 0
+        self.max_batch_seen = 0
+        self.queue_full = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            # Un lot en cours par processus du pool : les lots suivants attendent dans la file
+            self._slots = asyncio.Semaphore(self.pool.workers)
+            self._collector = loop.create_task(self._collect())
+
+    async def _collect(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self.max_wait > 0 and self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # Les demandes abandonnées (délai dépassé, client parti) ne sont pas scorées
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            await self._slots.acquire()
+            task = asyncio.create_task(self._score_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _score_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            sentiments = await self.pool.score([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.batches += 1
+            self.batched += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for (_, future), sentiment in zip(batch, sentiments):
+                if not future.done():
+                    future.set_result(sentiment)
+        finally:
+            self._slots.release()
+
+    async def score(self, text: str) -> str:
+        """
+        Score un commentaire dans le pool, regroupé avec les demandes concurrentes.
+
+        Args:
+            text: Le commentaire
+
+        Returns:
+            'positive', 'negative' ou 'neutral'
+
+        Raises:
+            SentimentUnavailable: La file est pleine, le scoring a échoué ou dépassé le délai
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            self.queue_full += 1
+            logger.warning("File d'analyse de sentiment pleine : avis classé provisoirement")
+            raise SentimentUnavailable("File d'analyse de sentiment pleine")
+        try:
+            sentiment = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            self.scored += 1
+            return sentiment
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Analyse de sentiment au-delà de {self.timeout}s : avis classé provisoirement")
+            raise SentimentUnavailable(f"Analyse de sentiment au-delà de {self.timeout}s")
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Erreur d'analyse de sentiment, avis classé provisoirement: {e}")
+            raise SentimentUnavailable(f"Erreur d'analyse de sentiment: {e}") from e
+        finally:
+            if not future.done():
+                future.cancel()
+
+    async def start(self) -> None:
+        """Démarre le regroupement et les processus du pool (chargement des lexiques)"""
+        self._ensure_started()
+        try:
+            await asyncio.gather(*(self.pool.score(["ok"]) for _ in range(self.pool.workers)))
+        except Exception as e:
+            logger.error(f"Démarrage du pool d'analyse de sentiment impossible: {e}")
+
+    async def stop(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        for task in list(self._batches):
+            task.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "scored": self.scored,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "queue_full": self.queue_full,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "pool": self.pool.stats()
+        }
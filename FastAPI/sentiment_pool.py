@@ -0,0 +1,104 @@
+"""
+Pool de processus pour l'analyse de sentiment
+Chaque processus du pool charge son propre LexiconAnalyzer au démarrage
+(initializer ; le cache binaire des lexiques est partagé par mmap) et score
+des lots de commentaires, ce qui répartit le coût CPU de l'analyse sur
+plusieurs cœurs sans bloquer la boucle d'événements.
+
+Si un processus meurt (mémoire, signal), l'exécuteur est inutilisable : il est
+abandonné et recréé à l'appel suivant, et le lot en cours est réessayé une fois.
+"""
+
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Nombre de processus d'analyse (par défaut : nombre de cœurs)
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", str(os.cpu_count() or 2)))
+
+# Analyseur du processus worker courant
+_analyzer = None
+
+
+def _init_worker(data_path: str) -> None:
+    global _analyzer
+    from lexicon_analyzer import LexiconAnalyzer
+    _analyzer = LexiconAnalyzer(data_path)
+
+
+def _score_batch(texts: List[str]) -> List[str]:
+    return _analyzer.analyze_sentiment_batch(texts)
+
+
+class SentimentPool:
+    def __init__(self, data_path: str, workers: int = SENTIMENT_WORKERS):
+        self.data_path = data_path
+        self.workers = max(workers, 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.restarts = 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Démarrer les processus à la première utilisation"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.data_path,)
+            )
+        return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        """Abandonne un exécuteur cassé (une seule fois, même si plusieurs lots l'ont vu échouer)"""
+        if self._pool is pool:
+            self._pool = None
+            self.restarts += 1
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def score(self, texts: List[str]) -> List[str]:
+        """
+        Score un lot de commentaires dans un processus du pool.
+
+        Args:
+            texts: Les commentaires
+
+        Returns:
+            Le sentiment de chaque commentaire ('positive', 'negative' ou 'neutral')
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                return await loop.run_in_executor(pool, _score_batch, texts)
+            except BrokenProcessPool:
+                self._discard(pool)
+                if attempt:
+                    raise
+                logger.warning("Pool d'analyse de sentiment cassé (processus arrêté) : pool recréé, lot réessayé")
+
+    async def score_spread(self, texts: List[str]) -> List[str]:
+        """
+        Score un grand lot en le répartissant entre tous les processus du pool
+        (import en masse, re-classification), au lieu d'un seul processus.
+
+        Args:
+            texts: Les commentaires
+
+        Returns:
+            Le sentiment de chaque commentaire, dans l'ordre
+        """
+        size = max(1, -(-len(texts) // self.workers))
+        batches = await asyncio.gather(*(self.score(texts[i:i + size]) for i in range(0, len(texts), size)))
+        return [label for batch in batches for label in batch]
+
+    def stats(self) -> Dict:
+        return {"workers": self.workers, "restarts": self.restarts}
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,138 @@
+"""
+Cache en mémoire des résultats SPARQL
+Les résultats des requêtes SELECT fréquentes sont conservés par texte de
+requête normalisé (taille bornée, éviction LRU, durée de vie par entrée).
+Chaque entrée est indexée par les termes de l'ontologie qu'elle mentionne
+(sujets, prédicats, classes) : une mise à jour n'invalide que les entrées
+qui partagent au moins un terme avec elle.
+"""
+
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+_PREFIX_DECL = re.compile(r"PREFIX\s+\w*:\s*<[^>]*>", re.IGNORECASE)
+_WHITESPACE = re.compile(r'("(?:[^"\\]|\\.)*")|\s+')
+_IRI = re.compile(r"<([^<>\s]*)>")
+_NS_NAME = re.compile(r"\bns:([\w\-]+)")
+# Prédicat variable ("?s ?p ?o") : la mise à jour peut toucher n'importe quel prédicat
+_WILDCARD_PREDICATE = re.compile(r"\?\w+\s+\?\w+\s*[.;}]")
+
+
+def normalize_query(query: str) -> str:
+    """Réduit les espaces hors des littéraux pour obtenir une clé de cache stable"""
+    return _WHITESPACE.sub(lambda m: m.group(1) or " ", query).strip()
+
+
+def extract_terms(text: str) -> Set[str]:
+    """Extrait les IRIs de l'ontologie (forme complète) mentionnées dans une requête"""
+    body = _PREFIX_DECL.sub(" ", text)
+    terms = {iri for iri in _IRI.findall(body) if iri.startswith(NS)}
+    terms.update(NS + name for name in _NS_NAME.findall(body))
+    return terms
+
+
+class SparqlCache:
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_term: Dict[str, Set[str]] = {}
+        # Incrémenté à chaque invalidation : un résultat lu avant une écriture n'est pas mis en cache
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, query: str) -> Optional[Dict]:
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        result, expires_at, _ = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, query: str, result: Dict, generation: int) -> None:
+        """Ajoute un résultat, sauf si une invalidation a eu lieu depuis le début de la lecture"""
+        if generation != self.generation:
+            return
+        key = normalize_query(query)
+        if key in self._entries:
+            self._remove(key)
+        terms = extract_terms(key)
+        self._entries[key] = (result, time.monotonic() + self.ttl, terms)
+        for term in terms:
+            self._by_term.setdefault(term, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, update: str, touches: Optional[Iterable[str]] = None) -> int:
+        """
+        Invalide les entrées concernées par une mise à jour.
+
+        Args:
+            update: Le texte de la requête SPARQL Update
+            touches: Termes supplémentaires touchés (ex. "ns:Produit"), nécessaires
+                     quand la mise à jour utilise un prédicat variable
+
+        Returns:
+            Le nombre d'entrées invalidées
+        """
+        self.generation += 1
+        if touches is None and _WILDCARD_PREDICATE.search(_PREFIX_DECL.sub(" ", update)):
+            count = len(self._entries)
+            self.clear()
+        else:
+            terms = extract_terms(update)
+            if touches:
+                terms.update(extract_terms(" ".join(touches)))
+            keys = set()
+            for term in terms:
+                keys.update(self._by_term.get(term, ()))
+            for key in keys:
+                self._remove(key)
+            count = len(keys)
+        self.invalidations += count
+        return count
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_term.clear()
+
+    def _remove(self, key: str) -> None:
+        _, _, terms = self._entries.pop(key)
+        for term in terms:
+            keys = self._by_term.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_term[term]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
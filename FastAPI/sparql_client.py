@@ -0,0 +1,414 @@
+"""
+Client SPARQL asynchrone pour Fuseki
+Ce module fournit la passerelle d'exécution partagée, basée sur un pool de
+connexions HTTP keep-alive, utilisée par tous les routers, CartQueries et
+OrderService. Elle limite le nombre de requêtes envoyées simultanément à
+Fuseki et met les autres en file d'attente, et porte le cache des résultats
+de lecture (voir sparql_cache).
+"""
+
+import asyncio
+import json
+import os
+import re
+import httpx
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+from sparql_cache import SparqlCache
+
+# Configurations de connexion à Fuseki
+FUSEKI_ENDPOINT = "http://localhost:3030/SmartCom"
+
+# Limites de concurrence (configurables par variables d'environnement)
+MAX_IN_FLIGHT = int(os.getenv("SPARQL_MAX_IN_FLIGHT", "16"))
+MAX_QUEUE = int(os.getenv("SPARQL_MAX_QUEUE", "256"))
+QUEUE_TIMEOUT = float(os.getenv("SPARQL_QUEUE_TIMEOUT", "10"))
+# Exports en flux : leur place est tenue tant que le client HTTP lit la réponse,
+# ils ont donc leur propre limite pour ne jamais bloquer les requêtes ordinaires
+MAX_STREAMS = int(os.getenv("SPARQL_MAX_STREAMS", "4"))
+
+# Cache des résultats de lecture
+CACHE_SIZE = int(os.getenv("SPARQL_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("SPARQL_CACHE_TTL", "60"))
+
+
+def sparql_literal(value) -> str:
+    """Retourne la valeur sous forme de littéral chaîne SPARQL échappé (avec guillemets)"""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return '"' + text.replace("\n", "\\n").replace("\r", "\\r") + '"'
+
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+_INTEGER_TYPES = {XSD + name for name in (
+    "integer", "int", "long", "short", "byte", "nonNegativeInteger", "positiveInteger",
+    "nonPositiveInteger", "negativeInteger", "unsignedLong", "unsignedInt"
+)}
+_DECIMAL_TYPES = {XSD + "decimal", XSD + "double", XSD + "float"}
+
+
+def binding_value(term: Optional[Dict]) -> Any:
+    """Convertit une valeur de résultat SPARQL JSON en valeur Python (int/float pour les nombres)"""
+    if term is None:
+        return None
+    value = term.get("value")
+    datatype = term.get("datatype")
+    try:
+        if datatype in _INTEGER_TYPES:
+            return int(value)
+        if datatype in _DECIMAL_TYPES:
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+
+def sparql_term(term: Dict) -> str:
+    """Réécrit une valeur de résultat SPARQL JSON en terme SPARQL identique (pour VALUES)"""
+    if term["type"] == "uri":
+        return f"<{term['value']}>"
+    if term["type"] not in ("literal", "typed-literal"):
+        raise ValueError(f"Terme non réécrivable en SPARQL: {term['type']}")
+    if "datatype" in term:
+        return f"{sparql_literal(term['value'])}^^<{term['datatype']}>"
+    if "xml:lang" in term:
+        return f"{sparql_literal(term['value'])}@{term['xml:lang']}"
+    return sparql_literal(term["value"])
+
+
+# Début du tableau des lignes dans un document JSON SPARQL ("results": {"bindings": [)
+_BINDINGS_START = re.compile(r'"results"\s*:\s*\{\s*"bindings"\s*:\s*\[')
+
+
+class BindingsDecoder:
+    """
+    Décodeur incrémental des lignes d'un résultat JSON SPARQL.
+
+    Les morceaux de texte reçus de Fuseki sont passés à feed(), qui retourne les
+    lignes complètes déjà disponibles ; seule la ligne en cours de réception
+    reste en mémoire.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_rows = False
+        self._done = False
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk: str) -> List[Dict]:
+        self._buffer += chunk
+        rows = []
+        if not self._in_rows:
+            match = _BINDINGS_START.search(self._buffer)
+            if match is None:
+                return rows
+            self._buffer = self._buffer[match.end():]
+            self._in_rows = True
+        while not self._done:
+            text = self._buffer.lstrip()
+            if text.startswith(","):
+                text = text[1:].lstrip()
+            if text.startswith("]"):
+                self._done = True
+                text = ""
+            elif text:
+                try:
+                    row, end = self._decoder.raw_decode(text)
+                except ValueError:
+                    # Ligne incomplète : attendre le morceau suivant
+                    self._buffer = text
+                    break
+                rows.append(row)
+                text = text[end:]
+            self._buffer = text
+            if not text:
+                break
+        return rows
+
+    def close(self) -> None:
+        """Vérifie que le tableau des lignes a été lu en entier"""
+        if not self._done:
+            raise ValueError("Résultat SPARQL JSON tronqué ou invalide")
+
+
+class SparqlOverloaded(Exception):
+    """Levée quand la file d'attente vers Fuseki est pleine ou trop lente"""
+
+
+@dataclass(frozen=True)
+class SparqlRequest:
+    """Requête SPARQL immuable, propre à chaque appel"""
+    text: str
+    is_update: bool = False
+
+
+class SparqlClient:
+    def __init__(self, endpoint: str = FUSEKI_ENDPOINT, max_in_flight: int = MAX_IN_FLIGHT,
+                 max_queue: int = MAX_QUEUE, queue_timeout: float = QUEUE_TIMEOUT,
+                 timeout: float = 30.0, cache: Optional[SparqlCache] = None, max_streams: int = MAX_STREAMS):
+        self.query_endpoint = f"{endpoint}/query"
+        self.update_endpoint = f"{endpoint}/update"
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_streams = max_streams
+        self._limits = httpx.Limits(
+            max_connections=max_in_flight + max_streams,
+            max_keepalive_connections=max_in_flight
+        )
+        self._timeout = httpx.Timeout(timeout)
+        self.cache = cache if cache is not None else SparqlCache(CACHE_SIZE, CACHE_TTL)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._stream_slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Compteurs exposés par stats()
+        self.in_flight = 0
+        self.streams_in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Créer le pool de connexions au premier appel (un pool par boucle d'événements)"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(limits=self._limits, timeout=self._timeout)
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._stream_slots = asyncio.Semaphore(self.max_streams)
+            self._loop = loop
+        return self._client
+
+    async def _acquire_slot(self, stream: bool = False) -> None:
+        """Attendre une place libre (requêtes ou exports en flux), ou refuser si la file d'attente est saturée"""
+        slots = self._stream_slots if stream else self._slots
+        if slots.locked():
+            if self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise SparqlOverloaded("Fuseki surchargé : file d'attente SPARQL pleine")
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise SparqlOverloaded("Fuseki surchargé : délai d'attente SPARQL dépassé")
+            finally:
+                self.queue_depth -= 1
+        else:
+            await slots.acquire()
+        if stream:
+            self.streams_in_flight += 1
+        else:
+            self.in_flight += 1
+
+    def _release_slot(self, stream: bool = False) -> None:
+        self.completed += 1
+        if stream:
+            self.streams_in_flight -= 1
+            self._stream_slots.release()
+        else:
+            self.in_flight -= 1
+            self._slots.release()
+
+    async def execute(self, request: SparqlRequest) -> Optional[Dict]:
+        """
+        Exécute une requête à travers la passerelle (limite de concurrence + file d'attente).
+
+        Args:
+            request: La requête SPARQL immuable
+
+        Returns:
+            Le résultat JSON pour une requête SELECT/ASK, None pour une mise à jour
+        """
+        client = self._get_client()
+        await self._acquire_slot()
+        try:
+            if request.is_update:
+                response = await client.post(
+                    self.update_endpoint,
+                    data={"update": request.text}
+                )
+                response.raise_for_status()
+                return None
+            response = await client.post(
+                self.query_endpoint,
+                data={"query": request.text},
+                headers={"Accept": "application/sparql-results+json"}
+            )
+            response.raise_for_status()
+            return response.json()
+        finally:
+            self._release_slot()
+
+    async def query(self, query: str, cache: bool = False) -> Dict:
+        """
+        Exécute une requête SELECT/ASK et retourne le document JSON SPARQL.
+
+        Args:
+            query: La requête SPARQL
+            cache: Lire/écrire le résultat dans le cache (lectures fréquentes du catalogue)
+
+        Returns:
+            Le résultat JSON (avec "results"/"bindings" ou "boolean")
+        """
+        if not cache:
+            return await self.execute(SparqlRequest(query))
+        cached = self.cache.get(query)
+        if cached is not None:
+            return cached
+        generation = self.cache.generation
+        result = await self.execute(SparqlRequest(query))
+        self.cache.put(query, result, generation)
+        return result
+
+    async def aggregate(self, query: str, cache: bool = True) -> List[Dict[str, Any]]:
+        """
+        Exécute une requête d'agrégation (COUNT/SUM/AVG, GROUP BY) et retourne
+        ses lignes avec des valeurs Python (voir binding_value).
+
+        Args:
+            query: La requête SPARQL d'agrégation
+            cache: Lire/écrire le résultat dans le cache (tableaux de bord)
+
+        Returns:
+            Une liste de dictionnaires {variable: valeur}, une entrée par groupe
+        """
+        results = await self.query(query, cache=cache)
+        return [
+            {var: binding_value(term) for var, term in binding.items()}
+            for binding in results["results"]["bindings"]
+        ]
+
+    async def stream(self, query: str) -> AsyncIterator[Dict]:
+        """
+        Exécute une requête SELECT et produit ses lignes au fil de la réception,
+        sans construire le document JSON complet (exports volumineux). La
+        réception suit le rythme du lecteur : la place est prise parmi les
+        MAX_STREAMS places des exports, pas parmi celles des requêtes.
+
+        Args:
+            query: La requête SPARQL SELECT
+
+        Yields:
+            Chaque ligne ("binding") du résultat
+        """
+        client = self._get_client()
+        await self._acquire_slot(stream=True)
+        try:
+            async with client.stream(
+                "POST",
+                self.query_endpoint,
+                data={"query": query},
+                headers={"Accept": "application/sparql-results+json"}
+            ) as response:
+                response.raise_for_status()
+                decoder = BindingsDecoder()
+                async for chunk in response.aiter_text():
+                    for row in decoder.feed(chunk):
+                        yield row
+                decoder.close()
+        finally:
+            self._release_slot(stream=True)
+
+    async def update(self, update: str, touches: Optional[Iterable[str]] = None) -> None:
+        """
+        Exécute une requête SPARQL Update (INSERT/DELETE) et invalide le cache.
+
+        Args:
+            update: La requête de mise à jour
+            touches: Termes touchés en plus de ceux présents dans la requête
+                     (ex. ["ns:Produit"] pour un DELETE WHERE { <uri> ?p ?o })
+        """
+        try:
+            await self.execute(SparqlRequest(update, is_update=True))
+        finally:
+            self.cache.invalidate(update, touches)
+
+    def stats(self) -> Dict:
+        """Statistiques de la passerelle (requêtes en cours, profondeur de file, refus)"""
+        return {
+            "in_flight": self.in_flight,
+            "streams_in_flight": self.streams_in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "max_in_flight": self.max_in_flight,
+            "max_streams": self.max_streams,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cache": self.cache.stats()
+        }
+
+    async def aclose(self) -> None:
+        """Fermer les connexions du pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+# Instance partagée par toute l'application
+sparql_client = SparqlClient()
+
+
+# Benchmark avant/après contre un faux Fuseki local (pour développement)
+if __name__ == "__main__":
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from SPARQLWrapper import SPARQLWrapper, JSON
+
+    LATENCE = 0.02  # Latence simulée d'une requête Fuseki (20 ms)
+    NB_REQUETES = 200
+    REPONSE = json.dumps({
+        "head": {"vars": ["produit"]},
+        "results": {"bindings": [{"produit": {"type": "uri", "value": "http://exemple/P1"}}]}
+    }).encode()
+
+    class FauxFuseki(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _repondre(self):
+            longueur = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(longueur)
+            time.sleep(LATENCE)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/sparql-results+json")
+            self.send_header("Content-Length", str(len(REPONSE)))
+            self.end_headers()
+            self.wfile.write(REPONSE)
+
+        do_GET = _repondre
+        do_POST = _repondre
+
+        def log_message(self, *args):
+            pass
+
+    serveur = ThreadingHTTPServer(("127.0.0.1", 0), FauxFuseki)
+    threading.Thread(target=serveur.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{serveur.server_port}/SmartCom"
+    requete = "SELECT ?produit WHERE { ?produit a <http://exemple/Produit> }"
+
+    async def avant():
+        # Ancien code : SPARQLWrapper bloquant appelé dans des coroutines
+        async def une_requete():
+            sparql = SPARQLWrapper(f"{endpoint}/query")
+            sparql.setQuery(requete)
+            sparql.setReturnFormat(JSON)
+            return sparql.query().convert()
+        await asyncio.gather(*(une_requete() for _ in range(NB_REQUETES)))
+
+    async def apres():
+        client = SparqlClient(endpoint)
+        await asyncio.gather(*(client.query(requete) for _ in range(NB_REQUETES)))
+        print(f"Passerelle: {client.stats()}")
+        await client.aclose()
+
+    print(f"=== BENCHMARK SPARQL ({NB_REQUETES} requêtes, latence {LATENCE * 1000:.0f} ms) ===\n")
+    for nom, scenario in [("SPARQLWrapper (bloquant)", avant), ("SparqlClient (asynchrone)", apres)]:
+        debut = time.perf_counter()
+        asyncio.run(scenario())
+        duree = time.perf_counter() - debut
+        print(f"{nom}: {duree:.2f} s, {NB_REQUETES / duree:.0f} requêtes/s")
+    serveur.shutdown()
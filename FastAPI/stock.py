@@ -1,15 +1,14 @@
-from fastapi import APIRouter
-from SPARQLWrapper import SPARQLWrapper, JSON
+from fastapi import APIRouter, Query
 from pydantic import BaseModel, Field
+from sparql_client import sparql_client
+from pagination import Keyset, page_size, MAX_PAGE_SIZE
+from streaming import ndjson_response
+from dashboard_views import dashboard_views
 from typing import Optional
 
 # Créer un router pour le stock
 router = APIRouter()
 
-# Configurations de connexion à Fuseki
-sparql_query = SPARQLWrapper("http://localhost:3030/SmartCom/query")
-sparql_update = SPARQLWrapper("http://localhost:3030/SmartCom/update")
-
 # ==================== MODÈLES PYDANTIC ====================
 
 class StockUpdate(BaseModel):
@@ -21,33 +20,49 @@ class StockMovement(BaseModel):
     quantite_ajoutee: int
     type_mouvement: str  # "entree" ou "sortie"
 
+# Ordre de pagination de la liste du stock (un produit peut avoir plusieurs
+# catégories, marques ou images : une ligne par combinaison, toutes dans la clé)
+STOCK_KEYSET = Keyset(("produit", False), ("categorie", False), ("marque", False), ("image", False),
+                      ("description", False), ("prix", False), ("stock", False))
+
 # ==================== ENDPOINTS ====================
 
 # 1. GET - Récupérer tous les produits avec leur stock
 @router.get("/stock/all")
-async def get_all_stock():
-    """Récupérer la liste de tous les produits avec leur stock"""
-    query = """
-        PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?produit ?description ?prix ?stock ?categorie ?marque ?image
-        WHERE {
-            ?produit a ns:Produit .
-            OPTIONAL { ?produit ns:aDescription ?description . }
-            OPTIONAL { ?produit ns:aPrix ?prix . }
-            OPTIONAL { ?produit ns:aStockDisponible ?stock . }
-            OPTIONAL { ?produit ns:aSousCatégorie ?categorie . }
-            OPTIONAL { ?produit ns:aProduitMarque ?marque . }
-            OPTIONAL { ?produit ns:aImage ?image . }
-        }
-        ORDER BY ?produit
+async def get_all_stock(limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None, stream: bool = False):
     """
-    
-    print("Générée SPARQL Stock Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
+    Récupérer la liste de tous les produits avec leur stock (paginée si limit ou
+    cursor est fourni, en flux NDJSON d'une ligne par produit si stream=true : sans
+    tri, pour que Fuseki envoie les premières lignes sans avoir tout trié)
+    """
+    size = None if stream else page_size(limit, cursor)
     try:
-        results = sparql_query.query().convert()
-        return {"produits": results["results"]["bindings"]}
+        query = f"""
+            PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+            SELECT ?produit ?description ?prix ?stock ?categorie ?marque ?image
+            WHERE {{
+                ?produit a ns:Produit .
+                {STOCK_KEYSET.filter(cursor)}
+                OPTIONAL {{ ?produit ns:aDescription ?description . }}
+                OPTIONAL {{ ?produit ns:aPrix ?prix . }}
+                OPTIONAL {{ ?produit ns:aStockDisponible ?stock . }}
+                OPTIONAL {{ ?produit ns:aSousCatégorie ?categorie . }}
+                OPTIONAL {{ ?produit ns:aProduitMarque ?marque . }}
+                OPTIONAL {{ ?produit ns:aImage ?image . }}
+            }}
+            {STOCK_KEYSET.modifiers(size) if size else "" if stream else "ORDER BY ?produit"}
+        """
+        
+        print("Générée SPARQL Stock Query:", query)
+        if stream:
+            return ndjson_response(sparql_client.stream(query))
+        results = await sparql_client.query(query, cache=True)
+        bindings = results["results"]["bindings"]
+        if size is None:
+            return {"produits": bindings}
+        rows, next_cursor = STOCK_KEYSET.page(bindings, size)
+        return {"produits": rows, "next_cursor": next_cursor}
     except Exception as e:
         return {"error": str(e)}
 
@@ -71,10 +86,8 @@ async def get_stock_alerts():
     """
     
     print("Générée SPARQL Stock Alerts Query:", query)
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
+        results = await sparql_client.query(query)
         bindings = results["results"]["bindings"]
         
         # Séparer en rupture et stock faible
@@ -108,10 +121,9 @@ async def update_stock(stock: StockUpdate):
     """
     
     print("Générée SPARQL Stock Update Query:", update_query)
-    sparql_update.setQuery(update_query)
-    sparql_update.method = "POST"
     try:
-        sparql_update.query()
+        await sparql_client.update(update_query)
+        dashboard_views.product_written(stock.produit_uri, stock=stock.quantite)
         return {"message": "Stock mis à jour avec succès", "nouveau_stock": stock.quantite}
     except Exception as e:
         return {"error": str(e)}
@@ -120,44 +132,38 @@ async def update_stock(stock: StockUpdate):
 @router.get("/stock/statistics")
 async def get_stock_statistics():
     """Récupérer les statistiques globales du stock"""
+    if dashboard_views.ready:
+        return dashboard_views.stock_statistics()
+    
+    # Les statistiques sont calculées par Fuseki : une seule ligne est renvoyée
+    # (un stock ou un prix absent compte pour 0)
     query = """
         PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
-        SELECT ?produit ?prix ?stock
+        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+        SELECT (COUNT(?produit) AS ?total_produits)
+               (SUM(?stockVal) AS ?stock_total)
+               (SUM(IF(?stockVal > 0, 1, 0)) AS ?produits_en_stock)
+               (SUM(IF(?stockVal = 0, 1, 0)) AS ?produits_rupture)
+               (SUM(?stockVal * ?prixVal) AS ?valeur_stock)
         WHERE {
             ?produit a ns:Produit .
             OPTIONAL { ?produit ns:aPrix ?prix . }
             OPTIONAL { ?produit ns:aStockDisponible ?stock . }
+            BIND(COALESCE(xsd:integer(?stock), 0) AS ?stockVal)
+            BIND(COALESCE(xsd:double(?prix), 0.0) AS ?prixVal)
         }
     """
     
-    sparql_query.setQuery(query)
-    sparql_query.setReturnFormat(JSON)
     try:
-        results = sparql_query.query().convert()
-        bindings = results["results"]["bindings"]
-        
-        # Calculer les statistiques
-        total_produits = len(bindings)
-        stocks = [int(p.get("stock", {}).get("value", 0)) for p in bindings]
-        prix = [float(p.get("prix", {}).get("value", 0)) for p in bindings if p.get("prix")]
-        
-        stock_total = sum(stocks)
-        produits_en_stock = len([s for s in stocks if s > 0])
-        produits_rupture = len([s for s in stocks if s == 0])
-        
-        # Valeur totale du stock
-        valeur_stock = 0
-        for p in bindings:
-            stock_val = int(p.get("stock", {}).get("value", 0))
-            prix_val = float(p.get("prix", {}).get("value", 0))
-            valeur_stock += stock_val * prix_val
+        rows = await sparql_client.aggregate(query)
+        stats = rows[0] if rows else {}
         
         return {
-            "total_produits": total_produits,
-            "stock_total": stock_total,
-            "produits_en_stock": produits_en_stock,
-            "produits_rupture": produits_rupture,
-            "valeur_stock": round(valeur_stock, 2)
+            "total_produits": int(stats.get("total_produits") or 0),
+            "stock_total": int(stats.get("stock_total") or 0),
+            "produits_en_stock": int(stats.get("produits_en_stock") or 0),
+            "produits_rupture": int(stats.get("produits_rupture") or 0),
+            "valeur_stock": round(float(stats.get("valeur_stock") or 0), 2)
         }
     except Exception as e:
         return {"error": str(e)}
@@ -0,0 +1,30 @@
+"""
+Réponses NDJSON en flux
+Chaque ligne du résultat est envoyée dès sa réception depuis Fuseki, une
+ligne JSON par enregistrement : la mémoire reste constante quelle que soit
+la taille de l'export et le premier octet part avant la fin de la requête.
+"""
+
+import json
+import logging
+from typing import AsyncIterator, Dict
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def _ndjson_lines(rows: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    try:
+        async for row in rows:
+            yield (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+    except Exception as e:
+        # Le statut HTTP est déjà envoyé : l'erreur est signalée par une dernière ligne
+        logger.error(f"Erreur pendant l'export NDJSON: {e}")
+        yield (json.dumps({"error": str(e)}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def ndjson_response(rows: AsyncIterator[Dict]) -> StreamingResponse:
+    """Réponse HTTP en flux, une ligne JSON par enregistrement"""
+    return StreamingResponse(_ndjson_lines(rows), media_type=NDJSON_MEDIA_TYPE)
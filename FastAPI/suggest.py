@@ -0,0 +1,474 @@
+"""
+Suggestions de saisie (autocomplétion) de la barre de recherche
+Un arbre de préfixes (trie) en mémoire associe chaque début de saisie aux
+meilleures complétions : catégories et marques du vocabulaire du catalogue
+(avec leurs synonymes), produits par nom (chaque mot du nom) et par début de
+description. Les clés sont en minuscules, sans accents ni ponctuation : "refri"
+propose "Réfrigérateurs".
+
+Les suggestions sont classées par popularité : quantités commandées pour un
+produit (1 + unités commandées), somme de celles de ses produits pour une
+catégorie ou une marque. Chaque nœud garde ses k meilleures suggestions, calculées
+à la première lecture et recalculées après une écriture sous ce préfixe. Les
+feuilles regroupent jusqu'à BURST_SIZE clés et ne sont divisées qu'au-delà
+(burst trie), ce qui borne le nombre de nœuds.
+
+Les produits viennent de l'index plein texte (product_search), sans relire
+Fuseki ; les endpoints d'écriture des produits tiennent le trie à jour, et il
+est reconstruit périodiquement (popularité, écritures externes).
+
+Mesure sur un catalogue synthétique : python suggest.py [nombre_de_produits]
+"""
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from entity_matcher import fold
+from sparql_client import SparqlClient, sparql_client
+from product_search import ProductSearch, product_search
+from vocabulary import KINDS, Vocabulary, VocabularySnapshot, vocabulary
+
+logger = logging.getLogger(__name__)
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+# Intervalle de reconstruction du trie (popularité, écritures externes), en secondes
+REBUILD_INTERVAL = float(os.getenv("SUGGEST_REBUILD_INTERVAL", "900"))
+# Nombre de suggestions renvoyées par défaut, et au plus (taille des listes des nœuds)
+SUGGEST_TOP_K = int(os.getenv("SUGGEST_TOP_K", "8"))
+SUGGEST_MAX_K = 20
+
+# Longueur maximale des clés (au-delà, les saisies sont filtrées dans la feuille)
+MAX_DEPTH = 32
+# Nombre de clés d'une feuille au-delà duquel elle est divisée
+BURST_SIZE = 32
+# Produits indexés entre deux retours à la boucle d'événements pendant une reconstruction
+BUILD_CHUNK = 2000
+
+# Type de suggestion par type d'entité du vocabulaire
+VOCABULARY_TYPES = {"categories": "categorie", "marques": "marque"}
+
+ORDERS_QUERY = f"""
+    PREFIX ns: <{NS}>
+    SELECT ?produit (SUM(?quantite) AS ?commandes)
+    WHERE {{
+        ?article a ns:ArticleCommande ;
+                 ns:refereAuProduit ?produit ;
+                 ns:aQuantiteCommandee ?quantite .
+    }}
+    GROUP BY ?produit
+"""
+
+_WORD = re.compile(r"[a-z0-9]+\+*")
+
+
+def normalize(text: str) -> str:
+    """Clé de recherche : minuscules, sans accents, mots séparés par une espace ("Lave-linge" -> "lave linge")"""
+    return " ".join(_WORD.findall(fold(text)))
+
+
+def _label(uri: Optional[str]) -> str:
+    """Nom lisible d'une URI (nom local, "_" remplacés par des espaces)"""
+    if not uri:
+        return ""
+    return uri.rsplit("#", 1)[-1].rsplit("/", 1)[-1].replace("_", " ")
+
+
+def _uri(value: Optional[str]) -> Optional[str]:
+    """Forme complète d'une URI (sans chevrons, préfixe ns: développé)"""
+    if value is None:
+        return None
+    value = value.strip().strip("<>")
+    return NS + value[3:] if value.startswith("ns:") else value
+
+
+class _Node:
+    __slots__ = ("children", "entries", "top")
+
+    def __init__(self):
+        # None : feuille, dont `entries` contient toutes les clés du sous-arbre ;
+        # sinon `entries` ne contient que les clés qui se terminent sur ce nœud
+        self.children: Optional[Dict[str, "_Node"]] = None
+        self.entries: List[Tuple[str, int]] = []
+        # Les SUGGEST_MAX_K meilleures suggestions du sous-arbre (None : à recalculer)
+        self.top: Optional[List[int]] = None
+
+
+class _Trie:
+    """Clés normalisées -> identifiants de suggestions (plusieurs clés par suggestion)"""
+
+    def __init__(self):
+        self.root = _Node()
+        self.suggestions: Dict[int, Dict] = {}            # identifiant -> suggestion
+        self.keys: Dict[int, Set[str]] = {}               # identifiant -> ses clés
+        self.ids: Dict[Tuple[str, str], int] = {}         # (type, URI) -> identifiant
+        self.nodes = 1
+        self._next_id = 0
+
+    # ---------- arbre ----------
+
+    def _path(self, key: str) -> Tuple[_Node, int]:
+        """Descend jusqu'au nœud de la clé en invalidant les listes des nœuds traversés"""
+        node = self.root
+        node.top = None
+        depth = 0
+        while node.children is not None and depth < len(key):
+            child = node.children.get(key[depth])
+            if child is None:
+                child = node.children[key[depth]] = _Node()
+                self.nodes += 1
+            node = child
+            node.top = None
+            depth += 1
+        return node, depth
+
+    def _burst(self, node: _Node, depth: int) -> None:
+        entries, node.entries, node.children = node.entries, [], {}
+        for key, sid in entries:
+            if len(key) == depth:
+                node.entries.append((key, sid))
+            else:
+                child = node.children.get(key[depth])
+                if child is None:
+                    child = node.children[key[depth]] = _Node()
+                    self.nodes += 1
+                child.entries.append((key, sid))
+        for child in node.children.values():
+            if len(child.entries) > BURST_SIZE and depth + 1 < MAX_DEPTH:
+                self._burst(child, depth + 1)
+
+    def _insert(self, key: str, sid: int) -> None:
+        node, depth = self._path(key)
+        node.entries.append((key, sid))
+        if node.children is None and len(node.entries) > BURST_SIZE and depth < MAX_DEPTH:
+            self._burst(node, depth)
+
+    def _remove(self, key: str, sid: int) -> None:
+        node, _ = self._path(key)
+        try:
+            node.entries.remove((key, sid))
+        except ValueError:
+            pass
+
+    def _rank(self, sids: Iterable[int]) -> List[int]:
+        suggestions = self.suggestions
+        unique = dict.fromkeys(sids)
+        return sorted(unique, key=lambda sid: (-suggestions[sid]["weight"], suggestions[sid]["text"]))[:SUGGEST_MAX_K]
+
+    def _top(self, node: _Node) -> List[int]:
+        if node.top is None:
+            candidates = [sid for _, sid in node.entries]
+            if node.children is not None:
+                for child in node.children.values():
+                    candidates.extend(self._top(child))
+            node.top = self._rank(candidates)
+        return node.top
+
+    def search(self, prefix: str, k: int) -> List[Dict]:
+        node, depth = self.root, 0
+        while depth < len(prefix):
+            if node.children is None:
+                # Feuille : ses clés partagent le préfixe parcouru, on filtre le reste
+                ranked = self._rank(sid for key, sid in node.entries if key.startswith(prefix))
+                return [self.suggestions[sid] for sid in ranked[:k]]
+            node = node.children.get(prefix[depth])
+            if node is None:
+                return []
+            depth += 1
+        return [self.suggestions[sid] for sid in self._top(node)[:k]]
+
+    # ---------- suggestions ----------
+
+    def put(self, kind: str, uri: str, text: str, keys: Iterable[str], weight: float) -> None:
+        """Ajoute ou remplace une suggestion et ses clés"""
+        sid = self.ids.get((kind, uri))
+        if sid is None:
+            sid = self.ids[(kind, uri)] = self._next_id
+            self._next_id += 1
+            old_keys: Set[str] = set()
+        else:
+            old_keys = self.keys[sid]
+        new_keys = {key[:MAX_DEPTH] for key in keys if key}
+        self.suggestions[sid] = {"text": text, "type": kind, "uri": uri, "weight": weight}
+        self.keys[sid] = new_keys
+        for key in old_keys - new_keys:
+            self._remove(key, sid)
+        for key in new_keys - old_keys:
+            self._insert(key, sid)
+        # Le poids ou le texte a pu changer : les listes des clés conservées sont à recalculer
+        for key in old_keys & new_keys:
+            self._path(key)
+
+    def delete(self, kind: str, uri: str) -> None:
+        sid = self.ids.pop((kind, uri), None)
+        if sid is None:
+            return
+        for key in self.keys.pop(sid):
+            self._remove(key, sid)
+        del self.suggestions[sid]
+
+    def reweight(self, kind: str, uri: str, weight: float) -> None:
+        sid = self.ids.get((kind, uri))
+        if sid is None or self.suggestions[sid]["weight"] == weight:
+            return
+        self.suggestions[sid]["weight"] = weight
+        for key in self.keys[sid]:
+            self._path(key)
+
+
+class _Catalog:
+    """Trie et popularités (reconstruit d'un bloc, puis mis à jour par les écritures)"""
+
+    def __init__(self, orders: Dict[str, float]):
+        self.trie = _Trie()
+        self.orders = orders                                  # produit -> unités commandées
+        # Produit -> (catégorie, marque, poids) ; catégorie ou marque -> somme des poids
+        self.products: Dict[str, Tuple[Optional[str], Optional[str], float]] = {}
+        self.totals: Dict[str, Dict[str, float]] = {kind: {} for kind in KINDS}
+        self.vocabulary_version: Optional[int] = None
+
+    def _add_total(self, kind: str, uri: Optional[str], delta: float) -> None:
+        if uri is None:
+            return
+        totals = self.totals[kind]
+        totals[uri] = totals.get(uri, 0.0) + delta
+        self.trie.reweight(VOCABULARY_TYPES[kind], uri, totals[uri])
+
+    def put_product(self, uri: str, doc: Dict) -> None:
+        self.remove_product(uri)
+        name = _label(uri)
+        categorie = doc.get("categorie", {}).get("value")
+        marque = doc.get("marque", {}).get("value")
+        weight = 1.0 + self.orders.get(uri, 0.0)
+        # Le nom à partir de chacun de ses mots, et la description depuis son début
+        words = normalize(name).split(" ")
+        keys = [" ".join(words[i:]) for i in range(len(words))]
+        description = doc.get("description", {}).get("value")
+        if description:
+            keys.append(normalize(description))
+        self.trie.put("produit", uri, name, keys, weight)
+        self.products[uri] = (categorie, marque, weight)
+        self._add_total("categories", categorie, weight)
+        self._add_total("marques", marque, weight)
+
+    def remove_product(self, uri: str) -> None:
+        old = self.products.pop(uri, None)
+        if old is None:
+            return
+        categorie, marque, weight = old
+        self.trie.delete("produit", uri)
+        self._add_total("categories", categorie, -weight)
+        self._add_total("marques", marque, -weight)
+
+    def sync_vocabulary(self, snapshot: VocabularySnapshot) -> None:
+        """Catégories et marques d'un instantané du vocabulaire (sans effet si déjà synchronisé)"""
+        if snapshot.version == self.vocabulary_version:
+            return
+        for kind in KINDS:
+            suggestion_type = VOCABULARY_TYPES[kind]
+            current = set(snapshot.uris[kind].values())
+            for existing_type, uri in list(self.trie.ids):
+                if existing_type == suggestion_type and uri not in current:
+                    self.trie.delete(suggestion_type, uri)
+            for key, uri in snapshot.uris[kind].items():
+                keys = [normalize(variant) for variant in snapshot.variants[kind][key]]
+                self.trie.put(suggestion_type, uri, _label(uri), keys, self.totals[kind].get(uri, 0.0))
+        self.vocabulary_version = snapshot.version
+
+
+class Suggester:
+    def __init__(self, client: SparqlClient = sparql_client, products: ProductSearch = product_search,
+                 vocab: Vocabulary = vocabulary, rebuild_interval: float = REBUILD_INTERVAL):
+        self.client = client
+        self.products = products
+        self.vocabulary = vocab
+        self.rebuild_interval = rebuild_interval
+        self.ready = False
+        self._catalog = _Catalog({})
+        # Produits écrits pendant une reconstruction en cours (URI -> propriétés, None si supprimé)
+        self._dirty: Optional[Dict[str, Optional[Dict]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lookups = 0
+        self.lookup_time = 0.0
+        self.rebuilds = 0
+        self.last_rebuild: Optional[float] = None
+
+    # ==================== CONSTRUCTION ====================
+
+    async def rebuild(self) -> int:
+        """
+        Reconstruit le trie : popularité depuis Fuseki, produits depuis l'index plein
+        texte, catégories et marques depuis le vocabulaire.
+
+        Returns:
+            Le nombre de suggestions
+        """
+        self._dirty = {}
+        try:
+            rows = await self.client.aggregate(ORDERS_QUERY, cache=False)
+            catalog = _Catalog({row["produit"]: float(row.get("commandes") or 0)
+                                for row in rows if row.get("produit")})
+            documents = self.products.documents()
+            # Par tranches, pour ne pas bloquer la boucle d'événements
+            for start in range(0, len(documents), BUILD_CHUNK):
+                for uri, doc in documents[start:start + BUILD_CHUNK]:
+                    catalog.put_product(uri, doc)
+                await asyncio.sleep(0)
+            # Les écritures appliquées pendant la construction priment sur l'état lu
+            for uri, doc in self._dirty.items():
+                if doc is None:
+                    catalog.remove_product(uri)
+                else:
+                    catalog.put_product(uri, doc)
+            catalog.sync_vocabulary(self.vocabulary.snapshot)
+        finally:
+            self._dirty = None
+        self._catalog = catalog
+        self.ready = True
+        self.rebuilds += 1
+        self.last_rebuild = time.time()
+        return len(catalog.trie.suggestions)
+
+    async def _rebuild_periodically(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Erreur de reconstruction des suggestions: {e}")
+
+    async def start(self):
+        """Construit le trie (au démarrage, après l'index des produits) et lance sa reconstruction périodique"""
+        try:
+            count = await self.rebuild()
+            logger.info(f"✅ Suggestions de saisie: {count} suggestions, {self._catalog.trie.nodes} nœuds")
+        except Exception as e:
+            logger.error(f"Construction des suggestions impossible: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._rebuild_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # ==================== ÉCRITURES (appelées après une écriture réussie) ====================
+
+    def product_written(self, produit_uri: str) -> None:
+        """
+        Met à jour les suggestions d'un produit ajouté ou modifié, d'après ses
+        propriétés indexées (à appeler après product_search.product_written).
+
+        Args:
+            produit_uri: L'URI du produit
+        """
+        doc = self.products.document(produit_uri)
+        if doc is None:
+            return
+        uri = _uri(produit_uri)
+        self._catalog.put_product(uri, doc)
+        if self._dirty is not None:
+            self._dirty[uri] = doc
+
+    def product_deleted(self, produit_uri: str) -> None:
+        uri = _uri(produit_uri)
+        self._catalog.remove_product(uri)
+        if self._dirty is not None:
+            self._dirty[uri] = None
+
+    # ==================== SUGGESTIONS ====================
+
+    def suggest(self, text: str, k: int = SUGGEST_TOP_K) -> List[Dict]:
+        """
+        Les meilleures complétions d'une saisie.
+
+        Args:
+            text: Le début de saisie (casse, accents et ponctuation ignorés)
+            k: Le nombre maximal de suggestions (au plus SUGGEST_MAX_K)
+
+        Returns:
+            Les suggestions {"text", "type" ("categorie", "marque" ou "produit"), "uri",
+            "weight"}, de la plus populaire à la moins populaire
+        """
+        debut = time.perf_counter()
+        catalog = self._catalog
+        catalog.sync_vocabulary(self.vocabulary.snapshot)
+        prefix = normalize(text)
+        # Une saisie terminée par une espace attend le mot suivant
+        if prefix and text[-1:].isspace():
+            prefix += " "
+        prefix = prefix[:MAX_DEPTH]
+        suggestions = catalog.trie.search(prefix, min(k, SUGGEST_MAX_K)) if prefix else []
+        self.lookups += 1
+        self.lookup_time += time.perf_counter() - debut
+        return [dict(suggestion) for suggestion in suggestions]
+
+    def stats(self) -> Dict:
+        trie = self._catalog.trie
+        return {
+            "ready": self.ready,
+            "suggestions": len(trie.suggestions),
+            "nodes": trie.nodes,
+            "vocabulary_version": self._catalog.vocabulary_version,
+            "lookups": self.lookups,
+            "avg_lookup_ms": round(self.lookup_time / self.lookups * 1000, 3) if self.lookups else 0.0,
+            "rebuild_interval": self.rebuild_interval,
+            "rebuilds": self.rebuilds,
+            "last_rebuild": self.last_rebuild
+        }
+
+
+# Instance partagée par main et le router des produits
+suggester = Suggester()
+
+
+# Mesure sur un catalogue synthétique (pour développement)
+if __name__ == "__main__":
+    import random
+    import sys
+
+    random.seed(0)
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    categories = [NS + c for c in ("Lave-linge", "Lave-vaisselle", "Réfrigérateurs", "Aspirateurs", "Micro-ondes")]
+    marques = [NS + m for m in ("Samsung", "LG", "Beko", "Bosch", "Whirlpool", "Haier", "Candy")]
+    modeles = "lave linge hublot frigo combine aspirateur balai four micro ondes seche cave vin plaque".split()
+    mots = "inox silencieux blanc noir encastrable pose libre vapeur compact connecte induction".split()
+    uris = [NS + "_".join(random.choices(modeles, k=2)) + f"_{i}" for i in range(total)]
+    catalog = _Catalog({uri: float(random.randint(0, 500)) for uri in uris[::3]})
+    debut = time.perf_counter()
+    for uri in uris:
+        catalog.put_product(uri, {
+            "description": {"type": "literal", "value": " ".join(random.choices(mots, k=random.randint(4, 12)))},
+            "categorie": {"type": "uri", "value": random.choice(categories)},
+            "marque": {"type": "uri", "value": random.choice(marques)}
+        })
+    catalog.sync_vocabulary(vocabulary.snapshot)
+    trie = catalog.trie
+    print(f"=== {len(trie.suggestions)} suggestions en {time.perf_counter() - debut:.1f}s, {trie.nodes} nœuds ===")
+
+    prefixes = ["l", "la", "lave", "lave l", "frigo c", "ref", "sam", "bo", "inox", "micro o", "zz"]
+    for prefix in prefixes:
+        trie.search(prefix, SUGGEST_TOP_K)
+        debut = time.perf_counter()
+        for _ in range(200):
+            top = trie.search(prefix, SUGGEST_TOP_K)
+        duree = (time.perf_counter() - debut) / 200 * 1000
+        print(f"{prefix!r}: {[s['text'] for s in top[:3]]} en {duree:.3f} ms")
+
+    # Première lecture après une écriture (listes du préfixe à recalculer)
+    debut = time.perf_counter()
+    for i in range(200):
+        catalog.put_product(f"{NS}lave_linge_{i}", {"description": {"type": "literal", "value": "lave linge"}})
+        trie.search("lave", SUGGEST_TOP_K)
+    print(f"écriture + lecture 'lave': {(time.perf_counter() - debut) / 200 * 1000:.3f} ms")
+
+    # Mêmes résultats qu'un parcours de toutes les clés
+    for prefix in prefixes:
+        attendus = sorted({sid for sid, keys in trie.keys.items() if any(key.startswith(prefix) for key in keys)},
+                          key=lambda sid: (-trie.suggestions[sid]["weight"], trie.suggestions[sid]["text"]))
+        obtenus = trie.search(prefix, SUGGEST_MAX_K)
+        assert [trie.suggestions[sid] for sid in attendus[:SUGGEST_MAX_K]] == obtenus, prefix
+    print("Classement identique au parcours de toutes les clés")
@@ -0,0 +1,287 @@
+"""
+Vocabulaire du catalogue (catégories et marques) pour la recherche en langage naturel
+Les entités reconnues dans les questions viennent de deux sources :
+    - les valeurs de ns:aSousCatégorie et ns:aProduitMarque présentes dans Fuseki ;
+    - data/synonyms.json : variantes d'écriture par entité (nom local de l'URI).
+
+Le vocabulaire est un instantané immuable (VocabularySnapshot) : URIs, variantes
+et EntityMatcher compilés. Il est reconstruit en arrière-plan quand le store ou
+le fichier de synonymes change, ou dès qu'une écriture de produit cite une URI
+inconnue, puis remplacé d'un coup ; chaque remplacement incrémente sa version.
+Les lecteurs prennent `vocabulary.snapshot` une fois par question.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from unidecode import unidecode
+from entity_matcher import EntityMatcher
+from sparql_client import SparqlClient, sparql_client
+
+logger = logging.getLogger(__name__)
+
+NS = "http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#"
+
+# Intervalle de rafraîchissement depuis Fuseki et le fichier de synonymes (secondes)
+REFRESH_INTERVAL = float(os.getenv("VOCABULARY_REFRESH_INTERVAL", "60"))
+SYNONYMS_PATH = os.getenv("VOCABULARY_SYNONYMS_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "synonyms.json")
+
+# Types d'entités du vocabulaire (clés de synonyms.json)
+KINDS = ("categories", "marques")
+
+TERMS_QUERY = """
+    PREFIX ns: <http://www.semanticweb.org/asus/ontologies/2025/9/untitled-ontology-10#>
+    SELECT DISTINCT ?type ?valeur
+    WHERE {
+        { ?produit ns:aSousCatégorie ?valeur . BIND("categories" AS ?type) }
+        UNION
+        { ?produit ns:aProduitMarque ?valeur . BIND("marques" AS ?type) }
+        FILTER (isIRI(?valeur))
+    }
+"""
+
+
+def _full_uri(value: str) -> str:
+    """Forme complète d'une URI (sans chevrons, préfixe ns: ou nom local développé)"""
+    value = value.strip().strip("<>")
+    if value.startswith("ns:"):
+        return NS + value[3:]
+    return value if ":" in value else NS + value
+
+
+def entity_key(uri: str) -> str:
+    """Clé d'une entité : son nom local en minuscules (ex. ...#Lave-linge -> lave-linge)"""
+    return uri.rsplit("#", 1)[-1].rsplit("/", 1)[-1].replace("_", " ").lower()
+
+
+def _variants(key: str, synonyms: Iterable[str]) -> List[str]:
+    """La clé, ses formes sans tiret, les synonymes déclarés, et chacune sans accent"""
+    forms = [key, key.replace("-", " "), key.replace("-", ""), *synonyms]
+    forms += [unidecode(form) for form in forms]
+    return list(dict.fromkeys(form.lower() for form in forms if form))
+
+
+def _entity_filter(predicate: str, variable: str, uris: List[str]) -> Optional[str]:
+    """Motif SPARQL d'un type d'entité : URI directe si une seule, VALUES si plusieurs"""
+    if len(uris) == 1:
+        return f"        ?produit {predicate} <{uris[0]}> ."
+    if uris:
+        return (f"        VALUES ?{variable} {{ {' '.join(f'<{uri}>' for uri in uris)} }}\n"
+                f"        ?produit {predicate} ?{variable} .")
+    return None
+
+
+def entity_filters(entites: Dict) -> List[str]:
+    """
+    Motifs SPARQL des catégories et marques extraites d'une question (recherche
+    de produits et recherche de stock).
+
+    Args:
+        entites: Les entités extraites (categorie_uris / marque_uris, ou à défaut
+                 categorie_uri / marque_uri)
+
+    Returns:
+        Les motifs à insérer dans le WHERE (VALUES si la question en cite plusieurs)
+    """
+    filters = []
+    for kind, predicate, variable in (("categorie", "ns:aSousCatégorie", "categorieFiltre"),
+                                      ("marque", "ns:aProduitMarque", "marqueFiltre")):
+        uris = entites.get(f"{kind}_uris") or ([entites[f"{kind}_uri"]] if entites.get(f"{kind}_uri") else [])
+        pattern = _entity_filter(predicate, variable, uris)
+        if pattern:
+            filters.append(pattern)
+    return filters
+
+
+class VocabularySnapshot:
+    """Vocabulaire figé : clés, URIs, variantes et matchers compilés (ne pas modifier)"""
+
+    def __init__(self, version: int, uris: Dict[str, Dict[str, str]], variants: Dict[str, Dict[str, List[str]]],
+                 previous: Optional["VocabularySnapshot"] = None):
+        self.version = version
+        self.uris = uris
+        self.variants = variants
+        self.matchers: Dict[str, EntityMatcher] = {}
+        for kind in KINDS:
+            # Un type inchangé garde son matcher déjà compilé
+            if previous is not None and previous.variants.get(kind) == variants[kind]:
+                self.matchers[kind] = previous.matchers[kind]
+            else:
+                self.matchers[kind] = EntityMatcher(variants[kind])
+
+    def find_all(self, kind: str, text: str) -> List[str]:
+        """Les clés des entités d'un type présentes dans le texte, dans l'ordre"""
+        return self.matchers[kind].find_all(text)
+
+    def strip(self, text: str) -> str:
+        """Le texte sans les catégories ni les marques qu'il cite"""
+        for kind in KINDS:
+            text = self.matchers[kind].strip(text)
+        return text
+
+    def uri(self, kind: str, key: str) -> Optional[str]:
+        return self.uris[kind].get(key)
+
+    def lookup(self, name: str) -> Optional[str]:
+        """URI d'une catégorie ou d'une marque d'après son nom (ou une variante)"""
+        for kind in KINDS:
+            key = self.matchers[kind].find(name)
+            if key is not None:
+                return self.uris[kind][key]
+        return None
+
+
+class Vocabulary:
+    def __init__(self, client: SparqlClient = sparql_client, synonyms_path: str = SYNONYMS_PATH,
+                 refresh_interval: float = REFRESH_INTERVAL):
+        self.client = client
+        self.synonyms_path = synonyms_path
+        self.refresh_interval = refresh_interval
+        # URI -> synonymes déclarés, par type
+        self._synonyms: Dict[str, Dict[str, List[str]]] = {kind: {} for kind in KINDS}
+        self._synonyms_mtime: Optional[float] = None
+        # URIs présentes dans le store (dernière lecture + écritures observées depuis)
+        self._store: Dict[str, Set[str]] = {kind: set() for kind in KINDS}
+        # URIs observées pendant une lecture du store en cours
+        self._observed: Optional[Dict[str, Set[str]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.last_refresh: Optional[float] = None
+        self._load_synonyms()
+        self.snapshot = self._build(1)
+
+    # ==================== CONSTRUCTION ====================
+
+    def _load_synonyms(self) -> bool:
+        """Relit le fichier de synonymes s'il a changé (True si relu)"""
+        try:
+            mtime = os.path.getmtime(self.synonyms_path)
+        except OSError:
+            mtime = None
+        if mtime == self._synonyms_mtime:
+            return False
+        synonyms: Dict[str, Dict[str, List[str]]] = {kind: {} for kind in KINDS}
+        if mtime is not None:
+            try:
+                with open(self.synonyms_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for kind in KINDS:
+                    for name, variants in data.get(kind, {}).items():
+                        synonyms[kind][_full_uri(name)] = list(variants)
+            except (OSError, ValueError, AttributeError) as e:
+                logger.error(f"Fichier de synonymes {self.synonyms_path} illisible: {e}")
+                return False
+        self._synonyms, self._synonyms_mtime = synonyms, mtime
+        return True
+
+    def _build(self, version: int) -> VocabularySnapshot:
+        uris: Dict[str, Dict[str, str]] = {}
+        variants: Dict[str, Dict[str, List[str]]] = {}
+        for kind in KINDS:
+            uris[kind], variants[kind] = {}, {}
+            for uri in sorted(set(self._synonyms[kind]) | self._store[kind]):
+                key = entity_key(uri)
+                if key in uris[kind]:
+                    continue
+                uris[kind][key] = uri
+                variants[kind][key] = _variants(key, self._synonyms[kind].get(uri, []))
+        return VocabularySnapshot(version, uris, variants, previous=getattr(self, "snapshot", None))
+
+    def _swap(self) -> None:
+        self.snapshot = self._build(self.snapshot.version + 1)
+        logger.info(f"✅ Vocabulaire v{self.snapshot.version}: "
+                    + ", ".join(f"{len(self.snapshot.uris[kind])} {kind}" for kind in KINDS))
+
+    # ==================== RAFRAÎCHISSEMENT ====================
+
+    async def refresh(self) -> bool:
+        """
+        Relit les catégories et marques du store et le fichier de synonymes.
+
+        Returns:
+            True si le vocabulaire a changé (nouvel instantané)
+        """
+        self._observed = {kind: set() for kind in KINDS}
+        try:
+            results = await self.client.query(TERMS_QUERY)
+            store: Dict[str, Set[str]] = {kind: set() for kind in KINDS}
+            for row in results["results"]["bindings"]:
+                kind = row["type"]["value"]
+                if kind in store:
+                    store[kind].add(row["valeur"]["value"])
+            # Les écritures observées pendant la lecture sont plus récentes que celle-ci
+            for kind in KINDS:
+                store[kind] |= self._observed[kind]
+        finally:
+            self._observed = None
+        changed = self._load_synonyms() | (store != self._store)
+        self._store = store
+        if changed:
+            self._swap()
+        self.refreshes += 1
+        self.last_refresh = time.time()
+        return changed
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Erreur de rafraîchissement du vocabulaire: {e}")
+
+    async def start(self):
+        """Charge le vocabulaire du store (au démarrage) et lance le rafraîchissement périodique"""
+        try:
+            await self.refresh()
+        except Exception as e:
+            # Le vocabulaire du fichier de synonymes reste utilisable
+            logger.error(f"Chargement du vocabulaire depuis Fuseki impossible: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def observe(self, categorie_uri: Optional[str] = None, marque_uri: Optional[str] = None) -> None:
+        """
+        Ajoute au vocabulaire les catégories et marques d'un produit écrit
+        (appelé après une écriture réussie ; sans effet si elles sont déjà connues).
+
+        Args:
+            categorie_uri: L'URI de la catégorie écrite (None : inchangée)
+            marque_uri: L'URI de la marque écrite (None : inchangée)
+        """
+        changed = False
+        for kind, value in (("categories", categorie_uri), ("marques", marque_uri)):
+            if not value:
+                continue
+            uri = _full_uri(value)
+            if self._observed is not None:
+                self._observed[kind].add(uri)
+            if uri not in self._store[kind]:
+                self._store[kind].add(uri)
+                changed = changed or entity_key(uri) not in self.snapshot.uris[kind]
+        if changed:
+            self._swap()
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.snapshot.version,
+            "categories": len(self.snapshot.uris["categories"]),
+            "marques": len(self.snapshot.uris["marques"]),
+            "synonyms_path": self.synonyms_path,
+            "refresh_interval": self.refresh_interval,
+            "refreshes": self.refreshes,
+            "last_refresh": self.last_refresh
+        }
+
+
+# Instance partagée par main et les modules de recherche
+vocabulary = Vocabulary()